@@ -0,0 +1,155 @@
+"""Regional and income-group aggregates of every indicator, precomputed after ingest.
+
+For each (indicator, year, group) the table stores the number of countries
+with a value, their simple mean and median, and the mean weighted by
+population (SP.POP.TOTL of the same country and year).
+"""
+import numpy as np
+from django.db import transaction
+
+from .comparison import PairedValues, empty_pairs
+from .models import GroupAggregate, Indicator, StatisticValue
+
+POPULATION_INDICATOR = 'SP.POP.TOTL'
+
+# Group type -> Country field holding the group code
+GROUP_FIELDS = {
+    GroupAggregate.REGION: 'country__region',
+    GroupAggregate.INCOME: 'country__income_level',
+}
+
+AGGREGATE_STATISTICS = ('weighted_mean', 'mean', 'median')
+
+
+def expand_touched(touched):
+    """Add every indicator for the years whose population changed, since their weights changed"""
+    touched = {code: set(years) for code, years in touched.items() if years}
+    population_years = touched.get(POPULATION_INDICATOR)
+    if population_years:
+        for code in Indicator.objects.values_list('code', flat=True):
+            touched.setdefault(code, set()).update(population_years)
+    return touched
+
+
+def summarize(rows, population):
+    """Aggregate rows of (country, region, income level, year, value) into GroupAggregate kwargs.
+
+    ``population`` maps (country, year) to population. CPU only.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=['country', 'region', 'income', 'year', 'value'])
+    if df.empty:
+        return []
+    df['weight'] = [population.get(key, np.nan) for key in zip(df['country'], df['year'])]
+    df['weighted'] = df['value'] * df['weight']
+
+    results = []
+    for group_type, column in ((GroupAggregate.REGION, 'region'), (GroupAggregate.INCOME, 'income')):
+        grouped = df[df[column] != ''].groupby([column, 'year'])
+        summary = pd.DataFrame({
+            'count': grouped['value'].count(),
+            'mean': grouped['value'].mean(),
+            'median': grouped['value'].median(),
+            # NaN weights drop out of both sums
+            'weighted_sum': grouped['weighted'].sum(min_count=1),
+            'weight_sum': grouped['weight'].sum(min_count=1),
+            'weighted_count': grouped['weight'].count(),
+        })
+        summary['weighted_mean'] = summary['weighted_sum'] / summary['weight_sum']
+        for (group, year), row in summary.iterrows():
+            weighted_mean = row['weighted_mean']
+            results.append({
+                'group_type': group_type,
+                'group': group,
+                'year': int(year),
+                'count': int(row['count']),
+                'weighted_count': int(row['weighted_count']),
+                'mean': float(row['mean']),
+                'median': float(row['median']),
+                'weighted_mean': None if pd.isna(weighted_mean) or not np.isfinite(weighted_mean) else float(weighted_mean),
+            })
+    return results
+
+
+def compute_aggregates(touched=None, batch_size=1000):
+    """Recompute aggregates for ``touched`` ({indicator code: years}), or everything if None.
+
+    Runs one query per indicator plus one for population, and replaces the
+    stored rows of exactly those indicator-years. Returns the number of
+    aggregate rows written.
+    """
+    if touched is None:
+        touched = {
+            code: None for code in Indicator.objects.values_list('code', flat=True)
+        }
+        all_years = True
+    else:
+        touched = expand_touched(touched)
+        all_years = False
+    if not touched:
+        return 0
+
+    population_rows = StatisticValue.objects.filter(indicator_id=POPULATION_INDICATOR, value__isnull=False)
+    if not all_years:
+        population_rows = population_rows.filter(year__in=sorted(set().union(*touched.values())))
+    population = {
+        (country, year): value
+        for country, year, value in population_rows.values_list('country_id', 'year', 'value')
+    }
+
+    written = 0
+    with transaction.atomic():
+        for code, years in touched.items():
+            rows = StatisticValue.objects.filter(indicator_id=code, value__isnull=False)
+            existing = GroupAggregate.objects.filter(indicator_id=code)
+            if years is not None:
+                rows = rows.filter(year__in=sorted(years))
+                existing = existing.filter(year__in=sorted(years))
+            aggregates = summarize(
+                list(rows.values_list('country_id', *GROUP_FIELDS.values(), 'year', 'value')),
+                population
+            )
+            existing.delete()
+            GroupAggregate.objects.bulk_create(
+                [GroupAggregate(indicator_id=code, **aggregate) for aggregate in aggregates],
+                batch_size=batch_size
+            )
+            written += len(aggregates)
+    return written
+
+
+def pair_aggregate_values(indicator1, indicator2, group_type, statistic='weighted_mean', groups=None):
+    """Align two indicators' aggregates on (group, year) as PairedValues, in one query.
+
+    Groups take the place of countries: their code is used as both code and name.
+    """
+    import pandas as pd
+
+    if statistic not in AGGREGATE_STATISTICS:
+        raise ValueError(f"Unknown aggregate statistic '{statistic}'")
+    queryset = GroupAggregate.objects.filter(
+        group_type=group_type,
+        indicator_id__in=[indicator1, indicator2],
+        **{f'{statistic}__isnull': False}
+    )
+    if groups:
+        queryset = queryset.filter(group__in=groups)
+    df = pd.DataFrame.from_records(
+        list(queryset.values_list('group', 'year', 'indicator_id', statistic)),
+        columns=['group', 'year', 'indicator', 'value']
+    )
+    if df.empty:
+        return empty_pairs()
+    wide = df.pivot_table(index=['group', 'year'], columns='indicator', values='value', aggfunc='first')
+    if indicator1 not in wide.columns or indicator2 not in wide.columns:
+        return empty_pairs()
+    wide = wide[[indicator1, indicator2]].dropna().sort_index()
+    groups = wide.index.get_level_values('group').to_numpy(dtype=object)
+    return PairedValues(
+        country_codes=groups,
+        country_names=groups,
+        years=wide.index.get_level_values('year').to_numpy(dtype=np.int64),
+        values1=wide.iloc[:, 0].to_numpy(dtype=np.float64),
+        values2=wide.iloc[:, 1].to_numpy(dtype=np.float64),
+    )
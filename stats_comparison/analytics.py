@@ -0,0 +1,190 @@
+"""Filtering, projection and aggregation of statistic values for the query API.
+
+Each request becomes one SQL query: plain rows are a keyset page over the
+(country, indicator, year) index, and grouped results are a single
+values().annotate() so the database does the reduction. Country and
+indicator names are attached afterwards from the metadata document cached
+per data version, instead of joining Country and Indicator on every row.
+"""
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .queries import KEYSET_ORDER, decode_cursor, encode_cursor, int_param, list_param
+from .models import StatisticValue
+
+# Columns rows can be projected to, in output order
+QUERY_FIELDS = ('country', 'country_code', 'region', 'indicator', 'indicator_code', 'year', 'value')
+
+# group_by name -> ORM field grouped on
+GROUP_BY_FIELDS = {
+    'country': 'country_id',
+    'region': 'country__region',
+    'indicator': 'indicator_id',
+    'year': 'year',
+}
+
+# agg name -> aggregate over value; nulls are ignored, so count is the number of values present
+AGGREGATE_FUNCTIONS = {
+    'mean': Avg,
+    'sum': Sum,
+    'min': Min,
+    'max': Max,
+    'count': Count,
+}
+
+# The latest non-null value of each country, with the year it is from
+LATEST = 'latest'
+
+QUERY_AGGREGATES = (*AGGREGATE_FUNCTIONS, LATEST)
+
+
+def _choices(params, name, allowed):
+    values = list(dict.fromkeys(list_param(params, name)))
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ValueError(f"'{name}' must be one or more of {', '.join(allowed)}, not {', '.join(unknown)}")
+    return values
+
+
+def parse_query(params, max_page_size=10000, default_page_size=1000):
+    """Validated query specification from request parameters, raising ValueError if malformed"""
+    spec = {
+        'indicators': list_param(params, 'indicator'),
+        'countries': list_param(params, 'country'),
+        'regions': list_param(params, 'region'),
+        'start_year': int_param(params, 'start_year'),
+        'end_year': int_param(params, 'end_year'),
+        'fields': _choices(params, 'fields', QUERY_FIELDS) or list(QUERY_FIELDS),
+        'group_by': _choices(params, 'group_by', tuple(GROUP_BY_FIELDS)),
+        'aggregates': _choices(params, 'agg', QUERY_AGGREGATES),
+        'page_size': int_param(params, 'page_size', default=default_page_size, minimum=1, maximum=max_page_size),
+        'cursor': params.get('cursor') or None,
+    }
+    if spec['group_by'] and not spec['aggregates']:
+        raise ValueError("'group_by' needs at least one 'agg'")
+    if spec['aggregates'] and params.get('fields'):
+        raise ValueError("'fields' selects columns of plain rows and cannot be combined with 'agg'")
+    if spec['aggregates'] and spec['cursor']:
+        raise ValueError("Aggregated results are not paginated; 'cursor' cannot be combined with 'agg'")
+    if LATEST in spec['aggregates']:
+        if 'country' not in spec['group_by']:
+            raise ValueError("'agg=latest' is per country and needs 'country' in 'group_by'")
+        if 'year' in spec['group_by']:
+            raise ValueError("'agg=latest' cannot be grouped by 'year'")
+    if spec['cursor']:
+        decode_cursor(spec['cursor'])
+    return spec
+
+
+def lookup_maps(metadata):
+    """Name lookups from a metadata document: countries {code: (name, region)}, indicators {code: name}"""
+    return {
+        'countries': {code: (name, region) for code, name, region in metadata['countries']},
+        'indicators': dict(metadata['indicators']),
+    }
+
+
+def filtered_values(spec, maps):
+    """StatisticValue queryset of the spec's filters, without joining Country"""
+    queryset = StatisticValue.objects.all()
+    if spec['indicators']:
+        queryset = queryset.filter(indicator_id__in=spec['indicators'])
+    countries = set(spec['countries'])
+    if spec['regions']:
+        regions = set(spec['regions'])
+        in_regions = {code for code, (_, region) in maps['countries'].items() if region in regions}
+        countries = countries & in_regions if countries else in_regions
+        if not countries:
+            return queryset.none()
+    if countries:
+        queryset = queryset.filter(country_id__in=sorted(countries))
+    if spec['start_year'] is not None:
+        queryset = queryset.filter(year__gte=spec['start_year'])
+    if spec['end_year'] is not None:
+        queryset = queryset.filter(year__lte=spec['end_year'])
+    return queryset
+
+
+def _named(row, maps, fields=None):
+    """Add names and regions to a row holding country_code and/or indicator_code"""
+    named = dict(row)
+    if 'country_code' in row:
+        name, region = maps['countries'].get(row['country_code'], (None, None))
+        named['country'] = name
+        named.setdefault('region', region)
+    if 'indicator_code' in row:
+        named['indicator'] = maps['indicators'].get(row['indicator_code'])
+    if fields is not None:
+        named = {field: named[field] for field in fields}
+    return named
+
+
+def query_rows(spec, maps):
+    """One keyset page of projected rows and the cursor of the next page"""
+    queryset = filtered_values(spec, maps).order_by(*KEYSET_ORDER)
+    if spec['cursor']:
+        country_code, indicator_code, year = decode_cursor(spec['cursor'])
+        queryset = queryset.filter(
+            Q(country_id__gt=country_code) |
+            Q(country_id=country_code, indicator_id__gt=indicator_code) |
+            Q(country_id=country_code, indicator_id=indicator_code, year__gt=year)
+        )
+    columns = ('country_code', 'indicator_code', 'year', 'value')
+    page_size = spec['page_size']
+    rows = list(queryset.values_list(*KEYSET_ORDER, 'value')[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*rows[-1][:3])
+    return [_named(dict(zip(columns, row)), maps, spec['fields']) for row in rows], next_cursor
+
+
+def query_groups(spec, maps, max_groups=None):
+    """Aggregated results, one dict per group, ordered by the group_by fields.
+
+    Raises ValueError if there are more than ``max_groups`` groups.
+    """
+    queryset = filtered_values(spec, maps)
+    group_fields = [GROUP_BY_FIELDS[name] for name in spec['group_by']]
+    # Output names for the grouped columns; codes get their names from the maps
+    outputs = {'country_id': 'country_code', 'indicator_id': 'indicator_code', 'country__region': 'region'}
+    key_names = [outputs.get(field, field) for field in group_fields]
+    functions = {name: AGGREGATE_FUNCTIONS[name]('value') for name in spec['aggregates'] if name != LATEST}
+
+    results = {}
+    if functions:
+        if group_fields:
+            rows = queryset.values(*group_fields).annotate(**functions).order_by(*group_fields)
+            if max_groups is not None:
+                rows = rows[:max_groups + 1]
+        else:
+            rows = [queryset.aggregate(**functions)]
+        for row in rows:
+            key = tuple(row[field] for field in group_fields)
+            results[key] = {
+                **dict(zip(key_names, key)), **{name: row[name] for name in functions}
+            }
+
+    if LATEST in spec['aggregates']:
+        latest = queryset.filter(value__isnull=False).annotate(
+            rank=Window(RowNumber(), partition_by=[F(field) for field in group_fields], order_by=F('year').desc())
+        ).filter(rank=1).values_list(*group_fields, 'year', 'value').order_by(*group_fields)
+        if max_groups is not None:
+            latest = latest[:max_groups + 1]
+        for *key, year, value in latest:
+            key = tuple(key)
+            result = results.setdefault(key, dict(zip(key_names, key)))
+            result.update(latest=value, latest_year=year)
+        # Groups with no value at all have no latest either
+        for result in results.values():
+            result.setdefault(LATEST, None)
+            result.setdefault('latest_year', None)
+
+    if max_groups is not None and len(results) > max_groups:
+        raise ValueError(f'The query has more than {max_groups} groups; narrow the filters or group by less')
+    return [_named(results[key], maps) for key in sorted(results, key=_sort_key)]
+
+
+def _sort_key(key):
+    # Group keys may hold None (countries without a region)
+    return tuple((value is None, value) for value in key)
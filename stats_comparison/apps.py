@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class StatsComparisonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stats_comparison'
+
+    def ready(self):
+        from .db import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='stats_comparison.configure_connection')
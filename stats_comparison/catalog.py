@@ -0,0 +1,95 @@
+"""The set of World Bank indicators fetched by fetch_worldbank_data.
+
+The catalog is a JSON file listing series codes, World Bank topics and
+name searches, for example::
+
+    {
+        "series": ["SP.POP.TOTL", {"code": "NY.GDP.PCAP.CD", "name": "GDP per capita (current US$)"}],
+        "topics": [19],
+        "search": ["CO2 emissions"]
+    }
+
+A plain JSON list is read as "series". Topics and searches are expanded
+through the API. Without a catalog the built-in DEFAULT_INDICATORS are used.
+"""
+import json
+
+# Used when no catalog file is configured
+DEFAULT_INDICATORS = [
+    # Economic indicators
+    ('NY.GDP.PCAP.CD', 'GDP per capita (current US$)'),
+    ('NY.GDP.MKTP.KD.ZG', 'GDP growth (annual %)'),
+    ('FP.CPI.TOTL.ZG', 'Inflation, consumer prices (annual %)'),
+    ('NE.EXP.GNFS.ZS', 'Exports of goods and services (% of GDP)'),
+    ('BX.KLT.DINV.WD.GD.ZS', 'Foreign direct investment, net inflows (% of GDP)'),
+    ('GC.DOD.TOTL.GD.ZS', 'Central government debt (% of GDP)'),
+
+    # Social indicators
+    ('SP.POP.TOTL', 'Population, total'),
+    ('SP.DYN.LE00.IN', 'Life expectancy at birth (years)'),
+    ('SE.TER.ENRR', 'School enrollment, tertiary (% gross)'),
+    ('SL.UEM.TOTL.ZS', 'Unemployment, total (% of total labor force)'),
+    ('SI.POV.GINI', 'GINI index'),
+    ('SH.XPD.CHEX.GD.ZS', 'Current health expenditure (% of GDP)'),
+    ('SP.URB.TOTL.IN.ZS', 'Urban population (% of total)'),
+
+    # Environmental indicators
+    ('EN.ATM.CO2E.PC', 'CO2 emissions (metric tons per capita)'),
+    ('EG.USE.PCAP.KG.OE', 'Energy use (kg of oil equivalent per capita)'),
+    ('ER.FST.TOTL.ZS', 'Forest area (% of land area)'),
+    ('EG.ELC.ACCS.ZS', 'Access to electricity (% of population)'),
+    ('EN.POP.DNST', 'Population density (people per sq. km)'),
+]
+
+
+def load_catalog(path):
+    """Read a catalog file into a dict of 'series' [(code, name or None)], 'topics' and 'search'"""
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'series': spec}
+    unknown = set(spec) - {'series', 'topics', 'search'}
+    if unknown:
+        raise ValueError(f"Unknown catalog keys: {', '.join(sorted(unknown))}")
+    series = []
+    for entry in spec.get('series', []):
+        if isinstance(entry, str):
+            series.append((entry, None))
+        elif isinstance(entry, dict) and 'code' in entry:
+            series.append((entry['code'], entry.get('name')))
+        else:
+            raise ValueError(f'Catalog series must be codes or {{"code": ..., "name": ...}} objects, not {entry!r}')
+    return {
+        'series': series,
+        'topics': list(spec.get('topics', [])),
+        'search': list(spec.get('search', [])),
+    }
+
+
+def resolve_catalog(spec, list_series):
+    """Expand a catalog into unique (code, name or None) pairs, in catalog order.
+
+    ``list_series(**kwargs)`` lists series records ({'id', 'value'}) for a
+    ``topic`` or a name search ``q``, like ``wbgapi.series.list``.
+    """
+    indicators = dict(spec['series'])
+    listings = [{'topic': topic} for topic in spec['topics']] + [{'q': query} for query in spec['search']]
+    for listing in listings:
+        for series in list_series(**listing):
+            if indicators.get(series['id']) is None:
+                indicators[series['id']] = series['value']
+    return list(indicators.items())
+
+
+def chunked(items, size):
+    """Consecutive lists of at most ``size`` items"""
+    items = list(items)
+    return [items[start:start + size] for start in range(0, len(items), max(1, size))]
+
+
+def series_metadata(records):
+    """Map wbgapi series Metadata records to {code: (name or None, description)}"""
+    return {
+        record.id: (record.metadata.get('IndicatorName'), record.metadata.get('Longdefinition', ''))
+        for record in records or []
+    }
@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from .models import StatisticValue
+
+# Aligned arrays for every (country, year) that has a value for both indicators
+PairedValues = namedtuple('PairedValues', ['country_codes', 'country_names', 'years', 'values1', 'values2'])
+
+
+def pair_indicator_values(indicator1, indicator2, country_codes, snapshot=None):
+    """Fetch both indicators in one query and align them on (country, year).
+
+    Returns a PairedValues of NumPy arrays sorted by country name and year.
+    The number of queries is constant regardless of how many countries are
+    selected, and zero when a current ``snapshot`` is given.
+    """
+    if snapshot is not None:
+        return snapshot.pair(indicator1, indicator2, country_codes)
+    
+    rows = pairing_queryset(indicator1, indicator2, country_codes)
+    return pair_rows(list(rows), indicator1, indicator2)
+
+
+def pairing_queryset(indicator1, indicator2, country_codes):
+    """Rows of (country code, country name, year, indicator, value) for both indicators"""
+    return StatisticValue.objects.filter(
+        indicator_id__in=[indicator1, indicator2],
+        country_id__in=country_codes,
+        value__isnull=False
+    ).values_list('country_id', 'country__name', 'year', 'indicator_id', 'value')
+
+
+def pair_rows(rows, indicator1, indicator2):
+    """Align rows of pairing_queryset() into PairedValues; CPU only, no database access"""
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(
+        rows,
+        columns=['country_code', 'country_name', 'year', 'indicator', 'value']
+    )
+    if df.empty:
+        return empty_pairs()
+
+    # One column per indicator, one row per (country, year)
+    wide = df.pivot_table(
+        index=['country_name', 'country_code', 'year'],
+        columns='indicator',
+        values='value',
+        aggfunc='first'
+    )
+    if indicator1 not in wide.columns or indicator2 not in wide.columns:
+        return empty_pairs()
+
+    wide = wide[[indicator1, indicator2]].dropna().sort_index()
+    if wide.empty:
+        return empty_pairs()
+
+    index = wide.index
+    return PairedValues(
+        country_codes=index.get_level_values('country_code').to_numpy(dtype=object),
+        country_names=index.get_level_values('country_name').to_numpy(dtype=object),
+        years=index.get_level_values('year').to_numpy(dtype=np.int64),
+        values1=wide.iloc[:, 0].to_numpy(dtype=np.float64),
+        values2=wide.iloc[:, 1].to_numpy(dtype=np.float64),
+    )
+
+
+def comparison_cache_key(indicator1, indicator2, country_codes, data_version, options=()):
+    """Cache key for a comparison; country order and duplicates do not matter.
+
+    ``options`` holds anything else that changes the output, such as the plot mode.
+    """
+    selection = json.dumps([indicator1, indicator2, sorted(set(country_codes)), list(options)])
+    digest = hashlib.sha256(selection.encode()).hexdigest()
+    return f'comparison:v{data_version}:{digest}'
+
+
+def empty_pairs():
+    """PairedValues with no points"""
+    return PairedValues(
+        country_codes=np.array([], dtype=object),
+        country_names=np.array([], dtype=object),
+        years=np.array([], dtype=np.int64),
+        values1=np.array([], dtype=np.float64),
+        values2=np.array([], dtype=np.float64),
+    )
+
+
+def typed_array(values, dtype='f8'):
+    """Encode a numeric array as a Plotly.js typed array (base64 little-endian bytes)"""
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def comparison_figure(pairs, ind1_name, ind2_name):
+    """Plotly figure dict (data and layout) for a comparison, rendered by Plotly.js in the browser"""
+    labels = [f"{name} ({year})" for name, year in zip(pairs.country_names, pairs.years.tolist())]
+    return {
+        'data': [{
+            'type': 'scatter',
+            'mode': 'markers+text',
+            'x': typed_array(pairs.values1),
+            'y': typed_array(pairs.values2),
+            'text': labels,
+            'textposition': 'top center',
+            'marker': {'size': 10},
+            'hovertemplate': f'%{{text}}<br>{ind1_name}=%{{x}}<br>{ind2_name}=%{{y}}<extra></extra>',
+        }],
+        'layout': {
+            'title': {'text': f'Comparison of {ind1_name} vs {ind2_name}'},
+            'xaxis': {'title': {'text': ind1_name}},
+            'yaxis': {'title': {'text': ind2_name}},
+        },
+    }
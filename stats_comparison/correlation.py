@@ -0,0 +1,81 @@
+import numpy as np
+
+from .models import Indicator, StatisticValue
+
+CORRELATION_METHODS = ('pearson', 'spearman')
+
+
+def observation_matrix(country_codes=None, start_year=None, end_year=None, snapshot=None):
+    """Return (indicator codes, matrix) with one row per (country, year) and one column per indicator.
+
+    Missing values are NaN. Reads from ``snapshot`` when given, otherwise
+    with a single query.
+    """
+    if snapshot is not None:
+        return snapshot.observation_matrix(country_codes, start_year, end_year)
+
+    import pandas as pd
+
+    queryset = StatisticValue.objects.filter(value__isnull=False)
+    if country_codes:
+        queryset = queryset.filter(country_id__in=country_codes)
+    if start_year is not None:
+        queryset = queryset.filter(year__gte=start_year)
+    if end_year is not None:
+        queryset = queryset.filter(year__lte=end_year)
+    df = pd.DataFrame.from_records(
+        list(queryset.values_list('country_id', 'year', 'indicator_id', 'value')),
+        columns=['country', 'year', 'indicator', 'value']
+    )
+    codes = list(Indicator.objects.order_by('code').values_list('code', flat=True))
+    if df.empty:
+        return codes, np.empty((0, len(codes)))
+    wide = df.pivot_table(index=['country', 'year'], columns='indicator', values='value', aggfunc='first')
+    return codes, wide.reindex(columns=codes).to_numpy(dtype=np.float64)
+
+
+def correlation_matrix(matrix, method='pearson', min_periods=3):
+    """Pairwise-complete correlation of the columns of ``matrix`` in one vectorized pass.
+
+    Returns (correlations, counts): counts[i, j] is the number of rows where
+    both columns have a value, and correlations are NaN where that count is
+    below ``min_periods`` or a column is constant. For Spearman without
+    missing values, columns are ranked once and go through the same Pearson
+    step; with missing values, ranks depend on the rows each pair shares, so
+    pandas ranks within every pair instead.
+    """
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Unknown correlation method '{method}'")
+    x = np.asarray(matrix, dtype=np.float64)
+    present = ~np.isnan(x)
+    mask = present.astype(np.float64)
+    if method == 'spearman':
+        import pandas as pd
+
+        if not present.all():
+            correlations = pd.DataFrame(x).corr(method='spearman', min_periods=max(min_periods, 2)).to_numpy()
+            return np.clip(correlations, -1.0, 1.0), (mask.T @ mask).astype(np.int64)
+        x = pd.DataFrame(x).rank(method='average').to_numpy()
+
+    # Centering does not change the correlation but keeps the sums small
+    column_counts = mask.sum(axis=0)
+    means = np.divide(
+        np.where(present, x, 0.0).sum(axis=0), column_counts,
+        out=np.zeros(x.shape[1]), where=column_counts > 0
+    )
+    centered = np.where(present, x - means, 0.0)
+
+    counts = mask.T @ mask
+    sums = centered.T @ mask           # sums[i, j]: sum of column i where j is present too
+    squares = (centered ** 2).T @ mask
+    products = centered.T @ centered
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - sums * sums.T / counts
+        variance_i = squares - sums ** 2 / counts
+        variance_j = variance_i.T
+        correlations = covariance / np.sqrt(variance_i * variance_j)
+    # Constant columns leave only rounding noise in the variance
+    constant = (variance_i <= 1e-12 * squares) | (variance_j <= 1e-12 * squares.T)
+    correlations[(counts < max(min_periods, 2)) | constant | ~np.isfinite(correlations)] = np.nan
+    return np.clip(correlations, -1.0, 1.0), counts.astype(np.int64)
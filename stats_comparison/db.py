@@ -0,0 +1,16 @@
+"""Per-connection database tuning applied through the connection_created signal."""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection.
+
+    WAL lets readers keep going while the ingest writes, and lowers the cost
+    of each commit; the pragmas are per connection, except journal_mode,
+    which is stored in the database file.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,147 @@
+import glob
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .instrumentation import span
+from .models import StatisticValue
+from .queries import iter_rows, stream_csv
+from .snapshot import get_snapshot
+
+# Column headers of exported files, in the order of queries.API_FIELDS
+EXPORT_COLUMNS = ('Country', 'Country Code', 'Region', 'Indicator', 'Indicator Code', 'Year', 'Value')
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportUnavailable(Exception):
+    """Raised when an export format needs an optional package that is not installed"""
+
+
+def export_rows(version):
+    """Rows of every statistic value, from the snapshot of ``version`` when there is one"""
+    snapshot = get_snapshot(version)
+    if snapshot is not None:
+        return snapshot.iter_rows()
+    return iter_rows(StatisticValue.objects.all(), chunk_size=settings.API_STREAM_CHUNK_SIZE)
+
+
+def write_xlsx(rows, file):
+    """Write rows to ``file`` with openpyxl's write-only mode, one row in memory at a time"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('WorldBank_Data')
+    sheet.append(EXPORT_COLUMNS)
+    with span('xlsx.rows'):
+        for row in rows:
+            sheet.append(row)
+    with span('xlsx.save'):
+        workbook.save(file)
+
+
+def write_parquet(rows, file, row_group_size=50000):
+    """Write rows to ``file`` as Parquet, buffering one row group of columns at a time"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable('Parquet export requires the pyarrow package')
+
+    schema = pa.schema([
+        ('Country', pa.string()),
+        ('Country Code', pa.string()),
+        ('Region', pa.string()),
+        ('Indicator', pa.string()),
+        ('Indicator Code', pa.string()),
+        ('Year', pa.int32()),
+        ('Value', pa.float64()),
+    ])
+    with pq.ParquetWriter(file, schema) as writer:
+        columns = [[] for _ in EXPORT_COLUMNS]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(columns[0]) >= row_group_size:
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                columns = [[] for _ in EXPORT_COLUMNS]
+        if columns[0]:
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+
+def export_file(rows, export_format):
+    """Write rows to an anonymous temporary file in ``export_format`` and rewind it.
+
+    The file is deleted as soon as it is closed.
+    """
+    file = tempfile.TemporaryFile()
+    try:
+        if export_format == 'xlsx':
+            write_xlsx(rows, file)
+        elif export_format == 'parquet':
+            write_parquet(rows, file)
+        else:
+            raise ValueError(f"Unsupported export format '{export_format}'")
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def stream_export_csv(rows):
+    """Stream rows as CSV with the export column headers"""
+    return stream_csv(rows, header=EXPORT_COLUMNS)
+
+
+def write_csv(rows, file):
+    """Write rows to binary ``file`` as CSV with the export column headers"""
+    for line in stream_export_csv(rows):
+        file.write(line.encode())
+
+
+_WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+
+_artifact_lock = threading.Lock()
+
+
+def artifact_path(version, export_format):
+    return os.path.join(settings.EXPORT_CACHE_DIR, f'worldbank_data-v{version}.{export_format}')
+
+
+def export_artifact(version, export_format, rows_factory):
+    """Path of the pre-rendered export of data ``version``, writing it on first use.
+
+    ``rows_factory`` is only called when the file has to be written. The file
+    is written under a temporary name and renamed into place, so concurrent
+    requests and other processes never serve a partial export. Files of
+    older versions are deleted once the new one exists.
+    """
+    path = artifact_path(version, export_format)
+    if os.path.exists(path):
+        return path
+    with _artifact_lock:
+        if os.path.exists(path):
+            return path
+        os.makedirs(settings.EXPORT_CACHE_DIR, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(dir=settings.EXPORT_CACHE_DIR, prefix='.export-', delete=False)
+        try:
+            with file:
+                _WRITERS[export_format](rows_factory(), file)
+            os.replace(file.name, path)
+        except BaseException:
+            os.unlink(file.name)
+            raise
+        for stale in glob.glob(os.path.join(settings.EXPORT_CACHE_DIR, f'worldbank_data-v*.{export_format}')):
+            if stale != path:
+                try:
+                    os.unlink(stale)
+                except OSError:
+                    pass
+    return path
@@ -0,0 +1,140 @@
+"""On-disk cache of raw World Bank API responses for the ingest command.
+
+Every wbgapi request goes through ``wbgapi._queryAPI(url)``. While
+cached_queries() is active that function is replaced by a ResponseCache
+lookup: each response document is stored under the SHA-256 of its URL, is
+reused until it is ``ttl`` seconds old, and the least recently used
+documents are evicted once the cache grows past ``max_bytes``.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import wbgapi as wb
+
+CACHE_MODES = ('default', 'refresh', 'offline')
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode for a request that is not in the cache"""
+
+
+class ResponseCache:
+    """Response documents of API URLs, stored as one JSON file per URL.
+
+    Modes: ``default`` serves fresh entries and fetches the rest,
+    ``refresh`` always fetches and overwrites, ``offline`` serves entries
+    of any age and raises CacheMiss instead of using the network.
+    """
+
+    def __init__(self, directory, ttl=24 * 60 * 60, max_bytes=256 * 1024 * 1024, mode='default', clock=time.time):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}'")
+        self.directory = str(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}.json')
+
+    def get(self, url):
+        """Cached response document of ``url``, or None if missing or stale"""
+        if self.mode == 'refresh':
+            return None
+        path = self.path(url)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        now = self.clock()
+        if self.mode != 'offline' and now - entry['fetched_at'] > self.ttl:
+            return None
+        try:
+            # The modification time orders entries for LRU eviction
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return entry['response']
+
+    def put(self, url, response):
+        """Store a response document atomically and evict entries over ``max_bytes``"""
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        now = self.clock()
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.entry-', delete=False) as f:
+            json.dump({'url': url, 'fetched_at': now, 'response': response}, f, separators=(',', ':'))
+        os.utime(f.name, (now, now))
+        with self._lock:
+            size = self._current_size()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(f.name, path)
+            self._size = size + os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json') and not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in ``max_bytes``"""
+        for _, size, path in sorted(self._entries()):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def query(self, fetch, url):
+        """Drop-in for wbgapi._queryAPI: (header, response) from the cache or ``fetch``"""
+        response = self.get(url)
+        if response is not None:
+            self.hits += 1
+            return wb._responseHeader(url, response), response
+        if self.mode == 'offline':
+            raise CacheMiss(f'{url} is not cached and the cache is offline')
+        self.misses += 1
+        header, response = fetch(url)
+        # Only successful responses get here; wbgapi raises for the others
+        self.put(url, response)
+        return header, response
+
+
+@contextmanager
+def cached_queries(cache):
+    """Route every wbgapi request through ``cache`` while the block runs"""
+    original = wb._queryAPI
+    wb._queryAPI = lambda url: cache.query(original, url)
+    try:
+        yield cache
+    finally:
+        wb._queryAPI = original
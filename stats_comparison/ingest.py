@@ -0,0 +1,270 @@
+import csv
+import hashlib
+import io
+from datetime import date
+
+import pandas as pd
+from django.db import connection
+from django.utils import timezone
+
+from .models import Country, IndicatorSync, StatisticValue
+
+# Economy code prefixes used by the World Bank for regions and other aggregates
+AGGREGATE_PREFIXES = (
+    'REG', 'INX', 'EMU', 'EAS', 'ECS', 'EUU', 'ARB', 'CEB', 'CSS', 'EAP',
+    'ECA', 'EAR', 'FCS', 'HIC', 'HPC', 'IBD', 'IBT', 'IDA', 'IDB', 'IDX',
+    'LAC', 'LCN', 'LDC', 'LIC', 'LMC', 'LMY', 'LTE', 'MEA', 'MIC', 'MNA',
+    'NAC', 'OED', 'OSS', 'PRE', 'PSS', 'PST', 'SAS', 'SSA', 'SSF', 'SST',
+    'TEA', 'TEC', 'TLA', 'TMN', 'TSA', 'TSS', 'UMC', 'WLD',
+)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Smallest write that goes through COPY on PostgreSQL; below this, one
+# bulk insert is as fast
+COPY_MIN_ROWS = 500
+
+
+def is_country(economy):
+    """Return True if a wbgapi economy record is an actual country, not an aggregate"""
+    code = economy['id']
+    return (
+        # Not starting with region/aggregate prefixes
+        not code.startswith(AGGREGATE_PREFIXES) and
+        # Must be exactly 3 characters (standard country code length)
+        len(code) == 3 and
+        # Must have a proper region assigned
+        economy.get('region', 'Unknown') != 'Unknown' and
+        # Additional checks for specific cases
+        not any(x in economy['value'].lower() for x in ['region', 'union', 'income', 'aggregate'])
+    )
+
+
+def upsert_countries(economies, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert or update all country records in batches.
+
+    Returns (written, changed, regrouped): ``changed`` counts the countries
+    that are new or whose name, region or income level differs from the
+    stored one, and ``regrouped`` the stored countries whose region or income
+    level changed, which moves them between aggregate groups.
+    """
+    countries = [
+        Country(
+            code=economy['id'],
+            name=economy['value'],
+            region=economy.get('region', 'Unknown'),
+            income_level=economy.get('incomeLevel') or ''
+        )
+        for economy in economies
+        if is_country(economy)
+    ]
+    stored = {
+        code: rest for code, *rest in Country.objects.values_list('code', 'name', 'region', 'income_level')
+    }
+    changed = sum(
+        stored.get(country.code) != [country.name, country.region, country.income_level]
+        for country in countries
+    )
+    regrouped = sum(
+        country.code in stored and stored[country.code][1:] != [country.region, country.income_level]
+        for country in countries
+    )
+    Country.objects.bulk_create(
+        countries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['code'],
+        update_fields=['name', 'region', 'income_level']
+    )
+    return len(countries), changed, regrouped
+
+
+def split_series_frame(data, codes):
+    """Split a multi-series wbgapi DataFrame ((economy, series) x YRxxxx) into one frame per code.
+
+    Series the API returned no rows for get an empty frame.
+    """
+    if 'series' not in data.index.names:
+        # A single series comes back indexed by economy only
+        return {codes[0]: data} if len(codes) == 1 else {}
+    empty = data.iloc[:0].droplevel('series')
+    return {
+        code: data.xs(code, level='series') if code in data.index.get_level_values('series') else empty
+        for code in codes
+    }
+
+
+def tidy_indicator_frame(data, country_codes):
+    """Turn a wbgapi DataFrame (economy x YRxxxx) into tidy (country, year, value) rows.
+
+    Rows for unknown economies and missing or non-numeric values are dropped
+    with column operations rather than per-row Python.
+    """
+    df = data.reset_index().melt(
+        id_vars=['economy'],
+        var_name='year',
+        value_name='value'
+    )
+    df = df[df['economy'].isin(country_codes)]
+    df = df.assign(
+        year=pd.to_numeric(df['year'].astype(str).str.replace('YR', '', regex=False), errors='coerce'),
+        value=pd.to_numeric(df['value'], errors='coerce')
+    ).dropna(subset=['year', 'value'])
+    return pd.DataFrame({
+        'country': df['economy'].to_numpy(),
+        'year': df['year'].astype(int).to_numpy(),
+        'value': df['value'].astype(float).to_numpy(),
+    })
+
+
+def upsert_statistic_values(indicator_code, values, batch_size=DEFAULT_BATCH_SIZE):
+    """Write tidy (country, year, value) rows for one indicator in batches.
+
+    On PostgreSQL, larger writes are streamed with COPY instead.
+    Returns the number of rows written.
+    """
+    if connection.vendor == 'postgresql' and len(values) >= COPY_MIN_ROWS:
+        return copy_statistic_values(indicator_code, values)
+    objs = [
+        StatisticValue(country_id=country, indicator_id=indicator_code, year=year, value=value)
+        for country, year, value in zip(
+            values['country'].tolist(), values['year'].tolist(), values['value'].tolist()
+        )
+    ]
+    StatisticValue.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['country', 'indicator', 'year'],
+        update_fields=['value']
+    )
+    return len(objs)
+
+
+def copy_statistic_values(indicator_code, values):
+    """PostgreSQL upsert of tidy rows: COPY into a temporary table, then one INSERT ... ON CONFLICT.
+
+    Must run inside a transaction. Returns the number of rows written.
+    """
+    table = connection.ops.quote_name(StatisticValue._meta.db_table)
+    rows = zip(values['country'].tolist(), values['year'].tolist(), values['value'].tolist())
+    copy_sql = 'COPY statistic_value_load (country_id, year, value) FROM STDIN'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS statistic_value_load '
+            '(country_id varchar(3), year integer, value double precision) ON COMMIT DELETE ROWS'
+        )
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            # psycopg 3
+            with raw.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            raw.copy_expert(copy_sql + ' WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'INSERT INTO {table} (country_id, indicator_id, year, value) '
+            'SELECT country_id, %s, year, value FROM statistic_value_load '
+            'ON CONFLICT (country_id, indicator_id, year) DO UPDATE SET value = EXCLUDED.value',
+            [indicator_code]
+        )
+        written = cursor.rowcount
+        # Rows would otherwise stay until commit and be merged again by the next call
+        cursor.execute('TRUNCATE statistic_value_load')
+    return written
+
+
+def values_hash(values):
+    """Stable content hash of tidy (country, year, value) rows"""
+    ordered = values.sort_values(['country', 'year'])
+    return hashlib.sha256(ordered.to_csv(index=False).encode()).hexdigest()
+
+
+def stored_values_hash(indicator_code, start_year, end_year):
+    """values_hash() of the stored values of an indicator for a year range, using one query"""
+    rows = StatisticValue.objects.filter(
+        indicator_id=indicator_code, year__gte=start_year, year__lte=end_year, value__isnull=False
+    ).values_list('country_id', 'year', 'value')
+    df = pd.DataFrame.from_records(list(rows), columns=['country', 'year', 'value'])
+    return values_hash(pd.DataFrame({
+        'country': df['country'].to_numpy(),
+        'year': df['year'].astype(int).to_numpy(),
+        'value': df['value'].astype(float).to_numpy(),
+    }))
+
+
+def parse_last_updated(source):
+    """Return the ``lastupdated`` date of a wbgapi source record, if any"""
+    try:
+        return date.fromisoformat(str(source.get('lastupdated'))[:10])
+    except (AttributeError, ValueError):
+        return None
+
+
+def years_to_fetch(sync, years, source_last_updated):
+    """Years of ``years`` that need fetching given an indicator's sync record.
+
+    Everything is refetched when there is no sync record or the source has
+    been updated since (or its update date is unknown); otherwise only years
+    outside the covered range are fetched.
+    """
+    if (
+        sync is None or
+        source_last_updated is None or
+        sync.source_last_updated is None or
+        source_last_updated > sync.source_last_updated
+    ):
+        return list(years)
+    return [year for year in years if not sync.covers(year)]
+
+
+def changed_values(indicator_code, values):
+    """Drop rows whose stored value is already identical, using one query"""
+    if values.empty:
+        return values
+    existing = pd.DataFrame.from_records(
+        list(StatisticValue.objects.filter(
+            indicator_id=indicator_code,
+            year__in=values['year'].unique().tolist()
+        ).values_list('country_id', 'year', 'value')),
+        columns=['country', 'year', 'stored']
+    )
+    if existing.empty:
+        return values
+    existing['year'] = existing['year'].astype(int)
+    merged = values.merge(existing, on=['country', 'year'], how='left')
+    return values[(merged['stored'] != merged['value']).to_numpy()].reset_index(drop=True)
+
+
+def record_sync(indicator_code, years, source_last_updated, previous=None):
+    """Store sync metadata after ``years`` of an indicator have been ingested.
+
+    The covered range grows when it overlaps or touches the previous one and
+    the source has not changed; otherwise it is replaced. The content hash
+    is taken over the stored values of the whole covered range, so it can be
+    compared with the hash of a fetch of exactly that range.
+    """
+    start_year, end_year = min(years), max(years)
+    if (
+        previous is not None and
+        previous.source_last_updated == source_last_updated and
+        previous.start_year <= end_year + 1 and
+        start_year <= previous.end_year + 1
+    ):
+        start_year = min(start_year, previous.start_year)
+        end_year = max(end_year, previous.end_year)
+    sync, _ = IndicatorSync.objects.update_or_create(
+        indicator_id=indicator_code,
+        defaults={
+            'last_fetched': timezone.now(),
+            'start_year': start_year,
+            'end_year': end_year,
+            'content_hash': stored_values_hash(indicator_code, start_year, end_year),
+            'source_last_updated': source_last_updated,
+        }
+    )
+    return sync
@@ -0,0 +1,235 @@
+"""Query counts, DB time and timed spans for views and management commands.
+
+A Collector counts the queries run on the default connection (through
+``connection.execute_wrapper``) and the time spent in named spans while it
+is active. InstrumentationMiddleware activates one per request and adds the
+totals to the process-wide ``metrics`` registry, which the metrics view
+renders in the Prometheus text format.
+"""
+import contextvars
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+_current = contextvars.ContextVar('stats_comparison_collector', default=None)
+
+
+class Collector:
+    """Queries, DB time and span times of one request or command run"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() protocol
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+@contextmanager
+def collect():
+    """Activate a new Collector for the current thread/task and the default connection"""
+    collector = Collector()
+    token = _current.set(collector)
+    try:
+        with connection.execute_wrapper(collector):
+            yield collector
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Time a block under ``name`` for the active collector and the metrics registry"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        collector = _current.get()
+        if collector is not None:
+            collector.add_span(name, seconds)
+        metrics.observe('stats_comparison_span_seconds', {'span': name}, seconds)
+
+
+class PhaseTimer:
+    """Wall time and query count of consecutive phases of a command run"""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.phases = []
+        self._current = None
+
+    def start(self, name):
+        """Close the running phase, if any, and start ``name``"""
+        self.stop()
+        self._current = (name, time.perf_counter(), self.collector.queries)
+
+    def stop(self):
+        if self._current is None:
+            return
+        name, started, queries = self._current
+        self.phases.append((name, time.perf_counter() - started, self.collector.queries - queries))
+        self._current = None
+
+
+# name -> (type, help) of the metrics rendered by Metrics.render()
+METRIC_TYPES = {
+    'stats_comparison_requests_total': ('counter', 'Requests handled, by view, method and status'),
+    'stats_comparison_request_seconds': ('summary', 'Time until the view returned its response'),
+    'stats_comparison_db_queries_total': ('counter', 'Database queries run by requests'),
+    'stats_comparison_db_seconds_total': ('counter', 'Time spent in database queries by requests'),
+    'stats_comparison_span_seconds': ('summary', 'Time spent in instrumented code spans'),
+}
+
+
+class Metrics:
+    """Thread-safe in-process counters and summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        self.inc(f'{name}_sum', labels, seconds)
+        self.inc(f'{name}_count', labels)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = []
+        for name, (kind, help_text) in METRIC_TYPES.items():
+            samples = [
+                (key, value) for key, value in values
+                if key[0] == name or (kind == 'summary' and key[0] in (f'{name}_sum', f'{name}_count'))
+            ]
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (sample, labels), value in samples:
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                lines.append(f'{sample}{{{label_text}}} {value}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+def server_timing(collector):
+    """Server-Timing header value for a collector"""
+    entries = [
+        f'total;dur={collector.elapsed() * 1000:.1f}',
+        f'db;dur={collector.db_seconds * 1000:.1f};desc="{collector.queries} queries"',
+    ]
+    entries.extend(
+        f'{name.replace(".", "-")};dur={seconds * 1000:.1f}' for name, seconds in collector.spans.items()
+    )
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware:
+    """Record request counts, latency, queries and DB time of the app's views.
+
+    Streaming responses are measured until the view returns, not until the
+    last chunk is sent. With SERVER_TIMING enabled, responses also carry a
+    Server-Timing header with the same numbers. Works in both sync and async
+    middleware chains, so it does not force an ASGI server's async views
+    onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect() as collector:
+            response = self.get_response(request)
+        return self.record(request, response, collector)
+
+    async def __acall__(self, request):
+        with collect() as collector:
+            response = await self.get_response(request)
+        return self.record(request, response, collector)
+
+    def record(self, request, response, collector):
+        match = request.resolver_match
+        if match is None or match.app_name != 'stats_comparison' or match.url_name == 'metrics':
+            return response
+
+        labels = {'view': match.url_name}
+        metrics.inc('stats_comparison_requests_total', {
+            **labels, 'method': request.method, 'status': response.status_code
+        })
+        metrics.observe('stats_comparison_request_seconds', labels, collector.elapsed())
+        metrics.inc('stats_comparison_db_queries_total', labels, collector.queries)
+        metrics.inc('stats_comparison_db_seconds_total', labels, collector.db_seconds)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(collector)
+        return response
+
+
+def write_ingest_metrics(phases, path):
+    """Write the phase timings of an ingest run as a Prometheus text file.
+
+    The ingest runs in its own process, so the metrics view reads this file
+    instead of the in-process registry. Written atomically.
+    """
+    lines = [
+        '# HELP stats_comparison_ingest_phase_seconds Duration of each phase of the last ingest',
+        '# TYPE stats_comparison_ingest_phase_seconds gauge',
+    ]
+    lines.extend(f'stats_comparison_ingest_phase_seconds{{phase="{name}"}} {seconds}' for name, seconds, _ in phases)
+    lines.extend([
+        '# HELP stats_comparison_ingest_phase_queries Database queries of each phase of the last ingest',
+        '# TYPE stats_comparison_ingest_phase_queries gauge',
+    ])
+    lines.extend(f'stats_comparison_ingest_phase_queries{{phase="{name}"}} {queries}' for name, _, queries in phases)
+    lines.extend([
+        '# HELP stats_comparison_ingest_last_run_timestamp_seconds When the last ingest finished',
+        '# TYPE stats_comparison_ingest_last_run_timestamp_seconds gauge',
+        f'stats_comparison_ingest_last_run_timestamp_seconds {time.time()}',
+    ])
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.metrics-', delete=False) as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(f.name, path)
@@ -0,0 +1,252 @@
+"""Background jobs: exports and ingests queued in the Job table and run by the run_jobs command.
+
+A web request only inserts a Job row and answers with its id. Worker
+processes claim queued jobs, report progress on the row while they run and
+record the path of the file they produce. Cancellation is cooperative: a
+running job checks cancel_requested each time it reports progress.
+"""
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+
+from .exports import EXPORT_FORMATS, artifact_path, export_artifact, export_rows
+from .models import Job, StatisticValue
+from .versioning import get_data_version
+
+# Parameters accepted for fetch jobs, with their types; they are passed to
+# fetch_worldbank_data as options of the same name
+FETCH_PARAMS = {
+    'start_year': int, 'end_year': int, 'incremental': bool, 'resume': bool, 'workers': int, 'rate': float,
+}
+
+
+# Attempts at a job-table statement that finds the table locked, and the first wait between them
+LOCKED_ATTEMPTS = 8
+LOCKED_DELAY = 0.01
+
+
+class JobCancelled(Exception):
+    """Raised from a progress report when the job has been asked to stop"""
+
+
+def retry_locked(statement, attempts=LOCKED_ATTEMPTS, delay=LOCKED_DELAY):
+    """Run ``statement()``, retrying with backoff while SQLite reports the table or database locked.
+
+    Worker threads and the run_jobs loop write to the job table at the same
+    time. SQLite's busy timeout covers most of it, but shared-cache
+    connections fail on a table lock at once, so each job-table statement
+    runs through this.
+    """
+    for attempt in range(attempts):
+        try:
+            return statement()
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+
+def clean_params(kind, params):
+    """Validated parameters of a job, raising ValueError for anything unknown or malformed"""
+    # JSON bodies can carry lists or objects, which are not hashable
+    if not isinstance(kind, str):
+        raise ValueError("'kind' must be a string")
+    if kind == Job.EXPORT:
+        export_format = params.get('format', 'xlsx')
+        if not isinstance(export_format, str) or export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        if not settings.EXPORT_CACHE_DIR:
+            raise ValueError('Background exports need EXPORT_CACHE_DIR to be set')
+        return {'format': export_format}
+    if kind == Job.FETCH:
+        unknown = set(params) - set(FETCH_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown fetch parameters: {', '.join(sorted(unknown))}")
+        cleaned = {}
+        for name, value in params.items():
+            if FETCH_PARAMS[name] is bool:
+                cleaned[name] = value in (True, 'true', '1', 1)
+            else:
+                try:
+                    cleaned[name] = FETCH_PARAMS[name](value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"'{name}' must be a number")
+        return cleaned
+    raise ValueError(f"Unknown job kind: {kind}")
+
+
+def enqueue(kind, params, owner=''):
+    """Queue a job for ``owner`` and return it, reusing an equivalent one where possible.
+
+    An unfinished job of the same kind and parameters queued by the same
+    owner is returned instead of queueing a duplicate, and an export whose
+    file already exists for the current data version is recorded as done
+    straight away.
+    """
+    params = clean_params(kind, params)
+    existing = Job.objects.filter(
+        kind=kind, params=params, owner=owner, status__in=[Job.QUEUED, Job.RUNNING]
+    ).order_by('created_at', 'pk').first()
+    if existing is not None:
+        return existing
+    if kind == Job.EXPORT:
+        version = get_data_version()
+        path = artifact_path(version, params['format'])
+        if os.path.exists(path):
+            now = timezone.now()
+            return Job.objects.create(
+                kind=kind, params=params, owner=owner, status=Job.SUCCEEDED, progress=1.0,
+                message=f'Export of data version {version}', result_path=path,
+                started_at=now, finished_at=now
+            )
+    return Job.objects.create(kind=kind, params=params, owner=owner)
+
+
+def cancel(job):
+    """Cancel a queued job at once, or ask a running one to stop; returns the refreshed job"""
+    now = timezone.now()
+    cancelled = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.CANCELLED, cancel_requested=True, message='Cancelled', finished_at=now
+    )
+    if not cancelled:
+        Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs():
+    """Mark running jobs whose worker stopped sending heartbeats as failed"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER)
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=Job.FAILED, message='The worker running this job stopped responding',
+        finished_at=timezone.now()
+    )
+
+
+def claim_next(worker):
+    """Mark the oldest queued job that fits under JOB_CONCURRENCY as running, and return it.
+
+    Workers race through conditional updates, so each job is claimed once.
+    A worker that finds its kind over the limit after claiming puts the job
+    back, which keeps the limit across processes. Returns None when nothing
+    can be started.
+    """
+    retry_locked(fail_stale_jobs)
+    limits = settings.JOB_CONCURRENCY
+    running = retry_locked(lambda: Counter(Job.objects.filter(status=Job.RUNNING).values_list('kind', flat=True)))
+    kinds = [kind for kind, _ in Job.KINDS if running[kind] < limits.get(kind, 1)]
+    if not kinds:
+        return None
+    candidates = Job.objects.filter(status=Job.QUEUED, kind__in=kinds).order_by('created_at', 'pk')
+    for pk, kind in retry_locked(lambda: list(candidates.values_list('pk', 'kind')[:10])):
+        now = timezone.now()
+        claimed = retry_locked(lambda: Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now
+        ))
+        if not claimed:
+            continue
+        if retry_locked(lambda: Job.objects.filter(status=Job.RUNNING, kind=kind).count()) > limits.get(kind, 1):
+            retry_locked(lambda: Job.objects.filter(pk=pk, status=Job.RUNNING).update(
+                status=Job.QUEUED, worker='', started_at=None, heartbeat_at=None
+            ))
+            return None
+        return retry_locked(lambda: Job.objects.get(pk=pk))
+    return None
+
+
+class ProgressReporter:
+    """Callable(fraction, message) that records a job's progress and raises JobCancelled.
+
+    Writes to the database at most once per ``interval`` seconds, so jobs
+    can report as often as they like.
+    """
+
+    def __init__(self, job, interval=1.0, clock=time.monotonic):
+        self.job = job
+        self.interval = interval
+        self.clock = clock
+        self.message = ''
+        self._last = None
+
+    def __call__(self, fraction, message=None):
+        if message is not None:
+            self.message = message
+        now = self.clock()
+        if self._last is not None and now - self._last < self.interval:
+            return
+        self._last = now
+        retry_locked(lambda: Job.objects.filter(pk=self.job.pk).update(
+            progress=min(max(fraction, 0.0), 1.0), message=self.message, heartbeat_at=timezone.now()
+        ))
+        if retry_locked(lambda: Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists()):
+            raise JobCancelled()
+
+
+def _counted(rows, total, report, every=10000):
+    """Pass rows through, reporting the share written every ``every`` rows"""
+    for written, row in enumerate(rows, 1):
+        if written % every == 0:
+            report(min(written / total, 0.99), f'Wrote {written} of about {total} rows')
+        yield row
+
+
+def run_export(job, report):
+    """Render the export file of the current data version; returns its path"""
+    export_format = job.params['format']
+    version = get_data_version()
+    total = max(1, StatisticValue.objects.count())
+    report(0.0, f'Exporting data version {version}')
+    path = export_artifact(version, export_format, lambda: _counted(export_rows(version), total, report))
+    report.message = f'Export of data version {version}'
+    return path
+
+
+def run_fetch(job, report):
+    """Run fetch_worldbank_data with the job's options; returns the path of its log, if kept"""
+    from .management.commands.fetch_worldbank_data import Command
+
+    command = Command()
+    command.progress = report
+    log_path = None
+    if settings.JOB_RESULTS_DIR:
+        os.makedirs(settings.JOB_RESULTS_DIR, exist_ok=True)
+        log_path = os.path.join(settings.JOB_RESULTS_DIR, f'job-{job.pk}.log')
+    with open(log_path or os.devnull, 'w') as log:
+        call_command(command, stdout=log, no_color=True, **job.params)
+    report.message = 'Fetched World Bank data'
+    return log_path or ''
+
+
+JOB_RUNNERS = {
+    Job.EXPORT: run_export,
+    Job.FETCH: run_fetch,
+}
+
+
+def _finish(job, status, message, result_path=''):
+    values = {'status': status, 'message': message, 'finished_at': timezone.now()}
+    if status == Job.SUCCEEDED:
+        values.update(progress=1.0, result_path=result_path or '')
+    retry_locked(lambda: Job.objects.filter(pk=job.pk).update(**values))
+
+
+def run_job(job):
+    """Run a claimed job and record how it ended; returns the refreshed job"""
+    report = ProgressReporter(job)
+    try:
+        report(0.0)
+        result_path = JOB_RUNNERS[job.kind](job, report)
+    except JobCancelled:
+        _finish(job, Job.CANCELLED, 'Cancelled')
+    except Exception as e:
+        _finish(job, Job.FAILED, str(e) or e.__class__.__name__)
+    else:
+        _finish(job, Job.SUCCEEDED, report.message, result_path)
+    retry_locked(job.refresh_from_db)
+    return job
@@ -0,0 +1,98 @@
+"""Persistent record of fetch_worldbank_data runs, used by --resume.
+
+A run records the last step it completed and one task per indicator with
+its chunk, status, attempts and last error. Completing a task is committed
+with the indicator's values, so after a crash the ledger says exactly which
+work is left.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import IngestRun, IngestTask
+
+# Finished runs kept for inspection; older ones are deleted with their tasks
+RUNS_KEPT = 10
+
+
+def start_run(options):
+    """Create a run, abandoning any unfinished one and pruning old finished runs"""
+    IngestRun.objects.filter(status__in=[IngestRun.RUNNING, IngestRun.FAILED]).update(
+        status=IngestRun.ABANDONED, finished_at=timezone.now()
+    )
+    kept = IngestRun.objects.order_by('-started_at', '-pk').values_list('pk', flat=True)[:RUNS_KEPT]
+    IngestRun.objects.exclude(pk__in=list(kept)).delete()
+    return IngestRun.objects.create(options=options)
+
+
+def resumable_run():
+    """The latest run that was interrupted or finished with failures, or None"""
+    return IngestRun.objects.filter(
+        status__in=[IngestRun.RUNNING, IngestRun.FAILED]
+    ).order_by('-started_at', '-pk').first()
+
+
+def advance(run, stage, **fields):
+    """Record that ``stage`` of ``run`` is complete, with any other run fields"""
+    run.stage = stage
+    for name, value in fields.items():
+        setattr(run, name, value)
+    run.save(update_fields=['stage', *fields])
+
+
+def plan_tasks(run, chunks, batch_size=1000):
+    """Create a pending task per indicator of ``chunks``, a list of (codes, years)"""
+    IngestTask.objects.bulk_create(
+        [
+            IngestTask(run=run, indicator_id=code, chunk=number, years=list(years))
+            for number, (codes, years) in enumerate(chunks)
+            for code in codes
+        ],
+        batch_size=batch_size
+    )
+
+
+def unfinished_chunks(run, codes=None):
+    """(codes, years) of every chunk with tasks not yet done, limited to ``codes`` if given"""
+    tasks = run.tasks.exclude(status=IngestTask.DONE).order_by('chunk', 'pk')
+    if codes is not None:
+        tasks = tasks.filter(indicator_id__in=codes)
+    chunks = {}
+    for chunk, code, years in tasks.values_list('chunk', 'indicator_id', 'years'):
+        chunks.setdefault(chunk, ([], years))[0].append(code)
+    return list(chunks.values())
+
+
+def task_done(run, code, values_written, written_years):
+    IngestTask.objects.filter(run=run, indicator_id=code).update(
+        status=IngestTask.DONE, attempts=F('attempts') + 1, error='',
+        values_written=values_written, written_years=sorted(written_years)
+    )
+
+
+def task_failed(run, code, error):
+    IngestTask.objects.filter(run=run, indicator_id=code).update(
+        status=IngestTask.FAILED, attempts=F('attempts') + 1, error=error
+    )
+
+
+def touched_years(run):
+    """{indicator code: years} written by ``run`` whose aggregates are not computed yet"""
+    tasks = run.tasks.filter(status=IngestTask.DONE, aggregated=False)
+    return {code: set(years) for code, years in tasks.values_list('indicator_id', 'written_years') if years}
+
+
+def tasks_aggregated(run):
+    run.tasks.filter(status=IngestTask.DONE, aggregated=False).update(aggregated=True)
+
+
+def values_written(run):
+    return sum(run.tasks.values_list('values_written', flat=True))
+
+
+def finish_run(run):
+    """Mark the run done, or failed if any task failed; returns the number of failed tasks"""
+    failed = run.tasks.exclude(status=IngestTask.DONE).count()
+    run.status = IngestRun.FAILED if failed else IngestRun.DONE
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'finished_at'])
+    return failed
@@ -0,0 +1,260 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from stats_comparison.exports import EXPORT_FORMATS
+from stats_comparison.models import Country, Indicator, IndicatorSync, StatisticValue
+from stats_comparison.snapshot import rebuild_snapshot
+from stats_comparison.synthetic import FakeWorldBank, seed_statistics
+from stats_comparison.versioning import bump_data_version
+from io import StringIO
+from unittest import mock
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ('startup', 'ingest', 'index', 'api', 'export')
+
+# What a worker boot or a management command imports: the apps and the URLconf with its views
+STARTUP_CODE = 'import django; django.setup(); import stats_comparison.urls'
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the ingest and read paths against a seeded throwaway database and '
+        'prints the timings and query counts as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--countries',
+            type=int,
+            default=200,
+            help='Countries in the seeded table (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--indicators',
+            type=int,
+            default=20,
+            help='Indicators in the seeded table (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=60,
+            help='Years in the seeded table (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=SCENARIOS,
+            default=list(SCENARIOS),
+            help='Scenarios to run (default: all)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Timed runs per measurement; the minimum and median are reported (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='--workers passed to fetch_worldbank_data in the ingest scenario (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_true',
+            help='Read from the database instead of the snapshot'
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the JSON results to this file'
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = max(1, options['repeat'])
+        workdir = self.workdir = tempfile.mkdtemp(prefix='benchmark-')
+        # Nothing may connect to the real database: a connection left open here
+        # would be reused, and on SQLite opening it creates the database file
+        connection.close()
+        if connection.vendor == 'sqlite':
+            # A file database, so the numbers include real disk I/O
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Keep snapshots, exports and API responses of the benchmark away from the real ones
+        benchmark_settings = override_settings(
+            SNAPSHOT_DIR=None if options['no_snapshot'] else os.path.join(workdir, 'snapshot'),
+            EXPORT_CACHE_DIR=os.path.join(workdir, 'exports'),
+            WB_CACHE_DIR=None,
+            INGEST_METRICS_FILE=None,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+        benchmark_settings.enable()
+        cache.clear()
+
+        results = []
+        try:
+            if 'startup' in options['scenarios']:
+                results.append(self.startup())
+            if 'ingest' in options['scenarios']:
+                results.append(self.ingest(options))
+
+            reads = [scenario for scenario in options['scenarios'] if scenario not in ('startup', 'ingest')]
+            if reads:
+                self.clear_data()
+                count = seed_statistics(options['countries'], options['indicators'], options['years'])
+                version = bump_data_version()
+                if settings.SNAPSHOT_DIR:
+                    rebuild_snapshot(version)
+                self.stderr.write(f'Seeded {count} values')
+                client = Client()
+                for scenario in reads:
+                    results.extend(getattr(self, scenario)(client))
+        finally:
+            benchmark_settings.disable()
+            cache.clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        for result in results:
+            self.stderr.write(
+                f"{result['name']:28} {result['seconds_median'] * 1000:>10.1f} ms  "
+                f"{result['queries']:>6} queries"
+            )
+        report = json.dumps({
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'scale': {key: options[key] for key in ('countries', 'indicators', 'years')},
+            'snapshot': not options['no_snapshot'],
+            'repeat': self.repeat,
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        self.stdout.write(report)
+
+    def measure(self, name, func, setup=None):
+        """Time ``func`` over --repeat runs and count the queries of the last run"""
+        timings = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                extra = func() or {}
+                timings.append(time.perf_counter() - started)
+        return {
+            'name': name,
+            'seconds_min': min(timings),
+            'seconds_median': statistics.median(timings),
+            'queries': len(queries.captured_queries),
+            'query_seconds': sum(float(query['time']) for query in queries.captured_queries),
+            **extra,
+        }
+
+    def clear_data(self):
+        StatisticValue.objects.all().delete()
+        IndicatorSync.objects.all().delete()
+        Indicator.objects.all().delete()
+        Country.objects.all().delete()
+
+    def startup(self):
+        """A fresh interpreter setting up Django and importing the URLconf, as a worker does on boot"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'worldbank_stats.settings', 'PRELOAD_MODULES': ''}
+
+        def run():
+            subprocess.run([sys.executable, '-c', STARTUP_CODE], cwd=settings.BASE_DIR, env=env, check=True)
+
+        return self.measure('startup', run)
+
+    def ingest(self, options):
+        """Full ingest of --indicators synthetic series from an in-process fake API"""
+        series = [
+            {'id': f'SYN.{i:04d}', 'value': f'Synthetic indicator {i:04d}'}
+            for i in range(options['indicators'])
+        ]
+        fake = FakeWorldBank(
+            economies=[
+                {'id': f'{i:03d}', 'value': f'Country {i:03d}', 'region': f'Region {i % 7}'}
+                for i in range(options['countries'])
+            ],
+            series=series
+        )
+        catalog = os.path.join(self.workdir, 'catalog.json')
+        with open(catalog, 'w') as f:
+            json.dump({'series': [{'code': s['id'], 'name': s['value']} for s in series]}, f)
+        first_year = 2024 - options['years']
+
+        def run():
+            with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', fake):
+                call_command(
+                    'fetch_worldbank_data', '--catalog', catalog, '--rate', '1000000',
+                    '--workers', str(options['workers']), '--start-year', str(first_year), '--end-year', '2023',
+                    '--no-cache', stdout=StringIO()
+                )
+            return {'values': StatisticValue.objects.count()}
+
+        return self.measure('ingest', run, setup=self.clear_data)
+
+    def response_size(self, response):
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        response.close()
+        return {'status': response.status_code, 'bytes': size}
+
+    def index(self, client):
+        """Comparison POST of two indicators across every country, without and with a cached plot"""
+        form = {
+            'indicator1': 'SYN.0000',
+            'indicator2': 'SYN.0001',
+            'countries': list(Country.objects.values_list('code', flat=True)),
+        }
+        post = lambda: self.response_size(client.post(reverse('stats_comparison:index'), form))
+        return [
+            self.measure('index_post_cold', post, setup=cache.clear),
+            self.measure('index_post_warm', post),
+        ]
+
+    def api(self, client):
+        """First JSON page of the PowerBI API and the full table streamed as NDJSON"""
+        url = reverse('stats_comparison:powerbi_api')
+        page = {'page_size': settings.API_PAGE_SIZE}
+        return [
+            self.measure('powerbi_api_page', lambda: self.response_size(client.get(url, page))),
+            self.measure('powerbi_api_ndjson', lambda: self.response_size(client.get(url, {'stream': 'ndjson'}))),
+        ]
+
+    def export(self, client):
+        """Each export format rendered from scratch, then served from its stored file"""
+        url = reverse('stats_comparison:export_powerbi')
+        clear_artifacts = lambda: shutil.rmtree(settings.EXPORT_CACHE_DIR, ignore_errors=True)
+        results = []
+        for export_format in sorted(EXPORT_FORMATS):
+            get = lambda: self.response_size(client.get(url, {'format': export_format}))
+            results.append(self.measure(f'export_{export_format}_cold', get, setup=clear_artifacts))
+            results.append(self.measure(f'export_{export_format}_warm', get))
+        return results
+
+    def commit(self):
+        """Current git commit, so results can be compared across commits"""
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
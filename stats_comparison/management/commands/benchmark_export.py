@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from stats_comparison.exports import EXPORT_FORMATS, export_file, stream_export_csv
+from stats_comparison.models import Country, Indicator, StatisticValue
+from stats_comparison.queries import iter_rows
+from stats_comparison.synthetic import seed_statistics
+import json
+import math
+import os
+import resource
+import tempfile
+import time
+
+# Shape of the synthetic table; the number of indicators is derived from --rows
+BENCHMARK_COUNTRIES = 200
+BENCHMARK_YEARS = 50
+
+
+class Command(BaseCommand):
+    help = 'Measures peak memory of each export format against the number of rows (Unix only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help='Approximate table sizes to benchmark (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--formats',
+            nargs='+',
+            choices=sorted(EXPORT_FORMATS),
+            default=sorted(EXPORT_FORMATS),
+            help='Export formats to benchmark (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_export only supports the SQLite backend')
+        
+        # Seed a throwaway file database so the real data is never touched and
+        # forked children can open their own connection to it
+        workdir = tempfile.mkdtemp(prefix='export-benchmark-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        results = []
+        try:
+            for rows in sorted(options['rows']):
+                StatisticValue.objects.all().delete()
+                Country.objects.all().delete()
+                Indicator.objects.all().delete()
+                indicators = max(1, math.ceil(rows / (BENCHMARK_COUNTRIES * BENCHMARK_YEARS)))
+                count = seed_statistics(BENCHMARK_COUNTRIES, indicators, BENCHMARK_YEARS)
+                connections.close_all()
+
+                for export_format in options['formats']:
+                    result = self.measure(export_format)
+                    result['rows'] = count
+                    results.append(result)
+                    self.stderr.write(
+                        f"{export_format:8} {count:>9} rows  "
+                        f"peak +{result['peak_rss_kb']:>8} KB  {result['seconds']:.2f}s"
+                        + (f"  ({result['error']})" if result.get('error') else '')
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(workdir)
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def measure(self, export_format):
+        """Run one export in a forked child and report its RSS growth"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            result = {'format': export_format}
+            try:
+                baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                started = time.perf_counter()
+                rows = iter_rows(StatisticValue.objects.all())
+                if export_format == 'csv':
+                    with open(os.devnull, 'w') as sink:
+                        for chunk in stream_export_csv(rows):
+                            sink.write(chunk)
+                else:
+                    export_file(rows, export_format).close()
+                result['seconds'] = time.perf_counter() - started
+                result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+            except Exception as e:
+                result.update(seconds=0.0, peak_rss_kb=0, error=str(e))
+            with os.fdopen(write_fd, 'w') as pipe:
+                pipe.write(json.dumps(result))
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            result = json.loads(pipe.read())
+        os.waitpid(pid, 0)
+        return result
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from stats_comparison.aggregates import compute_aggregates
+from stats_comparison.snapshot import rebuild_snapshot
+from stats_comparison.versioning import bump_data_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes every regional and income-group aggregate; fetch_worldbank_data '
+        'already keeps them up to date for the data it writes'
+    )
+
+    def handle(self, *args, **options):
+        written = compute_aggregates()
+        version = bump_data_version()
+        # Views fall back to the database until a snapshot of the new version exists
+        if settings.SNAPSHOT_DIR:
+            rebuild_snapshot(version)
+        self.stdout.write(self.style.SUCCESS(f'Saved {written} aggregates (data version {version})'))
@@ -1,12 +1,33 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 import wbgapi as wb
-from stats_comparison.models import Country, Indicator, StatisticValue
+from stats_comparison.models import Country, Indicator, IndicatorSync
+from stats_comparison.ingest import (
+    DEFAULT_BATCH_SIZE, changed_values, parse_last_updated, record_sync, split_series_frame,
+    tidy_indicator_frame, upsert_countries, upsert_statistic_values, values_hash, years_to_fetch
+)
+from stats_comparison.aggregates import compute_aggregates
+from stats_comparison.catalog import DEFAULT_INDICATORS, chunked, load_catalog, resolve_catalog, series_metadata
+from stats_comparison.snapshot import get_snapshot, rebuild_snapshot
+from stats_comparison.versioning import bump_data_version, get_data_version
+from stats_comparison.ratelimit import AdaptiveRateLimiter, call_with_backoff, is_transient
+from stats_comparison.ledger import (
+    advance, finish_run, plan_tasks, resumable_run, start_run, task_done, task_failed, tasks_aggregated,
+    touched_years, unfinished_chunks, values_written
+)
+from stats_comparison.httpcache import ResponseCache, cached_queries
+from stats_comparison.instrumentation import PhaseTimer, collect, write_ingest_metrics
 from django.db import transaction
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 import time
 
 class Command(BaseCommand):
     help = 'Fetches data from World Bank API'
+    
+    # Called with (fraction done, message) as the ingest advances. Set by the
+    # background job runner, which raises from it to cancel the ingest.
+    progress = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -14,187 +35,454 @@ class Command(BaseCommand):
             action='store_true',
             help='Print detailed debugging information'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of rows written per bulk insert (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of API requests (chunks of series) run concurrently (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=1.0,
+            help='Maximum API requests per second across all workers (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--start-year',
+            type=int,
+            default=2019,
+            help='First year to fetch (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--end-year',
+            type=int,
+            default=2023,
+            help='Last year to fetch, inclusive (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--catalog',
+            help='JSON file of series, topics and searches to fetch (default: INDICATOR_CATALOG, '
+                 'else the built-in list)'
+        )
+        parser.add_argument(
+            '--topic',
+            action='append',
+            default=[],
+            help='Also fetch every series of this World Bank topic id (repeatable)'
+        )
+        parser.add_argument(
+            '--search',
+            action='append',
+            default=[],
+            help='Also fetch every series whose name matches this search (repeatable)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.WB_SERIES_PER_REQUEST,
+            help='Series requested per API call for data and metadata (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only fetch indicators and years that are new or changed since the last sync'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue the last interrupted or failed run with its own years and mode, '
+                 'redoing only unfinished work'
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=2,
+            help='Extra rounds for indicators that failed with network or server errors (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--retry-delay',
+            type=float,
+            default=10.0,
+            help='Seconds before the first retry round, doubling for each further round (default: %(default)s)'
+        )
+        cache_mode = parser.add_mutually_exclusive_group()
+        cache_mode.add_argument(
+            '--offline',
+            action='store_true',
+            help='Serve every API request from the response cache, whatever its age, without using the network'
+        )
+        cache_mode.add_argument(
+            '--refresh',
+            action='store_true',
+            help='Fetch every API request again and overwrite the response cache'
+        )
+        cache_mode.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Neither read nor write the response cache'
+        )
+
+    def report(self, fraction, message):
+        if self.progress is not None:
+            self.progress(fraction, message)
+
+    def indicator_catalog(self, options, limiter):
+        """(code, name or None) of every indicator to fetch"""
+        path = options['catalog'] or settings.INDICATOR_CATALOG
+        try:
+            spec = load_catalog(path) if path else {'series': DEFAULT_INDICATORS, 'topics': [], 'search': []}
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read indicator catalog {path}: {e}')
+        spec['topics'] = spec['topics'] + options['topic']
+        spec['search'] = spec['search'] + options['search']
+        return resolve_catalog(
+            spec, lambda **listing: call_with_backoff(limiter, lambda: list(wb.series.list(**listing)))
+        )
 
     def debug_print(self, message, debug_enabled):
         if debug_enabled:
             self.stdout.write(self.style.SUCCESS(message))
 
+    def response_cache(self, options):
+        """The API response cache selected by settings and flags, or None"""
+        if options['no_cache'] or not settings.WB_CACHE_DIR:
+            if options['offline']:
+                raise CommandError('--offline needs the response cache (WB_CACHE_DIR)')
+            return None
+        mode = 'offline' if options['offline'] else 'refresh' if options['refresh'] else 'default'
+        return ResponseCache(
+            settings.WB_CACHE_DIR,
+            ttl=settings.WB_CACHE_TTL,
+            max_bytes=settings.WB_CACHE_MAX_BYTES,
+            mode=mode
+        )
+
     def handle(self, *args, **options):
+        if options['rate'] <= 0:
+            raise CommandError('--rate must be greater than 0')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be a positive integer')
+        if options['retries'] < 0:
+            raise CommandError('--retries must not be negative')
+        cache = self.response_cache(options)
+        with cached_queries(cache) if cache else nullcontext(), collect() as collector:
+            phases = PhaseTimer(collector)
+            try:
+                self.ingest(phases, **options)
+            finally:
+                phases.stop()
+        if cache:
+            self.stdout.write(f'API response cache: {cache.hits} hits, {cache.misses} requests sent')
+        
+        self.stdout.write('\nPhase timings:')
+        for name, seconds, queries in phases.phases:
+            self.stdout.write(f'  {name}: {seconds:.2f}s, {queries} queries')
+        if settings.INGEST_METRICS_FILE:
+            write_ingest_metrics(phases.phases, settings.INGEST_METRICS_FILE)
+
+    def ingest(self, phases, **options):
         debug = options.get('debug', False)
+        batch_size = options['batch_size']
+        workers = max(1, options['workers'])
+        if options['resume']:
+            run = resumable_run()
+            if run is None:
+                raise CommandError('There is no interrupted or failed ingest run to resume')
+            # A resumed run keeps the years and mode it was started with
+            self.stdout.write(f"Resuming ingest run {run.pk} after step '{run.stage or 'none'}'")
+        else:
+            if options['end_year'] < options['start_year']:
+                raise CommandError('--end-year must not be before --start-year')
+            run = start_run({
+                'start_year': options['start_year'],
+                'end_year': options['end_year'],
+                'incremental': options['incremental'],
+                'chunk_size': max(1, options['chunk_size']),
+            })
+        incremental = run.options['incremental']
+        chunk_size = run.options['chunk_size']
+        years = list(range(run.options['start_year'], run.options['end_year'] + 1))
         
         # Step 1: Fetch and save countries
+        phases.start('countries')
+        self.report(0.0, 'Fetching countries')
         self.stdout.write('Step 1: Fetching countries...')
-        try:
-            countries = list(wb.economy.list())  # Convert generator to list
-            self.debug_print(f"Retrieved {len(countries)} countries from API", debug)
+        if run.reached('countries'):
+            self.stdout.write('Countries already saved by this run')
+        else:
+            try:
+                countries = list(wb.economy.list())  # Convert generator to list
+                self.debug_print(f"Retrieved {len(countries)} countries from API", debug)
+                
+                with transaction.atomic():
+                    country_count, countries_changed, countries_regrouped = upsert_countries(
+                        countries, batch_size=batch_size
+                    )
+                    advance(
+                        run, 'countries',
+                        countries_changed=countries_changed, countries_regrouped=countries_regrouped
+                    )
+                
+                self.stdout.write(self.style.SUCCESS(
+                    f'Successfully saved {country_count} countries ({countries_changed} new or changed)'
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Failed to fetch countries: {str(e)}'))
+                return
+
+        # Shared by all fetch threads; replaces the fixed sleep between requests
+        limiter = AdaptiveRateLimiter(rate=options['rate'])
+        
+        # Step 2: Resolve the indicator catalog and save indicator metadata
+        phases.start('indicators')
+        self.report(0.05, 'Saving indicators')
+        self.stdout.write('\nStep 2: Saving indicators...')
+        if run.reached('indicators'):
+            self.stdout.write(f'{len(run.indicators)} indicators already saved by this run')
+        else:
+            indicators = self.indicator_catalog(options, limiter)
+            self.stdout.write(f'{len(indicators)} indicators in the catalog')
+            existing_indicators = set(Indicator.objects.values_list('code', flat=True))
+            known_indicators = existing_indicators if incremental else set()
+            missing = [(code, name) for code, name in indicators if code not in known_indicators]
             
-            country_count = 0
-            with transaction.atomic():
-                for country in countries:
+            def fetch_metadata(codes):
+                # One request for the metadata of a whole chunk of series
+                return series_metadata(call_with_backoff(limiter, lambda: list(wb.series.metadata.fetch(codes) or [])))
+            
+            metadata = {}
+            failed = set()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(fetch_metadata, codes): codes
+                    for codes in chunked([code for code, name in missing], chunk_size)
+                }
+                for future in as_completed(futures):
                     try:
-                        # Skip aggregate regions and other non-country entries
-                        # Check for both prefix and specific conditions
-                        is_country = (
-                            # Not starting with region/aggregate prefixes
-                            not any(country['id'].startswith(prefix) for prefix in 
-                                 ('REG', 'INX', 'EMU', 'EAS', 'ECS', 'EUU', 'ARB', 'CEB', 'CSS', 'EAP', 
-                                  'ECA', 'EAR', 'FCS', 'HIC', 'HPC', 'IBD', 'IBT', 'IDA', 'IDB', 'IDX', 
-                                  'LAC', 'LCN', 'LDC', 'LIC', 'LMC', 'LMY', 'LTE', 'MEA', 'MIC', 'MNA', 
-                                  'NAC', 'OED', 'OSS', 'PRE', 'PSS', 'PST', 'SAS', 'SSA', 'SSF', 'SST', 
-                                  'TEA', 'TEC', 'TLA', 'TMN', 'TSA', 'TSS', 'UMC', 'WLD')) and
-                            # Must be exactly 3 characters (standard country code length)
-                            len(country['id']) == 3 and
-                            # Must have a proper region assigned
-                            country.get('region', 'Unknown') != 'Unknown' and
-                            # Additional checks for specific cases
-                            not any(x in country['value'].lower() for x in ['region', 'union', 'income', 'aggregate'])
-                        )
-                        
-                        if is_country:
-                            Country.objects.update_or_create(
-                                code=country['id'],
-                                defaults={
-                                    'name': country['value'],
-                                    'region': country.get('region', 'Unknown')
-                                }
-                            )
-                            country_count += 1
-                            if debug:
-                                self.debug_print(f"Saved country: {country['id']} - {country['value']}", debug)
+                        metadata.update(future.result())
                     except Exception as e:
-                        self.stdout.write(self.style.WARNING(f"Error saving country {country.get('id', 'Unknown')}: {str(e)}"))
+                        failed.update(futures[future])
+                        self.stdout.write(self.style.ERROR(
+                            f'Error fetching metadata of {len(futures[future])} indicators: {str(e)}'
+                        ))
             
-            self.stdout.write(self.style.SUCCESS(f'Successfully saved {country_count} countries'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Failed to fetch countries: {str(e)}'))
-            return
+            # Database writes stay on this thread. Indicators without metadata are still
+            # saved so their values can be, but existing descriptions are not blanked.
+            rows = []
+            for code, name in missing:
+                if code in failed and code in existing_indicators:
+                    continue
+                title, description = metadata.get(code, (None, ''))
+                rows.append(Indicator(code=code, name=(name or title or code)[:255], description=description or ''))
+            with transaction.atomic():
+                Indicator.objects.bulk_create(
+                    rows,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=['code'],
+                    update_fields=['name', 'description']
+                )
+                advance(run, 'indicators', indicators=[code for code, name in indicators], indicators_saved=len(rows))
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully saved {len(rows)} indicators ({len(known_indicators)} already known)'
+            ))
+        saved_indicators = run.indicators_saved
+        names = dict(Indicator.objects.values_list('code', 'name'))
 
-        # Step 2: Define and save indicators
-        indicators = [
-            # Economic indicators
-            ('NY.GDP.PCAP.CD', 'GDP per capita (current US$)'),
-            ('NY.GDP.MKTP.KD.ZG', 'GDP growth (annual %)'),
-            ('FP.CPI.TOTL.ZG', 'Inflation, consumer prices (annual %)'),
-            ('NE.EXP.GNFS.ZS', 'Exports of goods and services (% of GDP)'),
-            ('BX.KLT.DINV.WD.GD.ZS', 'Foreign direct investment, net inflows (% of GDP)'),
-            ('GC.DOD.TOTL.GD.ZS', 'Central government debt (% of GDP)'),
+        # Step 3: Fetch and save statistical values
+        phases.start('values')
+        self.report(0.1, 'Fetching statistical values')
+        self.stdout.write('\nStep 3: Fetching statistical values...')
+        country_codes = set(Country.objects.values_list('code', flat=True))
+        syncs = {sync.indicator_id: sync for sync in IndicatorSync.objects.all()}
+        
+        if not run.reached('planned'):
+            try:
+                source_last_updated = parse_last_updated(call_with_backoff(limiter, wb.source.get))
+            except Exception as e:
+                source_last_updated = None
+                self.stdout.write(self.style.WARNING(f'Could not read source update date: {str(e)}'))
+            self.debug_print(f"Source last updated: {source_last_updated}", debug)
             
-            # Social indicators
-            ('SP.POP.TOTL', 'Population, total'),
-            ('SP.DYN.LE00.IN', 'Life expectancy at birth (years)'),
-            ('SE.TER.ENRR', 'School enrollment, tertiary (% gross)'),
-            ('SL.UEM.TOTL.ZS', 'Unemployment, total (% of total labor force)'),
-            ('SI.POV.GINI', 'GINI index'),
-            ('SH.XPD.CHEX.GD.ZS', 'Current health expenditure (% of GDP)'),
-            ('SP.URB.TOTL.IN.ZS', 'Urban population (% of total)'),
+            plan = {}
+            for code in run.indicators:
+                fetch_years = years_to_fetch(syncs.get(code), years, source_last_updated) if incremental else years
+                if fetch_years:
+                    plan[code] = fetch_years
+                else:
+                    self.debug_print(f"{code} is up to date", debug)
+            if incremental:
+                self.stdout.write(f'{len(plan)} of {len(run.indicators)} indicators need fetching')
             
-            # Environmental indicators
-            ('EN.ATM.CO2E.PC', 'CO2 emissions (metric tons per capita)'),
-            ('EG.USE.PCAP.KG.OE', 'Energy use (kg of oil equivalent per capita)'),
-            ('ER.FST.TOTL.ZS', 'Forest area (% of land area)'),
-            ('EG.ELC.ACCS.ZS', 'Access to electricity (% of population)'),
-            ('EN.POP.DNST', 'Population density (people per sq. km)'),
-        ]
+            # Series needing the same years share requests of up to --chunk-size series
+            by_years = {}
+            for code, fetch_years in plan.items():
+                by_years.setdefault(tuple(fetch_years), []).append(code)
+            with transaction.atomic():
+                plan_tasks(run, [
+                    (codes, list(fetch_years))
+                    for fetch_years, group in by_years.items()
+                    for codes in chunked(group, chunk_size)
+                ], batch_size=batch_size)
+                advance(run, 'planned', source_last_updated=source_last_updated)
+        source_last_updated = run.source_last_updated
         
-        self.stdout.write('\nStep 2: Saving indicators...')
-        saved_indicators = 0
-        for code, name in indicators:
+        def fetch_series(codes, fetch_years):
+            return split_series_frame(
+                call_with_backoff(
+                    limiter, wb.data.DataFrame, codes, time=fetch_years, index=['economy', 'series'], columns='time'
+                ),
+                codes
+            )
+        
+        def fetch_values(codes, fetch_years):
+            # Runs on a worker thread: network and pandas only, no database access.
+            # Returns {code: (raw data, tidy values) or the exception that stopped it}.
             try:
-                indicator_info = wb.series.get(code)
-                Indicator.objects.update_or_create(
-                    code=code,
-                    defaults={
-                        'name': name,
-                        'description': indicator_info.get('sourceNote', '')
-                    }
-                )
-                saved_indicators += 1
-                self.debug_print(f"Saved indicator: {code}", debug)
+                frames = fetch_series(codes, fetch_years)
             except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error saving indicator {code}: {str(e)}'))
+                if len(codes) == 1:
+                    return {codes[0]: e}
+                # One bad series must not cost the rest of the chunk its data
+                frames = {}
+                for code in codes:
+                    try:
+                        frames.update(fetch_series([code], fetch_years))
+                    except Exception as e:
+                        frames[code] = e
+            return {
+                code: data if isinstance(data, Exception) else (data, tidy_indicator_frame(data, country_codes))
+                for code, data in frames.items()
+            }
         
-        self.stdout.write(self.style.SUCCESS(f'Successfully saved {saved_indicators} indicators'))
-
-        # Step 3: Fetch and save statistical values
-        self.stdout.write('\nStep 3: Fetching statistical values...')
         total_values = 0
-        years = list(range(2019, 2024))
+        chunks = [] if run.reached('values') else unfinished_chunks(run)
+        total_tasks = sum(len(codes) for codes, fetch_years in chunks)
+        processed = 0
+        retry = 0
+        while chunks:
+            if retry:
+                delay = options['retry_delay'] * 2 ** (retry - 1)
+                count = sum(len(codes) for codes, fetch_years in chunks)
+                self.stdout.write(
+                    f'\nRetrying {count} indicators in {delay:g}s (retry {retry} of {options["retries"]})'
+                )
+                time.sleep(delay)
+            # Indicators that failed in a way worth another try this round
+            transient = set()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(fetch_values, codes, fetch_years): (codes, fetch_years)
+                    for codes, fetch_years in chunks
+                }
+                # This thread is the single writer, so SQLite never sees competing write locks
+                try:
+                    for future in as_completed(futures):
+                        results = future.result()
+                        codes, fetch_years = futures[future]
+                        # A chunk's values, sync records and ledger entries are committed together
+                        with transaction.atomic():
+                            for code in codes:
+                                name = names.get(code, code)
+                                try:
+                                    self.stdout.write(f'\nProcessing {name}...')
+                                    if isinstance(results[code], Exception):
+                                        raise results[code]
+                                    data, values = results[code]
+                                    self.debug_print(f"Raw data shape: {data.shape}", debug)
+                                    
+                                    if debug:
+                                        self.stdout.write("Sample of raw data:")
+                                        self.stdout.write(str(data.head()))
+                                    
+                                    self.debug_print(f"Tidy rows for {code}: {len(values)}", debug)
+                                    
+                                    sync = syncs.get(code)
+                                    if incremental:
+                                        # The stored hash covers the synced range, so only a fetch of
+                                        # exactly that range can be compared with it
+                                        if (
+                                            sync is not None and
+                                            fetch_years == list(range(sync.start_year, sync.end_year + 1)) and
+                                            values_hash(values) == sync.content_hash
+                                        ):
+                                            values = values.iloc[:0]
+                                        else:
+                                            values = changed_values(code, values)
+                                        self.debug_print(f"Changed rows for {code}: {len(values)}", debug)
+                                    
+                                    # Savepoint, so a failed write leaves the rest of the chunk intact
+                                    with transaction.atomic():
+                                        saved = upsert_statistic_values(code, values, batch_size=batch_size)
+                                        record_sync(code, years, source_last_updated, previous=sync)
+                                        task_done(run, code, saved, set(values['year'].tolist()))
+                                    total_values += saved
+                                    self.stdout.write(f'Saved {saved} values ({total_values} total)')
+                                    
+                                    self.stdout.write(self.style.SUCCESS(f'Completed processing {name}'))
+                                    
+                                except Exception as e:
+                                    task_failed(run, code, str(e))
+                                    if is_transient(e):
+                                        transient.add(code)
+                                    self.stdout.write(self.style.ERROR(f'Error processing indicator {code}: {str(e)}'))
+                        processed += len(codes)
+                        self.report(
+                            0.1 + 0.8 * min(processed / total_tasks, 1.0),
+                            f'Processed {processed} of {total_tasks} indicators'
+                        )
+                except BaseException:
+                    # Do not start the fetches still queued, e.g. when a background job is cancelled
+                    pool.shutdown(cancel_futures=True)
+                    raise
+            retry += 1
+            chunks = unfinished_chunks(run, transient) if transient and retry <= options['retries'] else []
+        if not run.reached('values') and not unfinished_chunks(run):
+            advance(run, 'values')
         
-        for code, name in indicators:
-            try:
-                self.stdout.write(f'\nProcessing {name}...')
-                
-                # Add delay to avoid rate limiting
-                time.sleep(2)  # Increased delay to 2 seconds
-                
-                # Fetch data for current indicator
-                data = wb.data.DataFrame(code, time=years)
-                self.debug_print(f"Raw data shape: {data.shape}", debug)
-                
-                if debug:
-                    self.stdout.write("Sample of raw data:")
-                    self.stdout.write(str(data.head()))
-                
-                # Convert the data to a format that's easier to work with
-                df_melted = data.reset_index().melt(
-                    id_vars=['economy'],
-                    var_name='year',
-                    value_name='value'
+        # Recompute regional and income-group aggregates of the indicator-years this run
+        # changed, including values written before an interruption; countries that moved
+        # to another group change every aggregate of their old and new groups
+        touched = touched_years(run)
+        if touched or run.countries_regrouped:
+            phases.start('aggregates')
+            self.report(0.9, 'Computing aggregates')
+            self.stdout.write('\nComputing aggregates...')
+            with transaction.atomic():
+                aggregates = compute_aggregates(
+                    None if run.countries_regrouped else touched, batch_size=batch_size
                 )
-                
-                with transaction.atomic():
-                    # Process each row in the melted DataFrame
-                    for _, row in df_melted.iterrows():
-                        country_code = row['economy']
-                        year_str = row['year']
-                        value = row['value']
-                        
-                        try:
-                            # Get the country object
-                            country = Country.objects.filter(code=country_code).first()
-                            if country:
-                                # Extract year from YR2019 format
-                                year = int(str(year_str).replace('YR', ''))
-                                
-                                # Check if value is not NaN and can be converted to float
-                                if pd.notna(value):
-                                    try:
-                                        value_float = float(value)
-                                        
-                                        # Create or update the statistic value
-                                        stat_value, created = StatisticValue.objects.update_or_create(
-                                            country=country,
-                                            indicator_id=code,
-                                            year=year,
-                                            defaults={'value': value_float}
-                                        )
-                                        
-                                        if created or stat_value.value != value_float:
-                                            total_values += 1
-                                            if debug:
-                                                self.debug_print(
-                                                    f"Saved value for {country_code}, {year}: {value_float}",
-                                                    debug
-                                                )
-                                            
-                                            if total_values % 100 == 0:
-                                                self.stdout.write(f'Saved {total_values} values...')
-                                    except (ValueError, TypeError) as e:
-                                        self.debug_print(
-                                            f"Could not convert value '{value}' to float for "
-                                            f"{country_code}, {year}: {str(e)}", debug
-                                        )
-                        except Exception as e:
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'Error processing {country_code}, {year_str}: {str(e)}'
-                                )
-                            )
-                
-                self.stdout.write(self.style.SUCCESS(f'Completed processing {name}'))
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error processing indicator {code}: {str(e)}'))
+                tasks_aggregated(run)
+            self.stdout.write(f'Saved {aggregates} aggregates')
+        
+        # Invalidate cached comparison results
+        phases.start('snapshot')
+        self.report(0.95, 'Rebuilding snapshot')
+        version = get_data_version()
+        total_values = values_written(run)
+        # Country names and regions appear in cached pages and metadata too
+        if total_values or saved_indicators or run.countries_changed:
+            version = bump_data_version()
+            self.debug_print(f"Data version is now {version}", debug)
+        
+        # Rebuild the analytics snapshot when the data changed or it is missing
+        if settings.SNAPSHOT_DIR and get_snapshot(version) is None:
+            self.stdout.write('\nRebuilding analytics snapshot...')
+            snapshot = rebuild_snapshot(version)
+            self.debug_print(f"Snapshot rows: {len(snapshot)}", debug)
+        
+        phases.stop()
+        failed = finish_run(run)
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'\n{failed} indicators failed; run again with --resume to retry only those'
+            ))
         
         # Final report
         self.stdout.write('\nFinal Statistics:')
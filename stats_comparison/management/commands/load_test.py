@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ThreadPoolExecutor
+import json
+import statistics
+import threading
+import time
+import requests
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures concurrent throughput of running deployments, e.g. the WSGI '
+        'server against the ASGI server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='+',
+            help='Full URLs to compare, e.g. http://127.0.0.1:8000/ http://127.0.0.1:8001/async/'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='Number of simultaneous clients (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Total requests sent to each URL (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--post',
+            action='append',
+            default=[],
+            metavar='KEY=VALUE',
+            help='Send a POST with this form field instead of a GET; repeat for more fields'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30.0,
+            help='Per-request timeout in seconds (default: %(default)s)'
+        )
+
+    def handle(self, *args, **options):
+        form = []
+        for item in options['post']:
+            if '=' not in item:
+                raise CommandError(f'--post expects KEY=VALUE, got {item!r}')
+            form.append(tuple(item.split('=', 1)))
+
+        results = [self.run(url, form, options) for url in options['urls']]
+        for result in results:
+            self.stderr.write(
+                f"{result['url']}: {result['requests_per_second']:.1f} req/s, "
+                f"p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms, "
+                f"{result['errors']} errors"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run(self, url, form, options):
+        """Send the requests to one URL from ``concurrency`` threads"""
+        local = threading.local()
+
+        def send(_):
+            started = time.perf_counter()
+            try:
+                # One keep-alive session per client thread
+                session = getattr(local, 'session', None)
+                if session is None:
+                    session = local.session = requests.Session()
+                    if form:
+                        # Pick up the CSRF cookie the way a browser would
+                        session.get(url, timeout=options['timeout'])
+                    started = time.perf_counter()
+                if form:
+                    response = session.post(
+                        url,
+                        data=form,
+                        headers={'X-CSRFToken': session.cookies.get('csrftoken', ''), 'Referer': url},
+                        timeout=options['timeout']
+                    )
+                else:
+                    response = session.get(url, timeout=options['timeout'])
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return ok, time.perf_counter() - started
+
+        concurrency = max(1, options['concurrency'])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(seconds * 1000 for _, seconds in outcomes)
+        return {
+            'url': url,
+            'concurrency': concurrency,
+            'requests': len(outcomes),
+            'errors': sum(1 for ok, _ in outcomes if not ok),
+            'seconds': elapsed,
+            'requests_per_second': len(outcomes) / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) if latencies else 0.0,
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+        }
@@ -0,0 +1,81 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from stats_comparison.jobs import claim_next, retry_locked, run_job
+from stats_comparison.models import Job
+import os
+import socket
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs queued background jobs (exports and World Bank fetches), polling '
+        'the job table until stopped'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.JOB_WORKER_THREADS,
+            help='Jobs this worker runs at the same time (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds between looks at the job table (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no job is queued or running in this worker'
+        )
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker {worker} running up to {threads} jobs')
+        # Future -> id of the job it runs
+        active = {}
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as pool:
+            try:
+                while True:
+                    for future in [future for future in active if future.done()]:
+                        job = future.result()
+                        self.stdout.write(f'Job {job.pk} ({job.kind}) {job.status}: {job.message}')
+                        del active[future]
+
+                    # Long steps between progress reports must not look like a dead worker
+                    if active:
+                        retry_locked(lambda: Job.objects.filter(pk__in=active.values()).update(
+                            heartbeat_at=timezone.now()
+                        ))
+
+                    while len(active) < threads:
+                        job = claim_next(worker)
+                        if job is None:
+                            break
+                        self.stdout.write(f'Job {job.pk} ({job.kind}) started')
+                        active[pool.submit(self.run, job)] = job.pk
+
+                    if options['once'] and not active:
+                        break
+                    if active:
+                        wait(active, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                # Running jobs stop at their next progress report
+                retry_locked(lambda: Job.objects.filter(pk__in=active.values()).update(cancel_requested=True))
+                self.stdout.write('Stopping; cancelling running jobs')
+
+    def run(self, job):
+        # Runs on a pool thread, which has its own database connection
+        try:
+            return run_job(job)
+        finally:
+            connection.close()
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+
+from .models import Country, Indicator
+
+# Seconds a metadata document stays cached; documents are keyed by data
+# version, so they never go stale, they just stop being used
+METADATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+SEARCH_PAGE_SIZE = 50
+
+
+def build_metadata(version):
+    """Country and indicator lists for the selectors, without indicator descriptions"""
+    return {
+        'version': version,
+        'indicators': [list(row) for row in Indicator.objects.order_by('name').values_list('code', 'name')],
+        'countries': [list(row) for row in Country.objects.order_by('name').values_list('code', 'name', 'region')],
+    }
+
+
+def get_metadata(version):
+    """Selector metadata for ``version``, built at most once per version"""
+    key = f'metadata:v{version}'
+    metadata = cache.get(key)
+    if metadata is None:
+        metadata = build_metadata(version)
+        cache.set(key, metadata, METADATA_CACHE_TIMEOUT)
+    return metadata
+
+
+def search_options(metadata, kind, term='', page=1):
+    """Select2-style search over indicators or countries by code or name"""
+    rows = metadata['indicators'] if kind == 'indicator' else metadata['countries']
+    term = term.strip().lower()
+    if term:
+        rows = [row for row in rows if term in row[1].lower() or term in row[0].lower()]
+    start = (page - 1) * SEARCH_PAGE_SIZE
+    return {
+        'results': [{'id': row[0], 'text': row[1]} for row in rows[start:start + SEARCH_PAGE_SIZE]],
+        'pagination': {'more': start + SEARCH_PAGE_SIZE < len(rows)},
+    }
+
+
+def option_names(metadata, kind, codes):
+    """(code, name) pairs for the given codes, in the order given"""
+    names = {row[0]: row[1] for row in metadata['indicators' if kind == 'indicator' else 'countries']}
+    return [(code, names[code]) for code in codes if code in names]
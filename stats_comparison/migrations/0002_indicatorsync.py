@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats_comparison', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicatorSync',
+            fields=[
+                ('indicator', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync', serialize=False, to='stats_comparison.indicator')),
+                ('last_fetched', models.DateTimeField()),
+                ('start_year', models.IntegerField()),
+                ('end_year', models.IntegerField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('source_last_updated', models.DateField(null=True)),
+            ],
+        ),
+    ]
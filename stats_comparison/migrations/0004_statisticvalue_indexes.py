@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats_comparison', '0003_dataversion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='statisticvalue',
+            name='stats_compa_country_405f20_idx',
+        ),
+        migrations.AlterField(
+            model_name='statisticvalue',
+            name='country',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stats_comparison.country'),
+        ),
+        migrations.AlterField(
+            model_name='statisticvalue',
+            name='indicator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stats_comparison.indicator'),
+        ),
+        migrations.AddIndex(
+            model_name='statisticvalue',
+            index=models.Index(fields=['indicator', 'country', 'year'], name='stats_compa_indicat_3669a6_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats_comparison', '0004_statisticvalue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='income_level',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='GroupAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_type', models.CharField(choices=[('region', 'Region'), ('income', 'Income group')], max_length=10)),
+                ('group', models.CharField(max_length=100)),
+                ('year', models.IntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('weighted_count', models.PositiveIntegerField()),
+                ('mean', models.FloatField()),
+                ('median', models.FloatField()),
+                ('weighted_mean', models.FloatField(null=True)),
+                ('indicator', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stats_comparison.indicator')),
+            ],
+            options={
+                'unique_together': {('indicator', 'year', 'group_type', 'group')},
+            },
+        ),
+    ]
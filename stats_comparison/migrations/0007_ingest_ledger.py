@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats_comparison', '0006_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Finished with failures'), ('abandoned', 'Abandoned')], default='running', max_length=10)),
+                ('stage', models.CharField(blank=True, max_length=20)),
+                ('options', models.JSONField(default=dict)),
+                ('indicators', models.JSONField(default=list)),
+                ('indicators_saved', models.PositiveIntegerField(default=0)),
+                ('source_last_updated', models.DateField(null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngestTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk', models.PositiveIntegerField()),
+                ('years', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('values_written', models.PositiveIntegerField(default=0)),
+                ('written_years', models.JSONField(default=list)),
+                ('aggregated', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('indicator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stats_comparison.indicator')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='stats_comparison.ingestrun')),
+            ],
+            options={
+                'unique_together': {('run', 'indicator')},
+            },
+        ),
+    ]
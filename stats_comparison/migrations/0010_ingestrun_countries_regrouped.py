@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats_comparison', '0009_job_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestrun',
+            name='countries_regrouped',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
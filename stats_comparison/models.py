@@ -6,6 +6,8 @@ class Country(models.Model):
     code = models.CharField(max_length=3, primary_key=True)
     name = models.CharField(max_length=100)
     region = models.CharField(max_length=100)
+    # World Bank income group code, e.g. HIC; empty when unknown
+    income_level = models.CharField(max_length=10, blank=True, default='')
     
     def __str__(self):
         return self.name
@@ -19,13 +21,146 @@ class Indicator(models.Model):
         return self.name
 
 class StatisticValue(models.Model):
-    country = models.ForeignKey(Country, on_delete=models.CASCADE)
-    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE)
+    # No single-column indexes: both are the leading column of a composite index below
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, db_index=False)
+    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE, db_index=False)
     year = models.IntegerField()
     value = models.FloatField(null=True)
     
     class Meta:
+        # The unique constraint doubles as the (country, indicator, year) index
+        # used by keyset pagination; comparisons filter by indicator first
         unique_together = ('country', 'indicator', 'year')
         indexes = [
-            models.Index(fields=['country', 'indicator', 'year']),
+            models.Index(fields=['indicator', 'country', 'year']),
+        ]
+
+class IndicatorSync(models.Model):
+    """Bookkeeping for incremental ingest of one indicator"""
+    indicator = models.OneToOneField(Indicator, on_delete=models.CASCADE, primary_key=True, related_name='sync')
+    last_fetched = models.DateTimeField()
+    start_year = models.IntegerField()
+    end_year = models.IntegerField()
+    content_hash = models.CharField(max_length=64)
+    source_last_updated = models.DateField(null=True)
+
+    def covers(self, year):
+        return self.start_year <= year <= self.end_year
+
+class IngestRun(models.Model):
+    """Ledger of one fetch_worldbank_data run, so an interrupted run can be resumed"""
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    ABANDONED = 'abandoned'
+    STATUSES = [(RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Finished with failures'), (ABANDONED, 'Abandoned')]
+    # Steps of a run in order; ``stage`` is the last one completed
+    STAGES = ('countries', 'indicators', 'planned', 'values')
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=RUNNING)
+    stage = models.CharField(max_length=20, blank=True)
+    # start_year, end_year, incremental and chunk_size the run was started with
+    options = models.JSONField(default=dict)
+    # Indicator codes of the resolved catalog
+    indicators = models.JSONField(default=list)
+    indicators_saved = models.PositiveIntegerField(default=0)
+    countries_changed = models.PositiveIntegerField(default=0)
+    # Stored countries that moved to another region or income group; their aggregates are all recomputed
+    countries_regrouped = models.PositiveIntegerField(default=0)
+    source_last_updated = models.DateField(null=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def reached(self, stage):
+        return bool(self.stage) and self.STAGES.index(self.stage) >= self.STAGES.index(stage)
+
+class IngestTask(models.Model):
+    """The fetch of one indicator in an ingest run, requested together with the rest of its chunk"""
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    run = models.ForeignKey(IngestRun, on_delete=models.CASCADE, related_name='tasks')
+    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE)
+    chunk = models.PositiveIntegerField()
+    years = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    values_written = models.PositiveIntegerField(default=0)
+    # Years with written values, and whether their aggregates have been computed
+    written_years = models.JSONField(default=list)
+    aggregated = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('run', 'indicator')
+
+class DataVersion(models.Model):
+    """Single-row counter bumped whenever ingested data changes"""
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class GroupAggregate(models.Model):
+    """Summary of an indicator across the countries of a region or income group in one year"""
+    REGION = 'region'
+    INCOME = 'income'
+    GROUP_TYPES = [(REGION, 'Region'), (INCOME, 'Income group')]
+
+    group_type = models.CharField(max_length=10, choices=GROUP_TYPES)
+    group = models.CharField(max_length=100)
+    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE, db_index=False)
+    year = models.IntegerField()
+    # Countries with a value, and how many of those also have a population
+    count = models.PositiveIntegerField()
+    weighted_count = models.PositiveIntegerField()
+    mean = models.FloatField()
+    median = models.FloatField()
+    # Population-weighted mean; null when no country has a population that year
+    weighted_mean = models.FloatField(null=True)
+
+    class Meta:
+        # Indicator first: aggregates are always read and recomputed per indicator
+        unique_together = ('indicator', 'year', 'group_type', 'group')
+
+class Job(models.Model):
+    """Background work (exports, ingests) run by the run_jobs worker command"""
+    EXPORT = 'export'
+    FETCH = 'fetch'
+    KINDS = [(EXPORT, 'Export'), (FETCH, 'Fetch World Bank data')]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUSES = [
+        (QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'), (CANCELLED, 'Cancelled'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # Fraction done, 0 to 1, and a short human-readable note
+    progress = models.FloatField(default=0.0)
+    message = models.TextField(blank=True)
+    # File produced by the job, served by the download view
+    result_path = models.CharField(max_length=500, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    # Who queued the job, 'user:<id>' or 'session:<key>'; only they and staff may see it
+    owner = models.CharField(max_length=100, blank=True)
+    # host:pid of the run_jobs process running the job
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # Updated by the worker while the job runs; a stale heartbeat means the worker died
+    heartbeat_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
         ]
@@ -0,0 +1,185 @@
+import base64
+import csv
+import json
+
+from django.db.models import Q
+
+from .models import StatisticValue
+
+# Output column name -> ORM lookup, in the order rows are emitted
+API_FIELDS = {
+    'country': 'country__name',
+    'country_code': 'country_id',
+    'region': 'country__region',
+    'indicator': 'indicator__name',
+    'indicator_code': 'indicator_id',
+    'year': 'year',
+    'value': 'value',
+}
+
+# Keyset order; matches the (country, indicator, year) unique index
+KEYSET_ORDER = ('country_id', 'indicator_id', 'year')
+
+
+def list_param(params, name):
+    """Values of a query parameter given repeatedly and/or comma-separated"""
+    return [item for value in params.getlist(name) for item in value.split(',') if item]
+
+
+def int_param(params, name, default=None, minimum=None, maximum=None):
+    """Parse an optional integer query parameter, raising ValueError if invalid"""
+    raw = params.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"'{name}' must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        value = maximum
+    return value
+
+
+def statistics_filters(params):
+    """Indicator, country, region and year range filters of the data APIs; None where not given"""
+    return {
+        'indicator_codes': list_param(params, 'indicator') or None,
+        'country_codes': list_param(params, 'country') or None,
+        'regions': list_param(params, 'region') or None,
+        'start_year': int_param(params, 'start_year'),
+        'end_year': int_param(params, 'end_year'),
+    }
+
+
+def filter_statistics(params):
+    """StatisticValue queryset restricted by indicator, country, region and year range"""
+    filters = statistics_filters(params)
+    queryset = StatisticValue.objects.all()
+    if filters['indicator_codes']:
+        queryset = queryset.filter(indicator_id__in=filters['indicator_codes'])
+    if filters['country_codes']:
+        queryset = queryset.filter(country_id__in=filters['country_codes'])
+    if filters['regions']:
+        queryset = queryset.filter(country__region__in=filters['regions'])
+    if filters['start_year'] is not None:
+        queryset = queryset.filter(year__gte=filters['start_year'])
+    if filters['end_year'] is not None:
+        queryset = queryset.filter(year__lte=filters['end_year'])
+    return queryset
+
+
+def encode_cursor(country_code, indicator_code, year):
+    key = json.dumps([country_code, indicator_code, year])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        country_code, indicator_code, year = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(country_code), str(indicator_code), int(year)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid 'cursor'")
+
+
+def keyset_queryset(queryset, cursor=None, page_size=1000):
+    """Rows of the page after ``cursor``, plus one extra row to detect a next page.
+
+    Seeks on (country, indicator, year) instead of using OFFSET, so every page
+    costs the same regardless of how deep into the table it is.
+    """
+    queryset = queryset.order_by(*KEYSET_ORDER)
+    if cursor:
+        country_code, indicator_code, year = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(country_id__gt=country_code) |
+            Q(country_id=country_code, indicator_id__gt=indicator_code) |
+            Q(country_id=country_code, indicator_id=indicator_code, year__gt=year)
+        )
+    return queryset.values_list(*API_FIELDS.values())[:page_size + 1]
+
+
+def keyset_page(queryset, cursor=None, page_size=1000):
+    """Return one page of API rows after ``cursor`` and the cursor of the next page"""
+    rows = list(keyset_queryset(queryset, cursor, page_size))
+    return page_from_rows(rows, page_size)
+
+
+def page_from_rows(rows, page_size):
+    """Turn the rows of keyset_queryset() into (page of dicts, next cursor)"""
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = dict(zip(API_FIELDS, rows[-1]))
+        next_cursor = encode_cursor(last['country_code'], last['indicator_code'], last['year'])
+    return [dict(zip(API_FIELDS, row)) for row in rows], next_cursor
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Stream API rows as tuples without caching the queryset"""
+    return queryset.order_by(*KEYSET_ORDER).values_list(*API_FIELDS.values()).iterator(chunk_size=chunk_size)
+
+
+async def iter_rows_async(queryset, chunk_size=2000):
+    """Async variant of iter_rows() for async views.
+
+    Reads keyset pages of ``chunk_size`` rows, since values_list().aiterator()
+    cannot open a chunked cursor from an async context.
+    """
+    cursor = None
+    while True:
+        rows = [row async for row in keyset_queryset(queryset, cursor, chunk_size)]
+        for row in rows[:chunk_size]:
+            yield row
+        if len(rows) <= chunk_size:
+            break
+        last = dict(zip(API_FIELDS, rows[chunk_size - 1]))
+        cursor = encode_cursor(last['country_code'], last['indicator_code'], last['year'])
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+_csv_writer = csv.writer(_Echo())
+
+
+def csv_line(row):
+    return _csv_writer.writerow(row)
+
+
+def ndjson_line(row, columns=tuple(API_FIELDS)):
+    return json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def json_item(row, index, columns=tuple(API_FIELDS)):
+    """One row of a streamed JSON array, with the separator it needs"""
+    return (',' if index else '') + json.dumps(dict(zip(columns, row)))
+
+
+def stream_json(rows, columns=tuple(API_FIELDS)):
+    """Stream rows as a single JSON array of objects"""
+    yield '['
+    for index, row in enumerate(rows):
+        yield json_item(row, index, columns)
+    yield ']'
+
+
+def is_paged(params):
+    """Whether an API request asks for keyset pages rather than the whole list"""
+    return 'page_size' in params or 'cursor' in params
+
+
+def stream_csv(rows, header=tuple(API_FIELDS)):
+    yield csv_line(header)
+    for row in rows:
+        yield csv_line(row)
+
+
+def stream_ndjson(rows, columns=tuple(API_FIELDS)):
+    for row in rows:
+        yield ndjson_line(row, columns)
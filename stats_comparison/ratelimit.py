@@ -0,0 +1,89 @@
+import threading
+import time
+
+import requests
+import wbgapi as wb
+
+# HTTP status codes that mean "slow down and try again"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by all fetch threads.
+
+    ``rate`` tokens are added per second up to ``capacity``. When the API
+    answers with 429 or 5xx the rate is halved (down to ``min_rate``) and
+    every caller pauses; each success nudges the rate back up towards the
+    configured maximum.
+    """
+
+    def __init__(self, rate=1.0, capacity=1, min_rate=0.05, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now >= self._paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self.tokens) / self.rate)
+            self._sleep(wait)
+
+    def backoff(self, delay):
+        """Slow down after a throttled or failed response"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._paused_until = max(self._paused_until, self._clock() + delay)
+            self.tokens = 0
+
+    def success(self):
+        """Recover a little of the configured rate after a good response"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+def is_transient(error):
+    """Whether a failed request may succeed when tried again later.
+
+    Network errors, throttling, server errors and responses the API garbled
+    are transient. Anything else, e.g. a 404 for an unknown series, a miss in
+    offline mode or a bug in processing the data, fails the same way on
+    every attempt and is left for --resume.
+    """
+    if isinstance(error, (requests.RequestException, wb.APIResponseError)):
+        return True
+    return isinstance(error, wb.APIError) and error.code in RETRYABLE_STATUS
+
+
+def call_with_backoff(limiter, func, *args, retries=5, base_delay=1.0, **kwargs):
+    """Call ``func`` through the limiter, retrying throttled and server errors.
+
+    The pause doubles on every retry. Other errors are raised immediately.
+    """
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except wb.APIError as e:
+            if e.code not in RETRYABLE_STATUS or attempt == retries:
+                raise
+            limiter.backoff(base_delay * 2 ** attempt)
+        else:
+            limiter.success()
+            return result
@@ -0,0 +1,333 @@
+"""Compact, memory-mappable copy of StatisticValue for analytics reads.
+
+Every row is kept in four typed columns: int16 indicator and country
+positions, int16 year and float64 value (NaN for a stored null). Rows are
+sorted by (indicator, country, year), with the offset where each
+indicator's rows start. A lookup is a slice for the indicator plus a binary
+search for each country, and the store grows with the rows that exist
+rather than with countries x years x indicators. Exports and API streams
+want (country, indicator, year) order instead; that permutation of the rows
+is computed once per build and saved with the columns.
+
+The snapshot is rebuilt by fetch_worldbank_data and saved to
+``settings.SNAPSHOT_DIR``. Worker processes memory-map the columns, so they
+load them almost instantly and share one copy through the page cache.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from .comparison import PairedValues, empty_pairs
+from .models import Country, Indicator, StatisticValue
+
+META_FILE = 'meta.json'
+OFFSETS_FILE = 'offsets.npy'
+COUNTRY_ORDER_FILE = 'country_order.npy'
+COUNTRY_OFFSETS_FILE = 'country_offsets.npy'
+
+# Column -> dtype; positions index the code-sorted country and indicator lists
+COLUMNS = {
+    'indicator': np.int16,
+    'country': np.int16,
+    'year': np.int16,
+    'value': np.float64,
+}
+
+MAX_POSITIONS = np.iinfo(np.int16).max
+
+# Rows read from the database cursor per step while building a snapshot
+BUILD_CHUNK_SIZE = 20000
+
+
+def _ranges(starts, stops):
+    """Concatenation of np.arange(start, stop) for each pair, without a Python loop"""
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(total, dtype=np.int64)
+
+
+class Snapshot:
+    def __init__(self, columns, offsets, countries, indicators, version, years=None,
+                 country_order=None, country_offsets=None):
+        # Row columns sorted by (indicator, country, year)
+        self.indicator = columns['indicator']
+        self.country = columns['country']
+        self.year = columns['year']
+        self.value = columns['value']
+        # Rows of indicator i are offsets[i]:offsets[i + 1]
+        self.offsets = offsets
+        # Row numbers in (country, indicator, year) order; those of country c are
+        # country_order[country_offsets[c]:country_offsets[c + 1]]
+        if country_order is None:
+            country_order = np.argsort(self.country, kind='stable')
+            country_offsets = np.searchsorted(self.country[country_order], np.arange(len(countries) + 1))
+        self.country_order = country_order
+        self.country_offsets = country_offsets
+        # Lists of (code, name, region) and (code, name), sorted by code
+        self.countries = [tuple(country) for country in countries]
+        self.indicators = [tuple(indicator) for indicator in indicators]
+        self.version = version
+        if years is None:
+            years = (int(self.year.min()), int(self.year.max())) if len(self.year) else (0, -1)
+        self.years = np.arange(years[0], years[1] + 1, dtype=np.int64)
+        self.country_index = {country[0]: i for i, country in enumerate(self.countries)}
+        self.indicator_index = {indicator[0]: i for i, indicator in enumerate(self.indicators)}
+        self._country_codes = np.array([country[0] for country in self.countries], dtype=object)
+        self._country_names = np.array([country[1] for country in self.countries], dtype=object)
+        # Position of each country when ordered by name, as the comparison page lists them
+        self._name_rank = np.empty(len(self.countries), dtype=np.int64)
+        self._name_rank[sorted(range(len(self.countries)), key=lambda i: self.countries[i][1])] = (
+            np.arange(len(self.countries))
+        )
+
+    def __len__(self):
+        return len(self.value)
+
+    def rows_of(self, indicator_code, country_positions=None):
+        """Row numbers of an indicator, for the given sorted country positions only if given"""
+        i = self.indicator_index.get(indicator_code)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        if country_positions is None:
+            return np.arange(start, stop, dtype=np.int64)
+        countries = self.country[start:stop]
+        positions = np.asarray(country_positions, dtype=countries.dtype)
+        return start + _ranges(
+            np.searchsorted(countries, positions, side='left'),
+            np.searchsorted(countries, positions, side='right')
+        )
+
+    def pair(self, indicator1, indicator2, country_codes):
+        """Same result as comparison.pair_indicator_values, without touching the database"""
+        if indicator1 not in self.indicator_index or indicator2 not in self.indicator_index:
+            return empty_pairs()
+        positions = sorted({self.country_index[code] for code in country_codes if code in self.country_index})
+        rows1 = self.rows_of(indicator1, positions)
+        rows2 = self.rows_of(indicator2, positions)
+        rows1 = rows1[~np.isnan(self.value[rows1])]
+        rows2 = rows2[~np.isnan(self.value[rows2])]
+        # (country, year) is unique within an indicator, so the keys can be intersected directly
+        key = lambda rows: self.country[rows].astype(np.int64) << 16 | self.year[rows].astype(np.int64)
+        _, in1, in2 = np.intersect1d(key(rows1), key(rows2), assume_unique=True, return_indices=True)
+        rows1, rows2 = rows1[in1], rows2[in2]
+        countries = self.country[rows1].astype(np.int64)
+        years = self.year[rows1].astype(np.int64)
+        order = np.lexsort((years, self._name_rank[countries]))
+        rows1, rows2, countries, years = rows1[order], rows2[order], countries[order], years[order]
+        return PairedValues(
+            country_codes=self._country_codes[countries],
+            country_names=self._country_names[countries],
+            years=years,
+            values1=np.asarray(self.value[rows1], dtype=np.float64),
+            values2=np.asarray(self.value[rows2], dtype=np.float64),
+        )
+
+    def observation_matrix(self, country_codes=None, start_year=None, end_year=None):
+        """Same result as correlation.observation_matrix, without touching the database"""
+        countries = range(len(self.countries))
+        if country_codes:
+            countries = [self.country_index[code] for code in country_codes if code in self.country_index]
+        years = self.years
+        if start_year is not None:
+            years = years[years >= start_year]
+        if end_year is not None:
+            years = years[years <= end_year]
+        codes = [indicator[0] for indicator in self.indicators]
+        block = np.full((len(countries), len(years), len(codes)), np.nan)
+        if len(countries) and len(years):
+            row_of_country = np.full(len(self.countries), -1, dtype=np.int64)
+            row_of_country[np.asarray(countries, dtype=np.int64)] = np.arange(len(countries))
+            rows = row_of_country[self.country]
+            keep = (rows >= 0) & (self.year >= years[0]) & (self.year <= years[-1]) & ~np.isnan(self.value)
+            block[rows[keep], self.year[keep] - years[0], self.indicator[keep]] = self.value[keep]
+        return codes, block.reshape(-1, len(codes))
+
+    def iter_rows(self, chunk_size=10000, indicator_codes=None, country_codes=None, regions=None,
+                  start_year=None, end_year=None):
+        """Yield export/API rows ordered by (country, indicator, year), nulls as None.
+
+        Takes the filters of queries.filter_statistics(); None means no filter.
+        """
+        countries = range(len(self.countries))
+        if country_codes is not None:
+            countries = sorted({self.country_index[code] for code in country_codes if code in self.country_index})
+        if regions is not None:
+            regions = set(regions)
+            countries = [c for c in countries if self.countries[c][2] in regions]
+        wanted_indicators = None
+        if indicator_codes is not None:
+            wanted_indicators = np.zeros(len(self.indicators), dtype=bool)
+            wanted_indicators[
+                [self.indicator_index[code] for code in indicator_codes if code in self.indicator_index]
+            ] = True
+        if len(countries) == len(self.countries):
+            spans = [(0, len(self))]
+        else:
+            spans = [(int(self.country_offsets[c]), int(self.country_offsets[c + 1])) for c in countries]
+        for span_start, span_stop in spans:
+            for start in range(span_start, span_stop, chunk_size):
+                rows = self.country_order[start:min(start + chunk_size, span_stop)]
+                if wanted_indicators is not None:
+                    rows = rows[wanted_indicators[self.indicator[rows]]]
+                if start_year is not None:
+                    rows = rows[self.year[rows] >= start_year]
+                if end_year is not None:
+                    rows = rows[self.year[rows] <= end_year]
+                yield from self._rows(rows)
+
+    def _rows(self, rows):
+        """Export/API row tuples of the given row numbers"""
+        columns = (self.country[rows], self.indicator[rows], self.year[rows], self.value[rows])
+        for c, i, year, value in zip(*(column.tolist() for column in columns)):
+            country_code, country_name, region = self.countries[c]
+            indicator_code, indicator_name = self.indicators[i]
+            yield (
+                country_name, country_code, region, indicator_name, indicator_code,
+                year, None if value != value else value
+            )
+
+    def save(self, directory):
+        """Write the snapshot so readers never see a partial one.
+
+        Columns go to a new subdirectory; the metadata naming it is replaced
+        last, and the columns of older snapshots are removed after that.
+        """
+        os.makedirs(directory, exist_ok=True)
+        target = tempfile.mkdtemp(prefix=f'v{self.version}-', dir=directory)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(target, f'{name}.npy'), np.ascontiguousarray(getattr(self, name), dtype=dtype))
+        np.save(os.path.join(target, OFFSETS_FILE), np.ascontiguousarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(target, COUNTRY_ORDER_FILE), np.ascontiguousarray(self.country_order, dtype=np.int64))
+        np.save(
+            os.path.join(target, COUNTRY_OFFSETS_FILE), np.ascontiguousarray(self.country_offsets, dtype=np.int64)
+        )
+        meta_tmp = os.path.join(directory, f'.{META_FILE}.tmp')
+        with open(meta_tmp, 'w') as f:
+            json.dump({
+                'version': self.version,
+                'columns': os.path.basename(target),
+                'rows': len(self),
+                'years': [int(self.years[0]), int(self.years[-1])] if len(self.years) else [0, -1],
+                'countries': self.countries,
+                'indicators': self.indicators,
+            }, f)
+        os.replace(meta_tmp, os.path.join(directory, META_FILE))
+        # Processes still mapping an old snapshot keep its pages until they reload
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            if entry != os.path.basename(target) and entry.startswith('v') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a saved snapshot, or return None if there is none"""
+        try:
+            with open(os.path.join(directory, META_FILE)) as f:
+                meta = json.load(f)
+            path = os.path.join(directory, meta['columns'])
+            columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+            offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+            country_order = np.load(os.path.join(path, COUNTRY_ORDER_FILE), mmap_mode='r')
+            country_offsets = np.load(os.path.join(path, COUNTRY_OFFSETS_FILE), mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+        if any(len(column) != meta['rows'] for column in (*columns.values(), country_order)) or \
+                len(offsets) != len(meta['indicators']) + 1 or len(country_offsets) != len(meta['countries']) + 1:
+            return None
+        return cls(
+            columns, offsets, meta['countries'], meta['indicators'], meta['version'], meta['years'],
+            country_order, country_offsets
+        )
+
+
+def build_snapshot(version, chunk_size=BUILD_CHUNK_SIZE):
+    """Copy the whole StatisticValue table into a Snapshot.
+
+    Rows are streamed from a database cursor ``chunk_size`` at a time into
+    preallocated columns, so the build needs memory for the columns and one
+    chunk of row tuples, not a tuple for every row.
+    """
+    countries = list(Country.objects.order_by('code').values_list('code', 'name', 'region'))
+    indicators = list(Indicator.objects.order_by('code').values_list('code', 'name'))
+    if max(len(countries), len(indicators)) > MAX_POSITIONS:
+        raise ValueError(f'Snapshots hold at most {MAX_POSITIONS} countries and indicators')
+    country_index = {country[0]: i for i, country in enumerate(countries)}
+    indicator_index = {indicator[0]: i for i, indicator in enumerate(indicators)}
+    queryset = StatisticValue.objects.values_list('indicator_id', 'country_id', 'year', 'value')
+
+    columns = {name: np.empty(queryset.count(), dtype=dtype) for name, dtype in COLUMNS.items()}
+    filled = 0
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        end = filled + len(chunk)
+        if end > len(columns['value']):
+            # Rows were added since the count
+            columns = {name: np.resize(column, end) for name, column in columns.items()}
+        indicator_codes, country_codes, years, values = zip(*chunk)
+        columns['indicator'][filled:end] = [indicator_index[code] for code in indicator_codes]
+        columns['country'][filled:end] = [country_index[code] for code in country_codes]
+        columns['year'][filled:end] = years
+        # None becomes NaN
+        columns['value'][filled:end] = np.array(values, dtype=np.float64)
+        filled = end
+    columns = {name: column[:filled] for name, column in columns.items()}
+    # Sorted in NumPy rather than by the database, whose collation may not order codes like Python
+    order = np.lexsort((columns['year'], columns['country'], columns['indicator']))
+    columns = {name: column[order] for name, column in columns.items()}
+    offsets = np.searchsorted(columns['indicator'], np.arange(len(indicators) + 1)).astype(np.int64)
+    return Snapshot(columns, offsets, countries, indicators, version)
+
+
+def rebuild_snapshot(version):
+    """Build the snapshot for ``version`` and persist it to SNAPSHOT_DIR"""
+    snapshot = build_snapshot(version)
+    snapshot.save(settings.SNAPSHOT_DIR)
+    return snapshot
+
+
+_loaded = None
+_lock = threading.Lock()
+
+
+def get_snapshot(version):
+    """Return the persisted snapshot if it matches ``version``, else None.
+
+    The memory-mapped snapshot is kept per process and reloaded from disk
+    when the data version changes.
+    """
+    global _loaded
+    directory = settings.SNAPSHOT_DIR
+    if not directory:
+        return None
+    with _lock:
+        if _loaded is None or _loaded[0] != directory or _loaded[1].version != version:
+            snapshot = Snapshot.load(directory)
+            _loaded = (directory, snapshot) if snapshot is not None else None
+        if _loaded is not None and _loaded[1].version == version:
+            return _loaded[1]
+        return None
+
+
+def preload_snapshot():
+    """Map the persisted snapshot into this process without asking the database for the version.
+
+    get_snapshot() still checks it against the data version on first use.
+    """
+    global _loaded
+    directory = settings.SNAPSHOT_DIR
+    if not directory:
+        return None
+    snapshot = Snapshot.load(directory)
+    with _lock:
+        _loaded = (directory, snapshot) if snapshot is not None else None
+    return snapshot
@@ -0,0 +1,157 @@
+"""Offline stand-ins for the World Bank API used by tests and benchmarks."""
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import wbgapi as wb
+
+
+class FakeWorldBank:
+    """Minimal replacement for the parts of ``wbgapi`` the ingest uses.
+
+    Every call sleeps for ``latency`` seconds to imitate a network round
+    trip. ``failures`` maps a series code to a list of HTTP status codes
+    that are raised (as ``wbgapi.APIError``) on successive data requests
+    for it before the call succeeds. Exception instances in the list are
+    raised as they are, e.g. to imitate network errors.
+
+    ``series`` is the catalog listed by ``series.list``: records of 'id',
+    'value' (the name) and 'topic'.
+    """
+
+    APIError = wb.APIError
+
+    def __init__(self, economies=None, latency=0.0, failures=None, seed=0, last_updated='2024-01-01', series=()):
+        self.economies = economies if economies is not None else [
+            {
+                'id': f'C{i:02d}', 'value': f'Country {i:02d}', 'region': 'Test Region',
+                'incomeLevel': 'HIC' if i % 2 else 'LIC'
+            }
+            for i in range(20)
+        ]
+        self.latency = latency
+        self.failures = {code: list(codes) for code, codes in (failures or {}).items()}
+        self.seed = seed
+        self.last_updated = last_updated
+        self.series_catalog = list(series)
+        self.calls = []
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        self.economy = SimpleNamespace(list=self._economy_list)
+        self.series = SimpleNamespace(
+            list=self._series_list,
+            metadata=SimpleNamespace(fetch=self._series_metadata)
+        )
+        self.data = SimpleNamespace(DataFrame=self._data_frame)
+        self.source = SimpleNamespace(get=self._source_get)
+
+    def _call(self, name, *args):
+        with self._lock:
+            self.calls.append((name,) + args)
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _economy_list(self, *args, **kwargs):
+        self._call('economy.list')
+        return iter(self.economies)
+
+    def _source_get(self, *args, **kwargs):
+        self._call('source.get')
+        return {'id': '2', 'name': 'World Development Indicators', 'lastupdated': self.last_updated}
+
+    def _series_list(self, id='all', q=None, topic=None, **kwargs):
+        self._call('series.list', topic, q)
+        for series in self.series_catalog:
+            if topic is not None and series.get('topic') != topic:
+                continue
+            if q is not None and q.lower() not in series['value'].lower():
+                continue
+            yield {'id': series['id'], 'value': series['value']}
+
+    def _series_metadata(self, codes, **kwargs):
+        codes = [codes] if isinstance(codes, str) else list(codes)
+        self._call('series.metadata.fetch', tuple(codes))
+        for code in codes:
+            yield SimpleNamespace(id=code, metadata={'IndicatorName': code, 'Longdefinition': f'Synthetic series {code}'})
+
+    def _data_frame(self, series, time='all', **kwargs):
+        # Like wbgapi, one series is indexed by economy and a list by (economy, series)
+        codes = [series] if isinstance(series, str) else list(series)
+        self._call('data.DataFrame', series if isinstance(series, str) else tuple(codes), tuple(time))
+        with self._lock:
+            for code in codes:
+                pending = self.failures.get(code)
+                if pending:
+                    failure = pending.pop(0)
+                    if isinstance(failure, Exception):
+                        raise failure
+                    raise wb.APIError(f'fake://{code}', 'Synthetic failure', failure)
+
+        years = list(time)
+        economies = [e['id'] for e in self.economies]
+        frames = []
+        for code in codes:
+            # Seeded per year, so a year has the same values whichever range it is fetched in
+            values = np.column_stack([
+                np.random.default_rng(zlib.crc32(f'{self.seed}:{code}:{year}'.encode())).normal(
+                    100, 25, size=len(economies)
+                )
+                for year in years
+            ]) if years else np.empty((len(economies), 0))
+            frames.append(pd.DataFrame(
+                values,
+                index=pd.Index(economies, name='economy'),
+                columns=[f'YR{year}' for year in years]
+            ))
+        if isinstance(series, str):
+            return frames[0]
+        return pd.concat(frames, keys=codes, names=['series']).swaplevel().rename_axis(['economy', 'series'])
+
+
+def seed_statistics(n_countries, n_indicators, n_years, first_year=1960, batch_size=5000, seed=0):
+    """Fill the database with a dense synthetic country x indicator x year table.
+
+    Values are written in batches so seeding large tables does not need the
+    whole dataset in memory. Returns the number of values created.
+    """
+    from django.db import transaction
+
+    from .models import Country, Indicator, StatisticValue
+
+    rng = np.random.default_rng(seed)
+    countries = [
+        Country(code=f'{i:03d}', name=f'Country {i:03d}', region=f'Region {i % 7}')
+        for i in range(n_countries)
+    ]
+    indicators = [
+        Indicator(code=f'SYN.{i:04d}', name=f'Synthetic indicator {i:04d}', description='')
+        for i in range(n_indicators)
+    ]
+    years = range(first_year, first_year + n_years)
+    with transaction.atomic():
+        Country.objects.bulk_create(countries)
+        Indicator.objects.bulk_create(indicators)
+        batch = []
+        for indicator in indicators:
+            values = rng.normal(100, 25, size=(n_countries, n_years))
+            for i, country in enumerate(countries):
+                for j, year in enumerate(years):
+                    batch.append(StatisticValue(
+                        country_id=country.code, indicator_id=indicator.code, year=year, value=float(values[i, j])
+                    ))
+                if len(batch) >= batch_size:
+                    StatisticValue.objects.bulk_create(batch)
+                    batch = []
+        StatisticValue.objects.bulk_create(batch)
+    return n_countries * n_indicators * n_years
@@ -1,3 +1,1597 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import requests
+import wbgapi as wb
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.test import Client, LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .aggregates import compute_aggregates
+from .comparison import PairedValues, pair_indicator_values
+from .correlation import correlation_matrix
+from .exports import EXPORT_COLUMNS
+from .httpcache import CacheMiss, ResponseCache, cached_queries
+from .instrumentation import metrics
+from .jobs import JobCancelled, ProgressReporter, claim_next, enqueue, run_job
+from .ingest import (
+    changed_values, stored_values_hash, tidy_indicator_frame, upsert_countries, upsert_statistic_values
+)
+from .management.commands.benchmark import STARTUP_CODE
+from .models import (
+    Country, GroupAggregate, Indicator, IndicatorSync, IngestRun, IngestTask, Job, StatisticValue
+)
+from .queries import API_FIELDS, filter_statistics, iter_rows, statistics_filters
+from .ratelimit import AdaptiveRateLimiter, call_with_backoff, is_transient
+from .snapshot import Snapshot, build_snapshot, get_snapshot, rebuild_snapshot
+from .staticfiles import PLOTLY_JS
+from .synthetic import FakeWorldBank
+from .timeseries import RESOLUTIONS, animation_figure, lttb, trajectory_figure
+from .versioning import bump_data_version, get_data_version
+from .warmup import preload
+
+# Tests never touch the developer's snapshot, export, API cache, metrics or job files;
+# tests that need one opt in with a temporary directory. The data version is
+# never memoized between tests.
+_snapshot_settings = override_settings(
+    SNAPSHOT_DIR=None, EXPORT_CACHE_DIR=None, WB_CACHE_DIR=None, INGEST_METRICS_FILE=None, JOB_RESULTS_DIR=None,
+    DATA_VERSION_TTL=0
+)
+
+
+def setUpModule():
+    _snapshot_settings.enable()
+
+
+def tearDownModule():
+    _snapshot_settings.disable()
+
+
+class ComparisonDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.countries = [
+            Country.objects.create(code=f'C{i:02d}', name=f'Country {i:02d}', region='Test Region')
+            for i in range(20)
+        ]
+        Indicator.objects.create(code='IND.A', name='Indicator A', description='')
+        Indicator.objects.create(code='IND.B', name='Indicator B', description='')
+        values = []
+        for i, country in enumerate(cls.countries):
+            for year in range(2019, 2024):
+                values.append(StatisticValue(country=country, indicator_id='IND.A', year=year, value=i + year))
+                # Indicator B is missing for 2019 and null for 2020
+                if year > 2019:
+                    value = None if year == 2020 else i * 2.0
+                    values.append(StatisticValue(country=country, indicator_id='IND.B', year=year, value=value))
+        StatisticValue.objects.bulk_create(values)
+
+
+class PairIndicatorValuesTests(ComparisonDataMixin, TestCase):
+    def test_aligns_values_on_country_and_year(self):
+        pairs = pair_indicator_values('IND.A', 'IND.B', ['C01', 'C02'])
+        self.assertEqual(list(pairs.country_codes), ['C01'] * 3 + ['C02'] * 3)
+        self.assertEqual(list(pairs.years), [2021, 2022, 2023] * 2)
+        self.assertEqual(list(pairs.values1), [2022, 2023, 2024, 2023, 2024, 2025])
+        self.assertEqual(list(pairs.values2), [2.0] * 3 + [4.0] * 3)
+
+    def test_same_indicator_pairs_with_itself(self):
+        pairs = pair_indicator_values('IND.A', 'IND.A', ['C01'])
+        self.assertEqual(len(pairs.years), 5)
+        self.assertEqual(list(pairs.values1), list(pairs.values2))
+
+    def test_no_matches_returns_empty_arrays(self):
+        pairs = pair_indicator_values('IND.A', 'MISSING', ['C01'])
+        self.assertEqual(len(pairs.years), 0)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            pair_indicator_values('IND.A', 'IND.B', [c.code for c in self.countries])
+
+
+class IndexViewTests(ComparisonDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post_comparison(self, countries):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('stats_comparison:index'), {
+                'indicator1': 'IND.A',
+                'indicator2': 'IND.B',
+                'countries': countries,
+            })
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_independent_of_selection(self):
+        # Builds the cached selector metadata
+        self.post_comparison(['C19'])
+        response_small, queries_small = self.post_comparison(['C00'])
+        response_large, queries_large = self.post_comparison([c.code for c in self.countries])
+        self.assertIsNotNone(response_small.context['plot'])
+        self.assertIsNotNone(response_large.context['plot'])
+        self.assertEqual(queries_small, queries_large)
+
+    def test_reports_error_without_matches(self):
+        response = self.client.post(reverse('stats_comparison:index'), {
+            'indicator1': 'IND.A',
+            'indicator2': 'IND.B',
+            'countries': ['UNKNOWN'],
+        })
+        self.assertEqual(
+            response.context['error'],
+            'No matching data points found for the selected combination'
+        )
+
+    def test_repeated_selection_is_served_from_cache(self):
+        response, queries_miss = self.post_comparison(['C01', 'C02'])
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response, queries_hit = self.post_comparison(['C02', 'C01', 'C01'])
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertLess(queries_hit, queries_miss)
+
+    def test_data_version_bump_invalidates_cache(self):
+        self.post_comparison(['C01'])
+        bump_data_version()
+        response, _ = self.post_comparison(['C01'])
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        Indicator.objects.create(code='IND.A', name='Indicator A', description='')
+
+    def test_upsert_countries_skips_aggregates(self):
+        economies = [
+            {'id': 'DEU', 'value': 'Germany', 'region': 'ECS'},
+            {'id': 'WLD', 'value': 'World', 'region': None},
+            {'id': 'EUU', 'value': 'European Union', 'region': 'ECS'},
+        ]
+        self.assertEqual(upsert_countries(economies), (1, 1, 0))
+        self.assertEqual(upsert_countries(economies), (1, 0, 0))
+        economies[0]['value'] = 'Federal Republic of Germany'
+        self.assertEqual(upsert_countries(economies), (1, 1, 0))
+        economies[0]['incomeLevel'] = 'HIC'
+        self.assertEqual(upsert_countries(economies), (1, 1, 1))
+        self.assertEqual(
+            list(Country.objects.values_list('code', 'name')),
+            [('DEU', 'Federal Republic of Germany')]
+        )
+
+    def test_tidy_and_upsert_values(self):
+        Country.objects.create(code='DEU', name='Germany', region='ECS')
+        data = pd.DataFrame(
+            {'YR2019': [1.0, 2.0, 3.0], 'YR2020': [np.nan, 5.0, 6.0]},
+            index=pd.Index(['DEU', 'WLD', 'XXX'], name='economy')
+        )
+        values = tidy_indicator_frame(data, {'DEU'})
+        self.assertEqual(values.to_dict('records'), [{'country': 'DEU', 'year': 2019, 'value': 1.0}])
+
+        self.assertEqual(upsert_statistic_values('IND.A', values, batch_size=1), 1)
+        values['value'] = 9.0
+        with self.assertNumQueries(1):
+            upsert_statistic_values('IND.A', values)
+        self.assertEqual(
+            list(StatisticValue.objects.values_list('country_id', 'year', 'value')),
+            [('DEU', 2019, 9.0)]
+        )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTests(TestCase):
+    def test_token_bucket_spaces_requests(self):
+        clock = FakeClock()
+        limiter = AdaptiveRateLimiter(rate=2.0, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertAlmostEqual(clock.now, 1.0)
+
+    def test_backs_off_and_retries_on_throttling(self):
+        clock = FakeClock()
+        limiter = AdaptiveRateLimiter(rate=10.0, clock=clock, sleep=clock.sleep)
+        fake = FakeWorldBank(failures={'IND.A': [429, 503]})
+        data = call_with_backoff(limiter, fake.data.DataFrame, 'IND.A', time=[2020], base_delay=1.0)
+        self.assertEqual(data.shape, (20, 1))
+        self.assertEqual(len(fake.calls), 3)
+        # Paused for 1s then 2s, and the rate was cut after each failure
+        self.assertGreaterEqual(clock.now, 3.0)
+        self.assertLess(limiter.rate, 10.0)
+
+    def test_other_errors_are_not_retried(self):
+        clock = FakeClock()
+        limiter = AdaptiveRateLimiter(rate=10.0, clock=clock, sleep=clock.sleep)
+        fake = FakeWorldBank(failures={'IND.A': [404]})
+        with self.assertRaises(FakeWorldBank.APIError):
+            call_with_backoff(limiter, fake.data.DataFrame, 'IND.A', time=[2020])
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_only_network_throttling_and_server_errors_are_transient(self):
+        for error in (
+            requests.ConnectionError('reset'), requests.Timeout(), wb.APIResponseError('fake://', 'JSON decoding error'),
+            wb.APIError('fake://', 'Too Many Requests', 429), wb.APIError('fake://', 'Bad Gateway', 502),
+        ):
+            self.assertTrue(is_transient(error), error)
+        for error in (
+            wb.APIError('fake://', 'Not Found', 404), wb.APIError('fake://', 'Invalid value'),
+            CacheMiss('fake://'), KeyError('year'), ZeroDivisionError(),
+        ):
+            self.assertFalse(is_transient(error), error)
+
+
+def api_response(status_code=200, document=None):
+    response = mock.Mock(status_code=status_code, reason='Synthetic')
+    response.json.return_value = document
+    return response
+
+
+class InstrumentationTests(ComparisonDataMixin, TestCase):
+    form = {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C01', 'C02']}
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_requests_are_counted_per_view(self):
+        self.client.get(reverse('stats_comparison:index'))
+        self.client.post(reverse('stats_comparison:index'), self.form)
+        body = self.client.get(reverse('stats_comparison:metrics')).content.decode()
+        self.assertIn('stats_comparison_requests_total{method="GET",status="200",view="index"} 1', body)
+        self.assertIn('stats_comparison_request_seconds_count{view="index"} 2', body)
+        self.assertIn('# TYPE stats_comparison_db_queries_total counter', body)
+        self.assertIn('stats_comparison_span_seconds_count{span="px.scatter"} 1', body)
+        self.assertNotIn('view="metrics"', body)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.post(reverse('stats_comparison:index'), self.form)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[0-9]+ queries"')
+        for name in ('total', 'pair', 'px-scatter', 'to_html', 'template'):
+            self.assertIn(f'{name};dur=', timing)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_is_optional(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('stats_comparison:index')))
+
+    @override_settings(DEBUG=True)
+    async def test_middleware_keeps_async_views_async(self):
+        from django.core.handlers.asgi import ASGIHandler
+
+        # Django logs each middleware it has to adapt to sync mode, but only with DEBUG on
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+        response = await self.async_client.get(reverse('stats_comparison:powerbi_api_async'), {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        body = (await self.async_client.get(reverse('stats_comparison:metrics'))).content.decode()
+        self.assertIn('stats_comparison_requests_total{method="GET",status="200",view="powerbi_api_async"} 1', body)
+
+    def test_metrics_are_local_only(self):
+        response = self.client.get(reverse('stats_comparison:metrics'), REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 404)
+
+    def test_ingest_phase_timings(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'ingest.prom')
+        out = StringIO()
+        with override_settings(INGEST_METRICS_FILE=path), \
+                mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', FakeWorldBank()):
+            call_command('fetch_worldbank_data', '--rate', '1000', stdout=out)
+            body = self.client.get(reverse('stats_comparison:metrics')).content.decode()
+        self.assertIn('Phase timings:', out.getvalue())
+        for phase in ('countries', 'indicators', 'values', 'snapshot'):
+            self.assertIn(f'stats_comparison_ingest_phase_seconds{{phase="{phase}"}}', body)
+        self.assertRegex(body, r'stats_comparison_ingest_phase_queries\{phase="values"\} [1-9]')
+
+
+class DatabaseProfileTests(TestCase):
+    def test_statistic_value_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, StatisticValue._meta.db_table)
+        indexes = sorted(
+            (tuple(c['columns']), c['unique']) for c in constraints.values()
+            if c['index'] or c['unique']
+        )
+        self.assertIn((('country_id', 'indicator_id', 'year'), True), indexes)
+        self.assertIn((('indicator_id', 'country_id', 'year'), False), indexes)
+        self.assertNotIn((('country_id', 'indicator_id', 'year'), False), indexes)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_sqlite_pragmas(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = connection.copy()
+        wrapper.settings_dict['NAME'] = os.path.join(directory.name, 'pragmas.sqlite3')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('journal_mode', 'synchronous', 'mmap_size')
+            }
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 256 * 1024 * 1024})
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY fast path')
+    def test_copy_upsert(self):
+        upsert_countries([{'id': f'C{i:02d}', 'value': f'Country {i:02d}', 'region': 'Test Region'} for i in range(20)])
+        Indicator.objects.create(code='IND.A', name='Indicator A', description='')
+        values = pd.DataFrame({
+            'country': [f'C{i % 20:02d}' for i in range(1000)],
+            'year': [1000 + i // 20 for i in range(1000)],
+            'value': [float(i) for i in range(1000)],
+        })
+        self.assertEqual(upsert_statistic_values('IND.A', values), 1000)
+        self.assertEqual(upsert_statistic_values('IND.A', values.assign(value=values['value'] * 2)), 1000)
+        self.assertEqual(StatisticValue.objects.count(), 1000)
+        self.assertEqual(StatisticValue.objects.get(country_id='C01', year=1000).value, 2.0)
+
+
+class ResponseCacheTests(TestCase):
+    # A recorded response of GET country/BRA
+    document = [{'page': 1, 'pages': 1, 'per_page': '1', 'total': 1}, [{'id': 'BRA', 'name': 'Brazil'}]]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.clock = FakeClock()
+
+    def fetch(self, cache, response=None):
+        """Run wb.get through ``cache``; returns (result, number of network requests)"""
+        with mock.patch('wbgapi.requests.get', return_value=response or api_response(document=self.document)) as get:
+            with cached_queries(cache):
+                result = wb.get('country/BRA')
+        return result, get.call_count
+
+    def test_repeat_requests_use_the_cache(self):
+        cache = ResponseCache(self.directory, clock=self.clock)
+        self.assertEqual(self.fetch(cache), ({'id': 'BRA', 'name': 'Brazil'}, 1))
+        self.assertEqual(self.fetch(cache), ({'id': 'BRA', 'name': 'Brazil'}, 0))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(self.directory, ttl=60, clock=self.clock)
+        self.fetch(cache)
+        self.clock.now += 61
+        self.assertEqual(self.fetch(cache)[1], 1)
+
+    def test_refresh_and_offline_modes(self):
+        self.fetch(ResponseCache(self.directory, clock=self.clock))
+        self.assertEqual(self.fetch(ResponseCache(self.directory, mode='refresh', clock=self.clock))[1], 1)
+        # Offline replays entries of any age and never touches the network
+        self.clock.now += 10 ** 6
+        offline = ResponseCache(self.directory, ttl=60, mode='offline', clock=self.clock)
+        self.assertEqual(self.fetch(offline, api_response(status_code=500)), ({'id': 'BRA', 'name': 'Brazil'}, 0))
+        with self.assertRaises(CacheMiss):
+            with cached_queries(offline):
+                wb.get('country/ARG')
+
+    def test_errors_are_not_cached(self):
+        cache = ResponseCache(self.directory, clock=self.clock)
+        with self.assertRaises(wb.APIError):
+            self.fetch(cache, api_response(status_code=503))
+        self.assertEqual(self.fetch(cache)[1], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.directory, max_bytes=400, clock=self.clock)
+        for url in ('a', 'b', 'c'):
+            cache.put(url, self.document)
+            self.clock.now += 1
+        self.assertIsNotNone(cache.get('a'))
+        self.clock.now += 1
+        cache.put('d', self.document)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('d'))
+
+    def test_offline_needs_a_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('fetch_worldbank_data', '--offline', stdout=StringIO())
+
+
+class FetchWorldBankDataTests(TestCase):
+    def run_command(self, fake, *args):
+        out = StringIO()
+        with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', fake):
+            call_command('fetch_worldbank_data', '--rate', '1000', *args, stdout=out)
+        return out.getvalue()
+
+    def test_ingests_all_indicators(self):
+        fake = FakeWorldBank()
+        self.run_command(fake)
+        self.assertEqual(Country.objects.count(), 20)
+        self.assertEqual(Indicator.objects.count(), 18)
+        self.assertEqual(StatisticValue.objects.count(), 20 * 18 * 5)
+        self.assertEqual(get_data_version(), 1)
+
+    def test_workers_fetch_concurrently(self):
+        fake = FakeWorldBank(latency=0.02)
+        self.run_command(fake, '--workers', '4', '--chunk-size', '3')
+        self.assertGreater(fake.max_in_flight, 1)
+        self.assertEqual(StatisticValue.objects.count(), 20 * 18 * 5)
+
+    def test_rejects_invalid_options_before_any_work(self):
+        fake = FakeWorldBank()
+        for args, message in (
+            (('--rate', '0'), '--rate must be greater than 0'),
+            (('--batch-size', '0'), '--batch-size must be a positive integer'),
+            (('--retries', '-1'), '--retries must not be negative'),
+        ):
+            with self.subTest(args), self.assertRaisesMessage(CommandError, message):
+                self.run_command(fake, *args)
+        self.assertEqual(fake.calls, [])
+        self.assertFalse(IngestRun.objects.exists())
+
+    def test_failed_indicator_does_not_stop_ingest(self):
+        # The chunk request fails, then the series fails again on its own
+        fake = FakeWorldBank(failures={'SP.POP.TOTL': [404, 404]})
+        output = self.run_command(fake, '--workers', '3', '--chunk-size', '5')
+        self.assertIn('Error processing indicator SP.POP.TOTL', output)
+        self.assertEqual(StatisticValue.objects.count(), 20 * 17 * 5)
+
+    def test_series_are_fetched_in_chunks(self):
+        fake = FakeWorldBank()
+        self.run_command(fake, '--chunk-size', '5')
+        data_calls = [call for call in fake.calls if call[0] == 'data.DataFrame']
+        self.assertEqual([len(call[1]) for call in data_calls], [5, 5, 5, 3])
+        self.assertEqual(len([call for call in fake.calls if call[0] == 'series.metadata.fetch']), 4)
+        self.assertEqual(StatisticValue.objects.count(), 20 * 18 * 5)
+        self.assertEqual(Indicator.objects.get(code='SP.POP.TOTL').description, 'Synthetic series SP.POP.TOTL')
+
+    def test_indicator_catalog(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'catalog.json')
+        with open(path, 'w') as f:
+            json.dump({'series': ['SP.POP.TOTL', {'code': 'X.NAMED', 'name': 'Named here'}], 'topics': [3]}, f)
+        fake = FakeWorldBank(series=[
+            {'id': 'X.TOPIC.1', 'value': 'Topic series one', 'topic': 3},
+            {'id': 'X.TOPIC.2', 'value': 'Topic series two', 'topic': 3},
+            {'id': 'X.OTHER', 'value': 'Another series', 'topic': 4},
+        ])
+        self.run_command(fake, '--catalog', path, '--search', 'another')
+        self.assertEqual(
+            dict(Indicator.objects.values_list('code', 'name')),
+            {
+                'SP.POP.TOTL': 'SP.POP.TOTL', 'X.NAMED': 'Named here', 'X.TOPIC.1': 'Topic series one',
+                'X.TOPIC.2': 'Topic series two', 'X.OTHER': 'Another series',
+            }
+        )
+        self.assertEqual(StatisticValue.objects.count(), 20 * 5 * 5)
+
+        with open(path, 'w') as f:
+            json.dump({'indicators': []}, f)
+        with self.assertRaisesMessage(CommandError, 'Unknown catalog keys: indicators'):
+            self.run_command(fake, '--catalog', path)
+
+    def test_computes_aggregates_of_written_values(self):
+        output = self.run_command(FakeWorldBank())
+        # 18 indicators x 5 years x (one region + two income groups)
+        self.assertIn('Saved 270 aggregates', output)
+        aggregate = GroupAggregate.objects.get(
+            indicator_id='NY.GDP.PCAP.CD', year=2019, group_type='income', group='HIC'
+        )
+        self.assertEqual((aggregate.count, aggregate.weighted_count), (10, 10))
+        # Nothing written, nothing recomputed
+        self.assertNotIn('Computing aggregates', self.run_command(FakeWorldBank(), '--incremental'))
+
+    def test_country_moving_group_recomputes_its_aggregates(self):
+        self.run_command(FakeWorldBank())
+        fake = FakeWorldBank()
+        fake.economies[1]['incomeLevel'] = 'LIC'
+        output = self.run_command(fake, '--incremental')
+        self.assertIn('Computing aggregates', output)
+        counts = dict(GroupAggregate.objects.filter(
+            indicator_id='NY.GDP.PCAP.CD', year=2019, group_type='income'
+        ).values_list('group', 'count'))
+        self.assertEqual(counts, {'HIC': 9, 'LIC': 11})
+
+
+class IncrementalSyncTests(TestCase):
+    def run_command(self, fake, *args):
+        out = StringIO()
+        with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', fake):
+            call_command('fetch_worldbank_data', '--rate', '1000', '--incremental', *args, stdout=out)
+        return out.getvalue()
+
+    def data_calls(self, fake):
+        return [call for call in fake.calls if call[0] == 'data.DataFrame']
+
+    def test_records_sync_metadata(self):
+        self.run_command(FakeWorldBank(), '--start-year', '2010', '--end-year', '2012')
+        sync = IndicatorSync.objects.get(indicator_id='SP.POP.TOTL')
+        self.assertEqual((sync.start_year, sync.end_year), (2010, 2012))
+        self.assertEqual(sync.source_last_updated, date(2024, 1, 1))
+        self.assertEqual(StatisticValue.objects.filter(year=2010).count(), 20 * 18)
+
+    def test_rerun_without_source_change_fetches_nothing(self):
+        self.run_command(FakeWorldBank())
+        fake = FakeWorldBank()
+        self.run_command(fake)
+        self.assertEqual(self.data_calls(fake), [])
+        self.assertFalse(any(call[0] == 'series.metadata.fetch' for call in fake.calls))
+
+    def test_only_new_years_are_fetched(self):
+        self.run_command(FakeWorldBank(), '--start-year', '2019', '--end-year', '2021')
+        fake = FakeWorldBank()
+        self.run_command(fake, '--start-year', '2019', '--end-year', '2023')
+        self.assertEqual({call[2] for call in self.data_calls(fake)}, {(2022, 2023)})
+        sync = IndicatorSync.objects.get(indicator_id='SP.POP.TOTL')
+        self.assertEqual((sync.start_year, sync.end_year), (2019, 2023))
+
+    def test_country_changes_bump_the_data_version(self):
+        self.run_command(FakeWorldBank())
+        version = get_data_version()
+        self.run_command(FakeWorldBank())
+        self.assertEqual(get_data_version(), version)
+        fake = FakeWorldBank()
+        fake.economies[0]['value'] = 'Renamed Country'
+        self.run_command(fake)
+        self.assertEqual(get_data_version(), version + 1)
+
+    def test_content_hash_covers_the_synced_range(self):
+        self.run_command(FakeWorldBank(), '--start-year', '2019', '--end-year', '2021')
+        self.run_command(FakeWorldBank(), '--start-year', '2019', '--end-year', '2023')
+        sync = IndicatorSync.objects.get(indicator_id='SP.POP.TOTL')
+        self.assertEqual(sync.content_hash, stored_values_hash('SP.POP.TOTL', 2019, 2023))
+        # A source update refetches the whole range; unchanged data is recognised by its hash
+        with mock.patch(
+            'stats_comparison.management.commands.fetch_worldbank_data.changed_values', wraps=changed_values
+        ) as changed:
+            output = self.run_command(FakeWorldBank(last_updated='2024-06-01'), '--end-year', '2023')
+        self.assertIn('Statistical values saved: 0', output)
+        self.assertEqual(changed.call_count, 0)
+
+    def test_source_update_writes_only_changed_values(self):
+        self.run_command(FakeWorldBank())
+        output = self.run_command(FakeWorldBank(last_updated='2024-06-01'))
+        self.assertIn('Statistical values saved: 0', output)
+
+        changed = FakeWorldBank(last_updated='2024-07-01', seed=1)
+        output = self.run_command(changed)
+        self.assertIn(f'Statistical values saved: {20 * 18 * 5}', output)
+
+
+class IngestLedgerTests(TestCase):
+    def run_command(self, fake, *args):
+        out = StringIO()
+        with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', fake):
+            call_command('fetch_worldbank_data', '--rate', '1000', '--retry-delay', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_records_run_and_tasks(self):
+        self.run_command(FakeWorldBank(), '--chunk-size', '5')
+        run = IngestRun.objects.get()
+        self.assertEqual((run.status, run.stage, len(run.indicators)), (IngestRun.DONE, 'values', 18))
+        self.assertEqual(sorted(set(run.tasks.values_list('chunk', flat=True))), [0, 1, 2, 3])
+        self.assertEqual(set(run.tasks.values_list('status', 'attempts')), {(IngestTask.DONE, 1)})
+
+    def test_transient_failures_are_retried(self):
+        # The chunk request and the single-series request both fail; the retry round succeeds
+        fake = FakeWorldBank(failures={'SP.POP.TOTL': [requests.ConnectionError('reset'), requests.ConnectionError('reset')]})
+        output = self.run_command(fake)
+        self.assertIn('Retrying 1 indicators', output)
+        task = IngestTask.objects.get(indicator_id='SP.POP.TOTL')
+        self.assertEqual((task.status, task.attempts), (IngestTask.DONE, 2))
+        self.assertEqual(StatisticValue.objects.count(), 20 * 18 * 5)
+
+    def test_resume_fetches_only_failed_indicators(self):
+        output = self.run_command(FakeWorldBank(failures={'SP.POP.TOTL': [404, 404]}), '--chunk-size', '5')
+        self.assertIn('1 indicators failed; run again with --resume', output)
+        self.assertNotIn('Retrying', output)
+        run = IngestRun.objects.get()
+        self.assertEqual(run.status, IngestRun.FAILED)
+        task = run.tasks.get(status=IngestTask.FAILED)
+        self.assertEqual((task.indicator_id, task.attempts), ('SP.POP.TOTL', 1))
+        self.assertIn('Synthetic failure', task.error)
+
+        # The resumed run keeps its own years, whatever the command line says
+        fake = FakeWorldBank()
+        output = self.run_command(fake, '--resume', '--start-year', '1990')
+        self.assertEqual(fake.calls, [('data.DataFrame', ('SP.POP.TOTL',), (2019, 2020, 2021, 2022, 2023))])
+        # Population changed, so every indicator's aggregates of those years are redone
+        self.assertIn('Saved 270 aggregates', output)
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.stage), (IngestRun.DONE, 'values'))
+        self.assertEqual(StatisticValue.objects.count(), 20 * 18 * 5)
+
+    def test_errors_in_processing_are_not_retried(self):
+        with mock.patch(
+            'stats_comparison.management.commands.fetch_worldbank_data.upsert_statistic_values',
+            side_effect=KeyError('year')
+        ):
+            output = self.run_command(FakeWorldBank(), '--chunk-size', '5')
+        self.assertNotIn('Retrying', output)
+        self.assertEqual(set(IngestTask.objects.values_list('status', 'attempts')), {(IngestTask.FAILED, 1)})
+
+    def test_resume_after_crash_skips_finished_steps(self):
+        with mock.patch(
+            'stats_comparison.management.commands.fetch_worldbank_data.compute_aggregates',
+            side_effect=RuntimeError('Killed')
+        ), self.assertRaises(RuntimeError):
+            self.run_command(FakeWorldBank())
+        run = IngestRun.objects.get()
+        self.assertEqual((run.status, run.stage), (IngestRun.RUNNING, 'values'))
+
+        fake = FakeWorldBank()
+        output = self.run_command(fake, '--resume')
+        self.assertEqual(fake.calls, [])
+        # Aggregates cover the values written before the crash
+        self.assertIn('Saved 270 aggregates', output)
+        self.assertEqual(get_data_version(), 1)
+        self.assertEqual(IngestRun.objects.get().status, IngestRun.DONE)
+
+    def test_new_run_abandons_unfinished_one(self):
+        self.run_command(FakeWorldBank(failures={'SP.POP.TOTL': [404, 404]}))
+        self.run_command(FakeWorldBank())
+        self.assertEqual(
+            list(IngestRun.objects.order_by('pk').values_list('status', flat=True)),
+            [IngestRun.ABANDONED, IngestRun.DONE]
+        )
+        with self.assertRaisesMessage(CommandError, 'no interrupted or failed ingest run'):
+            self.run_command(FakeWorldBank(), '--resume')
+
+
+class PowerBIApiTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:powerbi_api')
+
+    def test_keyset_pagination_returns_every_row_once(self):
+        seen = []
+        params = {'page_size': 50}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), 50)
+            seen.extend((r['country_code'], r['indicator_code'], r['year']) for r in body['results'])
+            if not body['next_cursor']:
+                break
+            params['cursor'] = body['next_cursor']
+        self.assertEqual(len(seen), StatisticValue.objects.count())
+        self.assertEqual(seen, sorted(set(seen)))
+
+    def test_default_is_the_whole_list(self):
+        response = self.client.get(self.url, {'indicator': 'IND.A'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0]['country_code'], 'C00')
+        empty = self.client.get(self.url, {'region': 'Elsewhere'})
+        self.assertEqual(json.loads(b''.join(empty.streaming_content)), [])
+
+    def test_filters(self):
+        response = self.client.get(self.url, {
+            'indicator': 'IND.B', 'country': 'C01,C02', 'start_year': 2022, 'end_year': 2023, 'page_size': 100,
+        })
+        results = response.json()['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0], {
+            'country': 'Country 01', 'country_code': 'C01', 'region': 'Test Region',
+            'indicator': 'Indicator B', 'indicator_code': 'IND.B', 'year': 2022, 'value': 2.0,
+        })
+        response = self.client.get(self.url, {'region': 'Elsewhere', 'page_size': 100})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start_year': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'stream': 'xml'}).status_code, 400)
+
+    def test_stream_ndjson(self):
+        response = self.client.get(self.url, {'stream': 'ndjson', 'country': 'C03'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(json.loads(lines[0])['country_code'], 'C03')
+
+    def test_stream_csv(self):
+        response = self.client.get(self.url, {'stream': 'csv', 'indicator': 'IND.A'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'country,country_code,region,indicator,indicator_code,year,value')
+        self.assertEqual(len(lines), 1 + 20 * 5)
+
+
+class ExportTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:export_powerbi')
+
+    def test_xlsx_export(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('worldbank_data.xlsx', response['Content-Disposition'])
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)))['WorldBank_Data']
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], EXPORT_COLUMNS)
+        self.assertEqual(len(rows), 1 + StatisticValue.objects.count())
+
+    def test_csv_export(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(EXPORT_COLUMNS))
+        self.assertEqual(lines[1], 'Country 00,C00,Test Region,Indicator A,IND.A,2019,2019.0')
+        self.assertEqual(len(lines), 1 + StatisticValue.objects.count())
+
+    def test_parquet_export(self):
+        import pyarrow.parquet as pq
+        response = self.client.get(self.url, {'format': 'parquet'})
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tuple(table.column_names), EXPORT_COLUMNS)
+        self.assertEqual(table.num_rows, StatisticValue.objects.count())
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'pdf'}).status_code, 400)
+
+
+class ConditionalRequestTests(ComparisonDataMixin, TestCase):
+    api_url = reverse('stats_comparison:powerbi_api')
+    export_url = reverse('stats_comparison:export_powerbi')
+
+    def setUp(self):
+        self.version = bump_data_version()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(EXPORT_CACHE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_api_revalidates_until_next_ingest(self):
+        response = self.client.get(self.api_url, {'page_size': 10})
+        etag = response['ETag']
+        self.assertEqual(etag, f'"data-{self.version}"')
+        with self.assertNumQueries(1):
+            response = self.client.get(self.api_url, {'page_size': 10}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.api_url, {'page_size': 10}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+        bump_data_version()
+        response = self.client.get(self.api_url, {'page_size': 10}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_errors_carry_no_validators(self):
+        response = self.client.get(self.api_url, {'stream': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response)
+
+    def test_export_artifact_reused_until_next_ingest(self):
+        response = self.client.get(self.export_url, {'format': 'csv'})
+        first = b''.join(response.streaming_content)
+        self.assertEqual(response['ETag'], f'"export-csv-{self.version}"')
+        self.assertEqual(os.listdir(self.directory), [f'worldbank_data-v{self.version}.csv'])
+        with self.assertNumQueries(1):
+            response = self.client.get(self.export_url, {'format': 'csv'})
+            self.assertEqual(b''.join(response.streaming_content), first)
+        response = self.client.get(self.export_url, {'format': 'csv'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        StatisticValue.objects.filter(year=2019).delete()
+        version = bump_data_version()
+        response = self.client.get(self.export_url, {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + StatisticValue.objects.count())
+        self.assertEqual(os.listdir(self.directory), [f'worldbank_data-v{version}.csv'])
+
+    def test_xlsx_artifact(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(self.export_url)
+        self.assertIn('worldbank_data.xlsx', response['Content-Disposition'])
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)))['WorldBank_Data']
+        self.assertEqual(len(list(sheet.values)), 1 + StatisticValue.objects.count())
+
+
+class SnapshotTests(ComparisonDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(SNAPSHOT_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_pairs_match_database(self):
+        snapshot = build_snapshot(version=0)
+        codes = [c.code for c in self.countries]
+        expected = pair_indicator_values('IND.A', 'IND.B', codes)
+        with self.assertNumQueries(0):
+            actual = pair_indicator_values('IND.A', 'IND.B', codes, snapshot=snapshot)
+        for field in expected._fields:
+            self.assertEqual(list(getattr(actual, field)), list(getattr(expected, field)))
+
+    def test_pairs_of_unknown_or_unordered_selections(self):
+        snapshot = build_snapshot(version=0)
+        pairs = snapshot.pair('IND.A', 'IND.B', ['C05', 'XXX', 'C02'])
+        self.assertEqual(list(pairs.country_codes), ['C02'] * 3 + ['C05'] * 3)
+        self.assertEqual(list(pairs.years), [2021, 2022, 2023] * 2)
+        self.assertEqual(len(snapshot.pair('IND.A', 'NOPE', ['C02']).years), 0)
+
+    def test_rows_match_database(self):
+        snapshot = build_snapshot(version=0)
+        self.assertEqual(list(snapshot.iter_rows(chunk_size=7)), list(iter_rows(StatisticValue.objects.all())))
+        for query in (
+            'indicator=IND.B', 'country=C07,C03,XXX', 'region=Test Region&start_year=2021',
+            'region=Nowhere', 'indicator=IND.A&country=C11&end_year=2020', 'country=XXX',
+        ):
+            with self.subTest(query):
+                params = QueryDict(query)
+                self.assertEqual(
+                    list(snapshot.iter_rows(chunk_size=3, **statistics_filters(params))),
+                    list(iter_rows(filter_statistics(params)))
+                )
+
+    def test_columns_are_compact_and_sorted(self):
+        snapshot = build_snapshot(version=0)
+        self.assertEqual(len(snapshot), StatisticValue.objects.count())
+        self.assertEqual(
+            [snapshot.indicator.dtype, snapshot.country.dtype, snapshot.year.dtype, snapshot.value.dtype],
+            [np.int16, np.int16, np.int16, np.float64]
+        )
+        self.assertEqual(list(snapshot.offsets), [0, 100, 180])
+        rows = snapshot.rows_of('IND.B', [3])
+        self.assertEqual(list(snapshot.year[rows]), [2020, 2021, 2022, 2023])
+        self.assertTrue(np.isnan(snapshot.value[rows[0]]))
+        # Reading the table in chunks that do not divide it evenly gives the same columns
+        chunked = build_snapshot(version=0, chunk_size=7)
+        for name in ('indicator', 'country', 'year', 'value'):
+            np.testing.assert_array_equal(getattr(chunked, name), getattr(snapshot, name))
+
+    def test_saved_snapshot_is_memory_mapped_and_versioned(self):
+        from django.conf import settings
+
+        rebuild_snapshot(version=3)
+        loaded = Snapshot.load(settings.SNAPSHOT_DIR)
+        self.assertIsInstance(loaded.value, np.memmap)
+        # The (country, indicator, year) order of exports is saved, not sorted again per export
+        self.assertIsInstance(loaded.country_order, np.memmap)
+        self.assertEqual(len(loaded), 180)
+        self.assertEqual(list(loaded.years), [2019, 2020, 2021, 2022, 2023])
+        self.assertIsNone(get_snapshot(2))
+        self.assertEqual(get_snapshot(3).version, 3)
+        # A rebuild replaces the columns of the previous snapshot
+        rebuild_snapshot(version=4)
+        self.assertEqual(len([entry for entry in os.listdir(settings.SNAPSHOT_DIR) if entry.startswith('v')]), 1)
+        self.assertEqual(get_snapshot(4).version, 4)
+
+    def test_compute_aggregates_rebuilds_snapshot(self):
+        rebuild_snapshot(bump_data_version())
+        call_command('compute_aggregates', stdout=StringIO())
+        snapshot = get_snapshot(get_data_version())
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(len(snapshot), StatisticValue.objects.count())
+
+    def test_views_read_from_current_snapshot(self):
+        rebuild_snapshot(bump_data_version())
+        with self.assertNumQueries(4):
+            # Data version twice, then the selector metadata built once per version
+            response = self.client.post(reverse('stats_comparison:index'), {
+                'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C01'],
+            })
+        self.assertIsNotNone(response.context['plot'])
+        response = self.client.get(reverse('stats_comparison:export_powerbi'), {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + StatisticValue.objects.count())
+        with self.assertNumQueries(1):
+            # Only the data state; the rows come from the snapshot
+            response = self.client.get(reverse('stats_comparison:powerbi_api'), {'country': 'C02,C01'})
+            rows = json.loads(b''.join(response.streaming_content))
+        expected = iter_rows(filter_statistics(QueryDict('country=C01,C02')))
+        self.assertEqual(rows, [dict(zip(API_FIELDS, row)) for row in expected])
+
+    def test_preload_maps_snapshot_without_queries(self):
+        rebuild_snapshot(version=5)
+        with self.assertNumQueries(0):
+            snapshot = preload()
+        self.assertIn('plotly.express', sys.modules)
+        self.assertIs(get_snapshot(5), snapshot)
+
+    def test_ingest_rebuilds_snapshot(self):
+        out = StringIO()
+        with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', FakeWorldBank()):
+            call_command('fetch_worldbank_data', '--rate', '1000', stdout=out)
+        snapshot = get_snapshot(get_data_version())
+        self.assertEqual(len(snapshot), StatisticValue.objects.count())
+        self.assertEqual(len(snapshot.indicators), 20)
+
+
+class CorrelationTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:correlations')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matches_pandas_pairwise_complete(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.normal(size=(200, 6))
+        matrix[:, 1] = matrix[:, 0] * 3 + rng.normal(size=200)
+        matrix[rng.random(matrix.shape) < 0.3] = np.nan
+        matrix[:, 4] = 1.0
+        values, counts = correlation_matrix(matrix, min_periods=5)
+        expected = pd.DataFrame(matrix).corr(min_periods=5).to_numpy()
+        np.testing.assert_allclose(values, expected, atol=1e-12)
+        self.assertEqual(counts[0, 1], int((~np.isnan(matrix[:, 0]) & ~np.isnan(matrix[:, 1])).sum()))
+
+    def test_spearman_without_missing_values_matches_pandas(self):
+        matrix = np.random.default_rng(1).normal(size=(50, 4)) ** 3
+        values, _ = correlation_matrix(matrix, method='spearman')
+        np.testing.assert_allclose(values, pd.DataFrame(matrix).corr(method='spearman').to_numpy(), atol=1e-12)
+
+    def test_spearman_with_missing_values_ranks_each_pair(self):
+        rng = np.random.default_rng(2)
+        matrix = rng.normal(size=(120, 5)) ** 3
+        matrix[:, 1] = matrix[:, 0] + rng.normal(size=120)
+        matrix[rng.random(matrix.shape) < 0.3] = np.nan
+        matrix[:, 3] = 2.0
+        values, counts = correlation_matrix(matrix, method='spearman', min_periods=5)
+        expected = pd.DataFrame(matrix).corr(method='spearman', min_periods=5).to_numpy()
+        np.testing.assert_allclose(values, expected, atol=1e-12)
+        self.assertEqual(counts[0, 1], int((~np.isnan(matrix[:, 0]) & ~np.isnan(matrix[:, 1])).sum()))
+
+    def test_endpoint_returns_matrix_and_counts(self):
+        response = self.client.get(self.url, {'country': 'C01,C02,C03', 'start_year': 2021})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        body = response.json()
+        self.assertEqual([i['code'] for i in body['indicators']], ['IND.A', 'IND.B'])
+        self.assertEqual(body['counts'], [[9, 9], [9, 9]])
+        self.assertAlmostEqual(body['matrix'][0][0], 1.0)
+        self.assertEqual(self.client.get(self.url, {'country': 'C03,C02,C01', 'start_year': 2021})['X-Cache'], 'HIT')
+
+    def test_snapshot_gives_same_result(self):
+        from_database = self.client.get(self.url, {'method': 'spearman'}).json()
+        cache.clear()
+        with tempfile.TemporaryDirectory() as directory, override_settings(SNAPSHOT_DIR=directory):
+            rebuild_snapshot(0)
+            self.assertEqual(self.client.get(self.url, {'method': 'spearman'}).json(), from_database)
+
+    def test_heatmap_and_validation(self):
+        response = self.client.get(self.url, {'format': 'html'})
+        self.assertContains(response, 'plotly')
+        self.assertEqual(self.client.get(self.url, {'method': 'kendall'}).status_code, 400)
+
+
+class AsyncViewTests(ComparisonDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_async_index_matches_sync_index(self):
+        data = {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C01', 'C02']}
+        response = await self.async_client.post(reverse('stats_comparison:index_async'), data)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Comparison of Indicator A vs Indicator B', response.context['plot'])
+        response = await self.async_client.post(reverse('stats_comparison:index_async'), data)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    async def test_async_index_reports_missing_data(self):
+        response = await self.async_client.post(reverse('stats_comparison:index_async'), {
+            'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['UNKNOWN'],
+        })
+        self.assertEqual(response.context['error'], 'No matching data points found for the selected combination')
+
+    async def test_async_api_matches_sync_api(self):
+        await sync_to_async(bump_data_version)()
+        params = {'page_size': 7, 'indicator': 'IND.B'}
+        sync_response = await self.async_client.get(reverse('stats_comparison:powerbi_api'), params)
+        async_response = await self.async_client.get(reverse('stats_comparison:powerbi_api_async'), params)
+        expected, actual = sync_response.json(), async_response.json()
+        self.assertEqual(actual['results'], expected['results'])
+        self.assertEqual(actual['next_cursor'], expected['next_cursor'])
+        for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+            self.assertEqual(async_response[header], sync_response[header])
+        response = await self.async_client.get(
+            reverse('stats_comparison:powerbi_api_async'), params, headers={'If-None-Match': sync_response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('stats_comparison:powerbi_api_async'), {'cursor': '!'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_api_default_list_matches_sync_api(self):
+        params = {'country': 'C04'}
+        bodies = []
+        for name in ('powerbi_api', 'powerbi_api_async'):
+            response = await self.async_client.get(reverse(f'stats_comparison:{name}'), params)
+            if response.is_async:
+                body = b''.join([chunk async for chunk in response.streaming_content])
+            else:
+                # The sync view's rows are read from the database while streaming
+                body = await sync_to_async(lambda: b''.join(response.streaming_content))()
+            bodies.append(json.loads(body))
+        self.assertEqual(len(bodies[0]), 9)
+        self.assertEqual(bodies[1], bodies[0])
+
+    @override_settings(API_STREAM_CHUNK_SIZE=4)
+    async def test_async_api_streams_csv(self):
+        response = await self.async_client.get(
+            reverse('stats_comparison:powerbi_api_async'), {'stream': 'csv', 'country': 'C05'}
+        )
+        lines = ''.join([chunk.decode() async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(lines[0], 'country,country_code,region,indicator,indicator_code,year,value')
+        self.assertEqual(len(lines), 1 + 9)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def test_reports_throughput(self):
+        out = StringIO()
+        call_command(
+            'load_test', self.live_server_url + reverse('stats_comparison:powerbi_api'),
+            '--concurrency', '4', '--requests', '12', stdout=out, stderr=StringIO()
+        )
+        result = json.loads(out.getvalue())[0]
+        self.assertEqual(result['requests'], 12)
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['requests_per_second'], 0)
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_tiny_run_reports_every_scenario(self):
+        # In a fresh interpreter, as from the shell: the command builds its own database
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'db.sqlite3')
+            result = subprocess.run(
+                [
+                    sys.executable, 'manage.py', 'benchmark', '--countries', '3', '--indicators', '4',
+                    '--years', '2', '--repeat', '1', '--workers', '2'
+                ],
+                capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+                env={**os.environ, 'DB_NAME': database, 'DB_ENGINE': ''}
+            )
+            self.assertFalse(os.path.exists(database))
+        report = json.loads(result.stdout)
+        self.assertEqual(report['scale'], {'countries': 3, 'indicators': 4, 'years': 2})
+        results = {result['name']: result for result in report['results']}
+        self.assertEqual(results['ingest']['values'], 3 * 4 * 2)
+        self.assertEqual(results['startup']['queries'], 0)
+        self.assertIn('powerbi_api_page', results)
+        self.assertIn('export_csv_warm', results)
+        for result in results.values():
+            self.assertLessEqual(result['seconds_min'], result['seconds_median'])
+            self.assertGreaterEqual(result['queries'], 0)
+
+
+class PlotDataTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:plot_data')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_returns_typed_array_payload(self):
+        response = self.client.get(self.url, {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C01', 'C02']})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        figure = response.json()
+        trace = figure['data'][0]
+        self.assertEqual(trace['x']['dtype'], 'f8')
+        x = np.frombuffer(base64.b64decode(trace['x']['bdata']), dtype='<f8')
+        y = np.frombuffer(base64.b64decode(trace['y']['bdata']), dtype='<f8')
+        pairs = pair_indicator_values('IND.A', 'IND.B', ['C01', 'C02'])
+        self.assertEqual(list(x), list(pairs.values1))
+        self.assertEqual(list(y), list(pairs.values2))
+        self.assertEqual(trace['text'][0], 'Country 01 (2021)')
+        self.assertEqual(figure['layout']['xaxis']['title']['text'], 'Indicator A')
+
+        response = self.client.get(self.url, {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': 'C02,C01'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_payload_is_far_smaller_than_inline_html(self):
+        params = {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': [c.code for c in self.countries]}
+        payload = self.client.get(self.url, params).content
+        html = self.client.post(reverse('stats_comparison:index'), params).context['plot']
+        self.assertNotIn('plotly.js v', html)
+        self.assertLess(len(payload), len(html))
+
+    def test_page_loads_the_plotly_js_of_the_installed_package(self):
+        from django.contrib.staticfiles import finders
+        from django.templatetags.static import static
+        from plotly.offline import get_plotlyjs_version
+
+        self.assertContains(self.client.get(reverse('stats_comparison:index')), static(PLOTLY_JS))
+        with open(finders.find(PLOTLY_JS), encoding='utf-8') as f:
+            self.assertIn(f'plotly.js v{get_plotlyjs_version()}', f.read(500))
+
+    def test_errors_are_json(self):
+        response = self.client.get(self.url, {'indicator1': 'IND.A'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Please select both indicators and at least one country')
+
+
+class TimeSeriesTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:plot_data')
+
+    def setUp(self):
+        cache.clear()
+
+    def long_pairs(self, n_countries=200, n_years=60):
+        """PairedValues for n_countries x n_years, sorted by country and year"""
+        rng = np.random.default_rng(0)
+        codes = np.repeat([f'{i:03d}' for i in range(n_countries)], n_years).astype(object)
+        return PairedValues(
+            country_codes=codes,
+            country_names=np.array([f'Country {code}' for code in codes], dtype=object),
+            years=np.tile(np.arange(1960, 1960 + n_years), n_countries),
+            values1=rng.normal(size=n_countries * n_years).cumsum(),
+            values2=rng.normal(size=n_countries * n_years).cumsum(),
+        )
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 50.0
+        keep = lttb(x, y, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertIn(37, keep)
+        self.assertEqual(list(lttb(x, y, 200)), list(range(100)))
+
+    def test_trajectories_are_capped(self):
+        pairs = self.long_pairs()
+        figure = trajectory_figure(pairs, 'A', 'B', max_points=2000, resolution='year')
+        self.assertEqual(len(figure['data']), 200)
+        self.assertLessEqual(figure['summary']['points'], 2000)
+        self.assertEqual(figure['data'][0]['text'][0], '1960')
+        self.assertEqual(figure['data'][0]['text'][-1], '2019')
+
+        figure = trajectory_figure(pairs, 'A', 'B', max_points=2000)
+        self.assertEqual(figure['summary']['resolution'], 'decade')
+        self.assertEqual(figure['summary']['points'], 200 * 6)
+        self.assertEqual(figure['data'][0]['text'], ['1960s', '1970s', '1980s', '1990s', '2000s', '2010s'])
+
+    def test_every_mode_and_resolution_stays_within_max_points(self):
+        pairs = self.long_pairs(n_countries=150, n_years=60)
+        points = {
+            trajectory_figure: lambda figure: sum(len(trace['text']) for trace in figure['data']),
+            animation_figure: lambda figure: sum(len(frame['data'][0]['text']) for frame in figure['frames']),
+        }
+        for make_figure, count in points.items():
+            for resolution in RESOLUTIONS:
+                for max_points in (10, 100, 500, 2000):
+                    with self.subTest(make_figure.__name__, resolution=resolution, max_points=max_points):
+                        figure = make_figure(pairs, 'A', 'B', max_points=max_points, resolution=resolution)
+                        self.assertLessEqual(count(figure), max_points)
+                        self.assertEqual(figure['summary']['points'], count(figure))
+
+    def test_animation_keeps_evenly_spaced_frames(self):
+        figure = animation_figure(self.long_pairs(n_countries=10, n_years=60), 'A', 'B', max_points=100, resolution='year')
+        names = [frame['name'] for frame in figure['frames']]
+        self.assertEqual(len(names), 10)
+        self.assertEqual((names[0], names[-1]), ('1960', '2019'))
+        self.assertEqual(figure['summary']['frames'], 10)
+        self.assertEqual(len(figure['layout']['sliders'][0]['steps']), 10)
+
+    def test_decades_are_averaged(self):
+        pairs = self.long_pairs(n_countries=1, n_years=20)
+        figure = animation_figure(pairs, 'A', 'B', resolution='decade')
+        self.assertEqual([frame['name'] for frame in figure['frames']], ['1960s', '1970s'])
+        x = np.frombuffer(base64.b64decode(figure['frames'][1]['data'][0]['x']['bdata']), dtype='<f8')
+        self.assertAlmostEqual(x[0], pairs.values1[10:].mean())
+
+    def test_animation_endpoint(self):
+        params = {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C01', 'C02', 'C03'], 'mode': 'animation'}
+        figure = self.client.get(self.url, params).json()
+        self.assertEqual([frame['name'] for frame in figure['frames']], ['2021', '2022', '2023'])
+        self.assertEqual(figure['frames'][0]['data'][0]['text'], ['Country 01', 'Country 02', 'Country 03'])
+        self.assertEqual(len(figure['layout']['sliders'][0]['steps']), 3)
+        self.assertIsNotNone(figure['layout']['xaxis']['range'])
+
+        response = self.client.get(self.url, {**params, 'mode': 'trajectory'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['data']), 3)
+
+    def test_invalid_options(self):
+        params = {'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': 'C01'}
+        self.assertEqual(self.client.get(self.url, {**params, 'mode': 'bars'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {**params, 'resolution': 'century'}).status_code, 400)
+
+
+class AggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for code, region, income in [('AA1', 'R1', 'HIC'), ('AA2', 'R1', 'LIC'), ('BB1', 'R2', 'HIC'), ('BB2', 'R2', '')]:
+            Country.objects.create(code=code, name=f'Country {code}', region=region, income_level=income)
+        Indicator.objects.create(code='IND.X', name='Indicator X', description='')
+        Indicator.objects.create(code='IND.Y', name='Indicator Y', description='')
+        Indicator.objects.create(code='SP.POP.TOTL', name='Population', description='')
+        rows = []
+        for year in (2020, 2021):
+            for code, x, y, population in [('AA1', 10, 1, 100), ('AA2', 20, 2, 300), ('BB1', 5, 3, None), ('BB2', 7, 4, 50)]:
+                rows.append(StatisticValue(country_id=code, indicator_id='IND.X', year=year, value=x + year - 2020))
+                rows.append(StatisticValue(country_id=code, indicator_id='IND.Y', year=year, value=y))
+                rows.append(StatisticValue(country_id=code, indicator_id='SP.POP.TOTL', year=year, value=population))
+        StatisticValue.objects.bulk_create(rows)
+
+    def aggregate(self, indicator='IND.X', year=2020, group_type='region', group='R1'):
+        return GroupAggregate.objects.get(indicator_id=indicator, year=year, group_type=group_type, group=group)
+
+    def test_statistics(self):
+        compute_aggregates()
+        r1 = self.aggregate()
+        self.assertEqual((r1.count, r1.weighted_count), (2, 2))
+        self.assertEqual((r1.mean, r1.median), (15.0, 15.0))
+        self.assertAlmostEqual(r1.weighted_mean, (10 * 100 + 20 * 300) / 400)
+        # BB1 has no population, so only BB2 weighs in
+        r2 = self.aggregate(group='R2')
+        self.assertEqual((r2.count, r2.weighted_count, r2.weighted_mean), (2, 1, 7.0))
+        hic = self.aggregate(group_type='income', group='HIC')
+        self.assertEqual((hic.count, hic.mean), (2, 7.5))
+        # Countries without an income group are left out
+        self.assertFalse(GroupAggregate.objects.filter(group_type='income', group='').exists())
+        self.assertEqual(self.aggregate(year=2021).mean, 16.0)
+
+    def test_only_touched_indicator_years_are_recomputed(self):
+        compute_aggregates()
+        untouched = self.aggregate(year=2021).pk
+        StatisticValue.objects.filter(indicator_id='IND.X', year=2020, country_id='AA1').update(value=30.0)
+        compute_aggregates({'IND.X': {2020}})
+        self.assertEqual(self.aggregate().mean, 25.0)
+        self.assertEqual(self.aggregate(year=2021).pk, untouched)
+        self.assertEqual(self.aggregate(indicator='IND.Y').pk, self.aggregate(indicator='IND.Y').pk)
+
+    def test_population_changes_reweight_every_indicator(self):
+        compute_aggregates()
+        StatisticValue.objects.filter(indicator_id='SP.POP.TOTL', year=2020, country_id='AA2').update(value=100.0)
+        with self.assertNumQueries(1 + 1 + 3 * 3 + 2):
+            # Indicator list, population, then read, delete and insert per indicator in one savepoint
+            compute_aggregates({'SP.POP.TOTL': {2020}})
+        self.assertAlmostEqual(self.aggregate().weighted_mean, 15.0)
+        self.assertAlmostEqual(self.aggregate(indicator='IND.Y').weighted_mean, 1.5)
+        self.assertAlmostEqual(self.aggregate(year=2021).weighted_mean, (11 * 100 + 21 * 300) / 400)
+
+    def test_api_and_plot(self):
+        compute_aggregates()
+        response = self.client.get(reverse('stats_comparison:aggregates'), {'indicator': 'IND.X', 'start_year': 2021})
+        results = response.json()['results']
+        self.assertEqual([(r['group'], r['year']) for r in results], [('R1', 2021), ('R2', 2021)])
+        self.assertEqual(results[0]['mean'], 16.0)
+        self.assertEqual(self.client.get(reverse('stats_comparison:aggregates')).status_code, 400)
+
+        response = self.client.get(reverse('stats_comparison:plot_data'), {
+            'indicator1': 'IND.X', 'indicator2': 'IND.Y', 'aggregate': 'income', 'statistic': 'mean',
+            'countries': 'AA1',
+        })
+        trace = response.json()['data'][0]
+        self.assertEqual(trace['text'], ['HIC (2020)', 'HIC (2021)', 'LIC (2020)', 'LIC (2021)'])
+        y = np.frombuffer(base64.b64decode(trace['y']['bdata']), dtype='<f8')
+        self.assertEqual(list(y), [2.0, 2.0, 2.0, 2.0])
+
+
+class MetadataTests(ComparisonDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_metadata_document(self):
+        response = self.client.get(reverse('stats_comparison:metadata'))
+        body = response.json()
+        self.assertEqual(body['indicators'], [['IND.A', 'Indicator A'], ['IND.B', 'Indicator B']])
+        self.assertEqual(body['countries'][0], ['C00', 'Country 00', 'Test Region'])
+        self.assertEqual(response['ETag'], '"metadata-0"')
+
+    def test_conditional_requests(self):
+        bump_data_version()
+        response = self.client.get(reverse('stats_comparison:metadata'))
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(reverse('stats_comparison:metadata'), HTTP_IF_NONE_MATCH='"metadata-1"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        bump_data_version()
+        response = self.client.get(reverse('stats_comparison:metadata'), HTTP_IF_NONE_MATCH='"metadata-1"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        url = reverse('stats_comparison:metadata_search')
+        body = self.client.get(url, {'type': 'country', 'q': 'country 1'}).json()
+        self.assertEqual(len(body['results']), 10)
+        self.assertEqual(body['results'][0], {'id': 'C10', 'text': 'Country 10'})
+        self.assertFalse(body['pagination']['more'])
+        body = self.client.get(url, {'type': 'indicator', 'q': 'ind.b'}).json()
+        self.assertEqual(body['results'], [{'id': 'IND.B', 'text': 'Indicator B'}])
+        self.assertEqual(self.client.get(url, {'type': 'region'}).status_code, 400)
+
+    @override_settings(DATA_VERSION_TTL=60)
+    def test_repeat_loads_cost_no_queries(self):
+        self.client.get(reverse('stats_comparison:metadata_search'), {'type': 'country'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('stats_comparison:index'))
+            self.client.get(reverse('stats_comparison:metadata'))
+            self.client.get(reverse('stats_comparison:metadata_search'), {'type': 'indicator', 'q': 'A'})
+
+    def test_post_keeps_selection(self):
+        response = self.client.post(reverse('stats_comparison:index'), {
+            'indicator1': 'IND.A', 'indicator2': 'IND.B', 'countries': ['C02', 'C01'],
+        })
+        self.assertEqual(response.context['selected_indicator1'], [('IND.A', 'Indicator A')])
+        self.assertEqual(response.context['selected_countries'], [('C02', 'Country 02'), ('C01', 'Country 01')])
+        self.assertContains(response, '<option value="C02" selected>Country 02</option>', html=True)
+
+
+class QueryApiTests(ComparisonDataMixin, TestCase):
+    url = reverse('stats_comparison:query')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_projection_and_pagination(self):
+        seen = []
+        params = {'fields': 'country_code,year,value', 'indicator': 'IND.A', 'page_size': 30}
+        while True:
+            body = self.client.get(self.url, params).json()
+            self.assertLessEqual(len(body['results']), 30)
+            seen.extend(body['results'])
+            if not body['next_cursor']:
+                break
+            params['cursor'] = body['next_cursor']
+        self.assertEqual(len(seen), 100)
+        self.assertEqual(seen[0], {'country_code': 'C00', 'year': 2019, 'value': 2019.0})
+
+    def test_rows_carry_names_from_metadata(self):
+        body = self.client.get(self.url, {'indicator': 'IND.B', 'country': 'C01', 'start_year': 2022}).json()
+        self.assertEqual(body['results'][0], {
+            'country': 'Country 01', 'country_code': 'C01', 'region': 'Test Region',
+            'indicator': 'Indicator B', 'indicator_code': 'IND.B', 'year': 2022, 'value': 2.0,
+        })
+
+    def test_group_by_indicator_and_year(self):
+        body = self.client.get(self.url, {
+            'group_by': 'indicator,year', 'agg': 'mean,sum,min,max,count', 'end_year': 2020,
+        }).json()
+        self.assertEqual(body['results'][0], {
+            'indicator_code': 'IND.A', 'indicator': 'Indicator A', 'year': 2019,
+            'mean': 2028.5, 'sum': 40570.0, 'min': 2019.0, 'max': 2038.0, 'count': 20,
+        })
+        # Nulls are left out of every aggregate
+        self.assertEqual(body['results'][-1]['count'], 0)
+        self.assertIsNone(body['results'][-1]['mean'])
+
+    def test_latest_non_null_per_country(self):
+        StatisticValue.objects.filter(country_id='C03', indicator_id='IND.B', year=2023).update(value=None)
+        body = self.client.get(self.url, {
+            'indicator': 'IND.B', 'country': 'C02,C03', 'group_by': 'country', 'agg': 'latest,count',
+        }).json()
+        self.assertEqual(body['results'], [
+            {'country_code': 'C02', 'country': 'Country 02', 'region': 'Test Region',
+             'count': 3, 'latest': 4.0, 'latest_year': 2023},
+            {'country_code': 'C03', 'country': 'Country 03', 'region': 'Test Region',
+             'count': 2, 'latest': 6.0, 'latest_year': 2022},
+        ])
+
+    def test_regions(self):
+        Country.objects.filter(code='C00').update(region='Elsewhere')
+        body = self.client.get(self.url, {'region': 'Elsewhere', 'agg': 'count'}).json()
+        self.assertEqual(body['results'], [{'count': 8}])
+        body = self.client.get(self.url, {'group_by': 'region', 'agg': 'count', 'indicator': 'IND.A'}).json()
+        self.assertEqual(body['results'], [
+            {'region': 'Elsewhere', 'count': 5}, {'region': 'Test Region', 'count': 95},
+        ])
+        self.assertEqual(self.client.get(self.url, {'region': 'Nowhere'}).json()['results'], [])
+
+    @override_settings(DATA_VERSION_TTL=60)
+    def test_one_query_per_request(self):
+        self.client.get(self.url, {'agg': 'count'})
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'group_by': 'country,indicator', 'agg': 'mean,max'})
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'fields': 'country,indicator,value'})
+
+    def test_invalid_parameters(self):
+        for params in [
+            {'agg': 'median'},
+            {'group_by': 'income', 'agg': 'mean'},
+            {'group_by': 'country'},
+            {'fields': 'value', 'agg': 'mean'},
+            {'agg': 'latest'},
+            {'group_by': 'country,year', 'agg': 'latest'},
+            {'cursor': 'nope'},
+        ]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+        with override_settings(QUERY_MAX_GROUPS=10):
+            response = self.client.get(self.url, {'group_by': 'country', 'agg': 'count'})
+        self.assertEqual(response.status_code, 400)
+
+
+class JobTests(ComparisonDataMixin, TestCase):
+    jobs_url = reverse('stats_comparison:jobs')
+
+    def setUp(self):
+        self.version = bump_data_version()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(EXPORT_CACHE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_export_job_round_trip(self):
+        response = self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job['status'], job['download_url']), ('queued', None))
+        self.assertEqual(response['Location'], job['status_url'])
+        # The same request while the job is pending returns the same job
+        self.assertEqual(self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).json()['id'], job['id'])
+
+        run_job(claim_next('worker'))
+        job = self.client.get(job['status_url']).json()
+        self.assertEqual((job['status'], job['progress']), ('succeeded', 1.0))
+        response = self.client.get(job['download_url'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + StatisticValue.objects.count())
+
+        # Until the next ingest the stored file is reused without running a job
+        export_url = reverse('stats_comparison:export_powerbi') + '?format=csv&background=1'
+        self.assertEqual(self.client.get(export_url).status_code, 405)
+        response = self.client.post(export_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'succeeded')
+        bump_data_version()
+        self.assertEqual(self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).status_code, 202)
+        self.assertEqual(self.client.get(job['download_url']).status_code, 200)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.post(self.jobs_url, {'kind': 'export', 'format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.post(self.jobs_url, {'kind': 'compile'}).status_code, 400)
+        self.assertEqual(self.client.post(self.jobs_url, {'kind': 'fetch'}).status_code, 403)
+        for body in ({'kind': ['export']}, {'kind': 'export', 'format': ['csv']}, {'kind': 'export', 'format': {}}):
+            response = self.client.post(self.jobs_url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        # Only a POST queues a background export
+        self.assertEqual(self.client.get(reverse('stats_comparison:export_powerbi'), {'background': '1'}).status_code, 405)
+        self.assertEqual(self.client.post(reverse('stats_comparison:export_powerbi')).status_code, 405)
+        self.assertFalse(Job.objects.filter(kind=Job.EXPORT).exists())
+        fetch = Job.objects.create(kind=Job.FETCH)
+        self.assertEqual(self.client.get(reverse('stats_comparison:job', args=[fetch.pk])).status_code, 404)
+        export = self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).json()
+        response = self.client.get(reverse('stats_comparison:job_download', args=[export['id']]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_jobs_are_private_to_whoever_queued_them(self):
+        job = self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).json()
+        run_job(claim_next('worker'))
+        other = Client()
+        for url in (job['status_url'], reverse('stats_comparison:job_download', args=[job['id']])):
+            self.assertEqual(other.get(url).status_code, 404)
+        self.assertEqual(other.post(reverse('stats_comparison:cancel_job', args=[job['id']])).status_code, 404)
+        # A second client queueing the same export gets a job of its own
+        self.assertNotEqual(other.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).json()['id'], job['id'])
+
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        other.force_login(staff)
+        self.assertEqual(other.get(job['status_url']).json()['status'], 'succeeded')
+        self.assertEqual(self.client.get(job['status_url']).json()['status'], 'succeeded')
+
+    def test_concurrency_limit(self):
+        with override_settings(JOB_CONCURRENCY={'export': 1, 'fetch': 1}):
+            first = enqueue(Job.EXPORT, {'format': 'csv'})
+            enqueue(Job.EXPORT, {'format': 'xlsx'})
+            fetch = Job.objects.create(kind=Job.FETCH)
+            self.assertEqual(claim_next('a').pk, first.pk)
+            # The second export waits for the first; the fetch has its own limit
+            self.assertEqual(claim_next('b').pk, fetch.pk)
+            self.assertIsNone(claim_next('c'))
+
+    def test_cancellation(self):
+        queued = self.client.post(self.jobs_url, {'kind': 'export', 'format': 'csv'}).json()
+        response = self.client.post(reverse('stats_comparison:cancel_job', args=[queued['id']]))
+        self.assertEqual(response.json()['status'], 'cancelled')
+
+        self.client.post(self.jobs_url, {'kind': 'export', 'format': 'xlsx'})
+        running = claim_next('worker')
+        self.client.post(reverse('stats_comparison:cancel_job', args=[running.pk]))
+        with self.assertRaises(JobCancelled):
+            ProgressReporter(running)(0.5, 'Halfway')
+        self.assertEqual(run_job(running).status, Job.CANCELLED)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_stale_job_marked_failed(self):
+        job = enqueue(Job.EXPORT, {'format': 'csv'})
+        claim_next('worker')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=job.created_at.replace(year=2000))
+        self.assertIsNone(claim_next('other'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_fetch_job_reports_progress(self):
+        job = enqueue(Job.FETCH, {'start_year': '2020', 'end_year': '2021', 'rate': '1000', 'incremental': 'false'})
+        self.assertEqual(job.params, {'start_year': 2020, 'end_year': 2021, 'rate': 1000.0, 'incremental': False})
+        job = claim_next('worker')
+        reports = []
+        report = ProgressReporter.__call__
+
+        def record(reporter, fraction, message=None):
+            reports.append(fraction)
+            return report(reporter, fraction, message)
+
+        with mock.patch('stats_comparison.management.commands.fetch_worldbank_data.wb', FakeWorldBank()), \
+                mock.patch.object(ProgressReporter, '__call__', record):
+            job = run_job(job)
+        self.assertEqual((job.status, job.progress, job.result_path), (Job.SUCCEEDED, 1.0, ''))
+        self.assertEqual(reports, sorted(reports))
+        self.assertIn(0.9, reports)
+        self.assertTrue(StatisticValue.objects.filter(indicator_id='SP.POP.TOTL', year=2021).exists())
+
+
+class RunJobsCommandTests(TransactionTestCase):
+    # Jobs run on worker threads with their own connections, so the data must be committed.
+    # The in-memory test database fails on a table lock at once instead of waiting, so this
+    # also covers the retries of job-table writes that contend with each other.
+    def test_runs_queued_jobs_and_exits(self):
+        Country.objects.create(code='AAA', name='Country A', region='Test Region')
+        Indicator.objects.create(code='IND.A', name='Indicator A', description='')
+        StatisticValue.objects.create(country_id='AAA', indicator_id='IND.A', year=2020, value=1.5)
+        with tempfile.TemporaryDirectory() as directory, override_settings(EXPORT_CACHE_DIR=directory):
+            jobs = [enqueue(Job.EXPORT, {'format': export_format}) for export_format in ('csv', 'xlsx')]
+            out = StringIO()
+            call_command('run_jobs', '--once', '--threads', '2', '--poll-interval', '0.01', stdout=out)
+            for job in jobs:
+                job.refresh_from_db()
+                self.assertEqual(job.status, Job.SUCCEEDED)
+                self.assertTrue(os.path.exists(job.result_path))
+        self.assertIn(f'Job {jobs[0].pk} (export) succeeded', out.getvalue())
+
+
+class StartupTests(SimpleTestCase):
+    # What a worker boot or a management command imports: the apps, the URLconf and its views
+    startup = (
+        'import sys, django; django.setup(); '
+        'import stats_comparison.urls, stats_comparison.management.commands.check_data; '
+        "print(','.join(sorted(name for name in ('pandas', 'plotly', 'wbgapi') if name in sys.modules)))"
+    )
+
+    # Seconds of -X importtime allowed for STARTUP_CODE, best of three fresh interpreters. It is
+    # about three times a typical run, so only a regression fails it; set STARTUP_IMPORT_BUDGET
+    # to tighten it on a known machine, or to 0 to skip it
+    import_budget = float(os.environ.get('STARTUP_IMPORT_BUDGET', '1.5'))
+
+    def run_startup(self, code, *options):
+        return subprocess.run(
+            [sys.executable, *options, '-c', code],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'worldbank_stats.settings', 'PRELOAD_MODULES': ''}
+        )
+
+    def import_time(self):
+        """Total -X importtime of STARTUP_CODE in a fresh interpreter, in seconds"""
+        total = 0
+        for line in self.run_startup(STARTUP_CODE, '-X', 'importtime').stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, name = line.split('|')
+            # Top-level imports are indented by one space; their cumulative times add up to the total
+            if cumulative.strip().isdigit() and not name.startswith('  '):
+                total += int(cumulative)
+        return total / 1e6
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        self.assertEqual(self.run_startup(self.startup).stdout.strip(), '')
+
+    def test_startup_imports_fit_the_budget(self):
+        if self.import_budget <= 0:
+            self.skipTest('STARTUP_IMPORT_BUDGET is 0')
+        seconds = min(self.import_time() for _ in range(3))
+        self.assertLess(seconds, self.import_budget)
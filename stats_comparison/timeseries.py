@@ -0,0 +1,224 @@
+"""Time-series views of a comparison: per-country trajectories and per-year animation.
+
+Both modes cap the number of points sent to the browser: long year ranges
+are averaged by decade, and whatever is still over the cap is thinned.
+Trajectories are thinned with Largest-Triangle-Three-Buckets (LTTB), which
+keeps the points that shape each line; animations keep evenly spaced
+frames, and evenly spaced countries if a single frame is too big.
+"""
+import numpy as np
+
+from .comparison import typed_array
+
+TIMESERIES_MODES = ('trajectory', 'animation')
+RESOLUTIONS = ('auto', 'year', 'decade')
+
+
+def lttb(x, y, threshold):
+    """Indices of at most ``threshold`` points of the polyline (x, y) chosen by LTTB.
+
+    The first and last points are always kept. Points are taken in the
+    given order, so x need not be monotonic.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold <= 0:
+        return np.empty(0, dtype=np.int64)
+    if threshold <= 2:
+        return np.array([0, n - 1][:threshold])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected.append(a)
+    selected.append(n - 1)
+    return np.array(selected)
+
+
+def per_period(pairs, resolution):
+    """Pairs as a DataFrame of country/name/period/value1/value2, averaged by decade if asked"""
+    import pandas as pd
+
+    df = pd.DataFrame({
+        'country': pairs.country_codes,
+        'name': pairs.country_names,
+        'period': pairs.years,
+        'value1': pairs.values1,
+        'value2': pairs.values2,
+    })
+    if resolution == 'decade':
+        df['period'] = df['period'] // 10 * 10
+        df = df.groupby(['name', 'country', 'period'], sort=True, as_index=False)[['value1', 'value2']].mean()
+    return df
+
+
+def choose_resolution(pairs, resolution, max_points):
+    """Resolve 'auto' to decades when yearly points would exceed ``max_points``"""
+    if resolution != 'auto':
+        return resolution
+    return 'decade' if len(pairs.years) > max_points else 'year'
+
+
+def _spread(n, k):
+    """``k`` evenly spaced indices of range(n), including the first and last when k > 1; k <= n"""
+    return np.linspace(0, n - 1, k).round().astype(np.int64)
+
+
+def line_budgets(n_lines, max_points):
+    """Points each of ``n_lines`` lines may keep so that together they stay within ``max_points``.
+
+    The remainder of an even split goes to evenly spaced lines; with more
+    lines than points, some lines get none.
+    """
+    budgets = np.full(n_lines, max_points // max(1, n_lines), dtype=np.int64)
+    budgets[_spread(n_lines, max_points % n_lines if n_lines else 0)] += 1
+    return budgets
+
+
+def thin_frames(df, max_points):
+    """Rows of ``df`` in at most ``max_points`` points, dropping whole frames (periods).
+
+    If one frame alone is over the cap, evenly spaced countries are kept in
+    every frame first. Frames are then kept evenly spaced, including the
+    first and last.
+    """
+    if len(df) <= max_points:
+        return df
+    sizes = df.groupby('period', sort=True).size()
+    if sizes.max() > max_points:
+        countries = df['country'].unique()
+        df = df[df['country'].isin(countries[_spread(len(countries), max_points)])]
+        sizes = df.groupby('period', sort=True).size()
+    periods, counts = sizes.index.to_numpy(), sizes.to_numpy()
+    for n_frames in range(len(periods), 0, -1):
+        kept = np.unique(_spread(len(periods), n_frames))
+        if counts[kept].sum() <= max_points:
+            break
+    return df[df['period'].isin(periods[kept])]
+
+
+def _period_label(period, resolution):
+    return f'{period}s' if resolution == 'decade' else str(period)
+
+
+def _padded_range(values):
+    low, high = float(np.min(values)), float(np.max(values))
+    pad = (high - low) * 0.05 or abs(high) * 0.05 or 1.0
+    return [low - pad, high + pad]
+
+
+def trajectory_figure(pairs, ind1_name, ind2_name, max_points=2000, resolution='auto'):
+    """One line per country through its (indicator 1, indicator 2) values over time"""
+    resolution = choose_resolution(pairs, resolution, max_points)
+    df = per_period(pairs, resolution)
+    countries = list(dict.fromkeys(df['country']))
+    budgets = line_budgets(len(countries), max_points)
+    # LTTB compares areas, so put both axes on the same scale first
+    scale1 = np.ptp(df['value1'].to_numpy()) or 1.0
+    scale2 = np.ptp(df['value2'].to_numpy()) or 1.0
+
+    traces = []
+    points = 0
+    for (code, group), budget in zip(df.groupby('country', sort=False), budgets):
+        if not budget:
+            continue
+        value1 = group['value1'].to_numpy()
+        value2 = group['value2'].to_numpy()
+        keep = lttb(value1 / scale1, value2 / scale2, budget)
+        points += len(keep)
+        traces.append({
+            'type': 'scatter',
+            'mode': 'lines+markers',
+            'name': group['name'].iloc[0],
+            'x': typed_array(value1[keep]),
+            'y': typed_array(value2[keep]),
+            'text': [_period_label(period, resolution) for period in group['period'].to_numpy()[keep].tolist()],
+            'hovertemplate': (
+                f'%{{fullData.name}} (%{{text}})<br>{ind1_name}=%{{x}}<br>{ind2_name}=%{{y}}<extra></extra>'
+            ),
+        })
+    return {
+        'data': traces,
+        'layout': {
+            'title': {'text': f'{ind1_name} vs {ind2_name} over time'},
+            'xaxis': {'title': {'text': ind1_name}},
+            'yaxis': {'title': {'text': ind2_name}},
+        },
+        'summary': {'mode': 'trajectory', 'resolution': resolution, 'points': points},
+    }
+
+
+def animation_figure(pairs, ind1_name, ind2_name, max_points=2000, resolution='auto'):
+    """One animation frame per year (or decade) with a point per country"""
+    resolution = choose_resolution(pairs, resolution, max_points)
+    df = thin_frames(per_period(pairs, resolution), max_points)
+    periods = sorted(df['period'].unique().tolist())
+    hovertemplate = f'%{{text}}<br>{ind1_name}=%{{x}}<br>{ind2_name}=%{{y}}<extra></extra>'
+
+    frames = []
+    for period, group in df.groupby('period', sort=True):
+        frames.append({
+            'name': _period_label(period, resolution),
+            'data': [{
+                'type': 'scatter',
+                'mode': 'markers+text',
+                'x': typed_array(group['value1'].to_numpy()),
+                'y': typed_array(group['value2'].to_numpy()),
+                'text': group['name'].tolist(),
+                'textposition': 'top center',
+                'marker': {'size': 10},
+                'hovertemplate': hovertemplate,
+            }],
+        })
+    step_args = {'mode': 'immediate', 'frame': {'duration': 500, 'redraw': False}, 'transition': {'duration': 300}}
+    return {
+        'data': frames[0]['data'] if frames else [],
+        'frames': frames,
+        'layout': {
+            'title': {'text': f'{ind1_name} vs {ind2_name} by {"decade" if resolution == "decade" else "year"}'},
+            # Fixed ranges, so the axes do not jump between frames
+            'xaxis': {'title': {'text': ind1_name}, 'range': _padded_range(df['value1']) if len(df) else None},
+            'yaxis': {'title': {'text': ind2_name}, 'range': _padded_range(df['value2']) if len(df) else None},
+            'updatemenus': [{
+                'type': 'buttons',
+                'showactive': False,
+                'x': 0, 'y': -0.15, 'xanchor': 'left',
+                'buttons': [
+                    {'label': 'Play', 'method': 'animate', 'args': [None, {**step_args, 'fromcurrent': True}]},
+                    {'label': 'Pause', 'method': 'animate', 'args': [[None], {**step_args, 'frame': {'duration': 0}}]},
+                ],
+            }],
+            'sliders': [{
+                'x': 0.15, 'y': -0.1, 'len': 0.85,
+                'steps': [
+                    {'label': frame['name'], 'method': 'animate', 'args': [[frame['name']], step_args]}
+                    for frame in frames
+                ],
+            }],
+        },
+        'summary': {'mode': 'animation', 'resolution': resolution, 'points': len(df), 'frames': len(periods)},
+    }
+
+
+def timeseries_figure(pairs, ind1_name, ind2_name, mode, max_points=2000, resolution='auto'):
+    """Plotly figure dict for a time-series mode of a comparison"""
+    if mode == 'trajectory':
+        return trajectory_figure(pairs, ind1_name, ind2_name, max_points, resolution)
+    if mode == 'animation':
+        return animation_figure(pairs, ind1_name, ind2_name, max_points, resolution)
+    raise ValueError(f"Unknown time-series mode '{mode}'")
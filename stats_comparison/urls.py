@@ -7,4 +7,17 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('export/', views.export_to_powerbi, name='export_powerbi'),
     path('api/data/', views.powerbi_api, name='powerbi_api'),
+    path('api/metadata/', views.metadata_api, name='metadata'),
+    path('api/metadata/search/', views.metadata_search, name='metadata_search'),
+    path('api/plot/', views.plot_data, name='plot_data'),
+    path('api/aggregates/', views.aggregates_api, name='aggregates'),
+    path('api/query/', views.query_api, name='query'),
+    path('api/jobs/', views.jobs_api, name='jobs'),
+    path('api/jobs/<int:job_id>/', views.job_status, name='job'),
+    path('api/jobs/<int:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('api/jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+    path('api/correlations/', views.correlations, name='correlations'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('async/', views.index_async, name='index_async'),
+    path('async/api/data/', views.powerbi_api_async, name='powerbi_api_async'),
 ]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+# DataVersion is a single row with this primary key
+DATA_VERSION_ID = 1
+
+
+def get_data_version():
+    """Return the current data version, 0 before the first ingest"""
+    version = DataVersion.objects.filter(pk=DATA_VERSION_ID).values_list('version', flat=True).first()
+    return version or 0
+
+
+def get_data_state():
+    """Return (version, last modified time) of the data, (0, None) before the first ingest"""
+    state = DataVersion.objects.filter(pk=DATA_VERSION_ID).values_list('version', 'updated_at').first()
+    return state or (0, None)
+
+
+_state_memo = None
+_state_lock = threading.Lock()
+
+
+def cached_data_state():
+    """get_data_state() remembered in this process for DATA_VERSION_TTL seconds.
+
+    Lets hot read paths skip the version query entirely; data written by an
+    ingest in another process shows up after at most DATA_VERSION_TTL seconds.
+    """
+    global _state_memo
+    ttl = settings.DATA_VERSION_TTL
+    if ttl <= 0:
+        return get_data_state()
+    now = time.monotonic()
+    with _state_lock:
+        if _state_memo is not None and _state_memo[0] > now:
+            return _state_memo[1]
+    state = get_data_state()
+    with _state_lock:
+        _state_memo = (now + ttl, state)
+    return state
+
+
+async def aget_data_version():
+    """Async variant of get_data_version() for async views"""
+    version = await DataVersion.objects.filter(pk=DATA_VERSION_ID).values_list('version', flat=True).afirst()
+    return version or 0
+
+
+async def aget_data_state():
+    """Async variant of get_data_state() for async views"""
+    state = await DataVersion.objects.filter(pk=DATA_VERSION_ID).values_list('version', 'updated_at').afirst()
+    return state or (0, None)
+
+
+def bump_data_version():
+    """Mark ingested data as changed so cached results are no longer used"""
+    updated = DataVersion.objects.filter(pk=DATA_VERSION_ID).update(
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        DataVersion.objects.get_or_create(pk=DATA_VERSION_ID, defaults={'version': 1})
+    global _state_memo
+    with _state_lock:
+        _state_memo = None
+    return get_data_version()
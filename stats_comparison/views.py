@@ -1,25 +1,138 @@
 from django.shortcuts import render
-import wbgapi as wb
-import plotly.express as px
-import pandas as pd
-from .models import Country, Indicator, StatisticValue
+# pandas and plotly are imported by the views that draw plots, so starting a
+# worker or running a management command does not pay for them
+import numpy as np
+import hashlib
+from .models import GroupAggregate, Indicator, Job
+from .aggregates import AGGREGATE_STATISTICS, GROUP_FIELDS, pair_aggregate_values
+from .analytics import lookup_maps, parse_query, query_groups, query_rows
+from .comparison import (
+    comparison_cache_key, comparison_figure, pair_indicator_values, pair_rows, pairing_queryset
+)
+from .correlation import CORRELATION_METHODS, correlation_matrix, observation_matrix
+from .exports import (
+    EXPORT_FORMATS, ExportUnavailable, export_artifact, export_file, export_rows, stream_export_csv
+)
+from .queries import (
+    API_FIELDS, csv_line, filter_statistics, int_param, is_paged, iter_rows, iter_rows_async, json_item,
+    keyset_page, keyset_queryset, list_param, ndjson_line, page_from_rows, statistics_filters, stream_csv,
+    stream_json, stream_ndjson
+)
+from .jobs import cancel, enqueue
+from .snapshot import get_snapshot
+from .timeseries import RESOLUTIONS, TIMESERIES_MODES, timeseries_figure
+from .metadata import get_metadata, option_names, search_options
+from .instrumentation import metrics as request_metrics, span
+from .versioning import aget_data_state, aget_data_version, cached_data_state, get_data_state, get_data_version
+from asgiref.sync import sync_to_async
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import json
-from django.db.models import Q
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.urls import reverse
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-import io
 
-def index(request):
-    # Get all available indicators
-    indicators = Indicator.objects.all().order_by('name')
-    countries = Country.objects.all().order_by('name')
+def _comparison_plot_html(pairs, ind1_name, ind2_name):
+    """Render the scatter plot HTML for paired values; CPU only, no database access"""
+    import pandas as pd
+    import plotly.express as px
+
+    if len(pairs.years) == 0:
+        raise ValueError("No matching data points found for the selected combination")
+    
+    # Create pandas DataFrame for plotting
+    with span('dataframe'):
+        df = pd.DataFrame({
+            'Country': [f"{name} ({year})" for name, year in zip(pairs.country_names, pairs.years)],
+            'Value1': pairs.values1,
+            'Value2': pairs.values2
+        })
+    
+    # Create scatter plot
+    with span('px.scatter'):
+        fig = px.scatter(
+            df,
+            x='Value1',
+            y='Value2',
+            text='Country',
+            labels={
+                'Value1': ind1_name,
+                'Value2': ind2_name
+            },
+            title=f'Comparison of {ind1_name} vs {ind2_name}'
+        )
+        
+        # Customize the layout
+        fig.update_traces(
+            textposition='top center',
+            marker=dict(size=10)
+        )
+    
+    # plotly.js is loaded once by the page template rather than inlined into every plot
+    with span('to_html'):
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+def _comparison_pairs(indicator1, indicator2, selected_countries, snapshot=None):
+    """Paired values and indicator names for a comparison"""
+    if not indicator1 or not indicator2 or not selected_countries:
+        raise ValueError("Please select both indicators and at least one country")
+    
+    # Pair both indicators on (country, year) from the snapshot or a single query
+    with span('pair'):
+        pairs = pair_indicator_values(indicator1, indicator2, selected_countries, snapshot=snapshot)
     
+    if len(pairs.years) == 0:
+        raise ValueError("No matching data points found for the selected combination")
+    
+    # Get indicator names for the plot
+    if snapshot is not None:
+        names = dict(snapshot.indicators)
+    else:
+        names = dict(
+            Indicator.objects.filter(code__in=[indicator1, indicator2]).values_list('code', 'name')
+        )
+    return pairs, names[indicator1], names[indicator2]
+
+def _aggregate_pairs(indicator1, indicator2, group_type, statistic, groups=None):
+    """Paired group aggregates and indicator names; ``groups`` limits the groups, default all"""
+    if not indicator1 or not indicator2:
+        raise ValueError("Please select both indicators")
+    with span('pair'):
+        pairs = pair_aggregate_values(indicator1, indicator2, group_type, statistic, groups)
+    if len(pairs.years) == 0:
+        raise ValueError("No aggregates found for the selected indicators")
+    names = dict(Indicator.objects.filter(code__in=[indicator1, indicator2]).values_list('code', 'name'))
+    return pairs, names[indicator1], names[indicator2]
+
+def _build_comparison_plot(indicator1, indicator2, selected_countries, snapshot=None):
+    """Render the scatter plot HTML comparing two indicators"""
+    return _comparison_plot_html(*_comparison_pairs(indicator1, indicator2, selected_countries, snapshot))
+
+def _selected_options(data):
+    """Options to pre-select when the form is shown again after a POST.
+
+    The selectors load everything else lazily from metadata_search, so a GET
+    of the page needs no database queries.
+    """
+    if not data:
+        return {}
+    metadata = get_metadata(cached_data_state()[0])
+    return {
+        'selected_indicator1': option_names(metadata, 'indicator', [data.get('indicator1')]),
+        'selected_indicator2': option_names(metadata, 'indicator', [data.get('indicator2')]),
+        'selected_countries': option_names(metadata, 'country', data.getlist('countries')),
+    }
+
+def index(request):
     context = {
-        'indicators': indicators,
-        'countries': countries,
         'error': None
     }
+    cache_status = None
     
     if request.method == 'POST':
         try:
@@ -31,128 +144,675 @@ def index(request):
             if not indicator1 or not indicator2 or not selected_countries:
                 raise ValueError("Please select both indicators and at least one country")
             
-            # Get data for the selected indicators
-            data1 = StatisticValue.objects.filter(
-                indicator__code=indicator1,
-                country__code__in=selected_countries,
-                value__isnull=False  # Exclude null values
-            ).select_related('country')
-            
-            data2 = StatisticValue.objects.filter(
-                indicator__code=indicator2,
-                country__code__in=selected_countries,
-                value__isnull=False  # Exclude null values
-            ).select_related('country')
-            
-            if not data1 or not data2:
-                raise ValueError("No data available for the selected combination")
-            
-            # Create pandas DataFrame for plotting
-            data_list = []
-            for d1 in data1:
-                d2 = data2.filter(country=d1.country, year=d1.year).first()
-                if d2:
-                    data_list.append({
-                        'Country': f"{d1.country.name} ({d1.year})",
-                        'Value1': float(d1.value) if d1.value is not None else None,
-                        'Value2': float(d2.value) if d2.value is not None else None
-                    })
-            
-            if not data_list:
-                raise ValueError("No matching data points found for the selected combination")
-            
-            df = pd.DataFrame(data_list)
-            
-            # Get indicator names for the plot
-            ind1_name = Indicator.objects.get(code=indicator1).name
-            ind2_name = Indicator.objects.get(code=indicator2).name
-            
-            # Create scatter plot
-            fig = px.scatter(
-                df,
-                x='Value1',
-                y='Value2',
-                text='Country',
-                labels={
-                    'Value1': ind1_name,
-                    'Value2': ind2_name
-                },
-                title=f'Comparison of {ind1_name} vs {ind2_name}'
-            )
-            
-            # Customize the layout
-            fig.update_traces(
-                textposition='top center',
-                marker=dict(size=10)
-            )
-            
-            plot_div = fig.to_html(full_html=False)
+            # Identical selections reuse the rendered plot until new data is ingested
+            version = get_data_version()
+            cache_key = comparison_cache_key(indicator1, indicator2, selected_countries, version)
+            plot_div = cache.get(cache_key)
+            if plot_div is None:
+                cache_status = 'MISS'
+                plot_div = _build_comparison_plot(
+                    indicator1, indicator2, selected_countries, snapshot=get_snapshot(version)
+                )
+                cache.set(cache_key, plot_div, settings.COMPARISON_CACHE_TIMEOUT)
+            else:
+                cache_status = 'HIT'
             context['plot'] = plot_div
             
         except Exception as e:
             context['error'] = str(e)
+        context.update(_selected_options(request.POST))
     
-    return render(request, 'stats_comparison/index.html', context)
+    with span('template'):
+        response = render(request, 'stats_comparison/index.html', context)
+    if cache_status:
+        response['X-Cache'] = cache_status
+    return response
 
-def export_to_powerbi(request):
-    """Export data in a PowerBI-compatible format"""
+def _validators(version, last_modified, tag):
+    """(ETag, Last-Modified timestamp) of data at ``version``"""
+    # HTTP dates have whole-second precision
+    return f'"{tag}-{version}"', int(last_modified.timestamp()) if last_modified else None
+
+def _add_validators(response, etag, timestamp):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Clients may keep a copy but must revalidate it on every use
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def _not_modified_or(request, version, last_modified, make_response, tag):
+    """Answer conditional GETs with 304, otherwise build the response with validators"""
+    etag, timestamp = _validators(version, last_modified, tag)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = make_response()
+        if response.status_code != 200:
+            # Errors must not be cached under the validators of the data
+            return response
+    return _add_validators(response, etag, timestamp)
+
+async def _anot_modified_or(request, version, last_modified, make_response, tag):
+    """Async variant of _not_modified_or() for a coroutine function ``make_response``"""
+    etag, timestamp = _validators(version, last_modified, tag)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await make_response()
+        if response.status_code != 200:
+            return response
+    return _add_validators(response, etag, timestamp)
+
+def metadata_api(request):
+    """Country and indicator lists for the selectors as one small versioned document"""
+    version, last_modified = cached_data_state()
+    return _not_modified_or(
+        request, version, last_modified,
+        lambda: JsonResponse(get_metadata(version)),
+        tag='metadata'
+    )
+
+def metadata_search(request):
+    """Select2 autocomplete: type=indicator|country, q=search term, page"""
+    kind = request.GET.get('type', 'indicator')
+    if kind not in ('indicator', 'country'):
+        return JsonResponse({'error': "'type' must be 'indicator' or 'country'"}, status=400)
     try:
-        # Get all statistical values with their related data
-        stats = StatisticValue.objects.select_related('country', 'indicator').all()
-        
-        # Create a list of dictionaries for pandas DataFrame
-        data = []
-        for stat in stats:
-            data.append({
-                'Country': stat.country.name,
-                'Country Code': stat.country.code,
-                'Region': stat.country.region,
-                'Indicator': stat.indicator.name,
-                'Indicator Code': stat.indicator.code,
-                'Year': stat.year,
-                'Value': stat.value
-            })
-        
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(data)
-        
-        # Create Excel file in memory
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='WorldBank_Data', index=False)
-        
-        # Prepare the response
-        excel_buffer.seek(0)
-        response = HttpResponse(
-            excel_buffer.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        page = int_param(request.GET, 'page', default=1, minimum=1)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    version, last_modified = cached_data_state()
+    return _not_modified_or(
+        request, version, last_modified,
+        lambda: JsonResponse(search_options(get_metadata(version), kind, request.GET.get('q', ''), page)),
+        tag='metadata'
+    )
+
+def plot_data(request):
+    """Comparison plot as a compact Plotly JSON payload for the page to render
+
+    Takes the same indicator1, indicator2 and countries parameters as the
+    comparison form. The x/y vectors are sent as base64 typed arrays.
+    mode=trajectory draws a line per country over time and mode=animation a
+    frame per year; both cap the points sent at max_points by averaging
+    decades (resolution=auto|year|decade), then thinning lines with LTTB or
+    dropping evenly spaced frames.
+    aggregate=region|income compares the precomputed group aggregates
+    (statistic=weighted_mean|mean|median) of all groups, or of those given
+    as groups, instead of countries.
+    """
+    indicator1 = request.GET.get('indicator1')
+    indicator2 = request.GET.get('indicator2')
+    selected_countries = list_param(request.GET, 'countries')
+    mode = request.GET.get('mode', 'scatter')
+    resolution = request.GET.get('resolution', 'auto')
+    aggregate = request.GET.get('aggregate') or None
+    statistic = request.GET.get('statistic', 'weighted_mean')
+    try:
+        if aggregate is not None and aggregate not in GROUP_FIELDS:
+            raise ValueError("'aggregate' must be 'region' or 'income'")
+        if statistic not in AGGREGATE_STATISTICS:
+            raise ValueError("'statistic' must be 'weighted_mean', 'mean' or 'median'")
+        if mode != 'scatter' and mode not in TIMESERIES_MODES:
+            raise ValueError("'mode' must be 'scatter', 'trajectory' or 'animation'")
+        if resolution not in RESOLUTIONS:
+            raise ValueError("'resolution' must be 'auto', 'year' or 'decade'")
+        max_points = int_param(
+            request.GET, 'max_points',
+            default=settings.PLOT_MAX_POINTS, minimum=10, maximum=settings.PLOT_MAX_POINTS_LIMIT
         )
-        response['Content-Disposition'] = 'attachment; filename=worldbank_data.xlsx'
-        
-        return response
-        
-    except Exception as e:
-        return HttpResponse(f"Error exporting data: {str(e)}", status=500)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    version = get_data_version()
+    options = (mode, max_points, resolution) if mode != 'scatter' else ()
+    if aggregate is not None:
+        options += ('aggregate', aggregate, statistic, sorted(set(list_param(request.GET, 'groups'))))
+    cache_key = 'plot-json:' + comparison_cache_key(indicator1, indicator2, selected_countries, version, options)
+    payload = cache.get(cache_key)
+    cache_status = 'HIT'
+    if payload is None:
+        cache_status = 'MISS'
+        try:
+            if aggregate is not None:
+                pairs, ind1_name, ind2_name = _aggregate_pairs(
+                    indicator1, indicator2, aggregate, statistic, list_param(request.GET, 'groups')
+                )
+            else:
+                pairs, ind1_name, ind2_name = _comparison_pairs(
+                    indicator1, indicator2, selected_countries, snapshot=get_snapshot(version)
+                )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        with span('figure_json'):
+            if mode == 'scatter':
+                figure = comparison_figure(pairs, ind1_name, ind2_name)
+            else:
+                figure = timeseries_figure(pairs, ind1_name, ind2_name, mode, max_points, resolution)
+            payload = json.dumps(figure, separators=(',', ':'))
+        cache.set(cache_key, payload, settings.COMPARISON_CACHE_TIMEOUT)
+    
+    response = HttpResponse(payload, content_type='application/json')
+    response['X-Cache'] = cache_status
+    return response
+
+def export_to_powerbi(request):
+    """Export data in a PowerBI-compatible format
+
+    format=xlsx (default), csv or parquet. Rows are streamed from a database
+    iterator, so memory use does not grow with the size of the table. The
+    rendered file is kept in EXPORT_CACHE_DIR and served again until the next
+    ingest; clients revalidating with If-None-Match or If-Modified-Since get a
+    304 while the data is unchanged. With background=1 the file is rendered
+    by a background job instead, and the response describes that job; that
+    takes a POST, so links and prefetchers never queue jobs.
+    """
+    background = bool(request.GET.get('background'))
+    allowed = ['POST'] if background else ['GET', 'HEAD']
+    if request.method not in allowed:
+        return HttpResponseNotAllowed(allowed)
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f"Unsupported export format: {export_format}", status=400)
+    if background:
+        return _enqueue_response(request, Job.EXPORT, {'format': export_format})
+    
+    version, last_modified = get_data_state()
+    filename = f'worldbank_data.{export_format}'
+    
+    rows = lambda: export_rows(version)
+    
+    def make_response():
+        try:
+            if settings.EXPORT_CACHE_DIR:
+                return FileResponse(
+                    open(export_artifact(version, export_format, rows), 'rb'),
+                    as_attachment=True,
+                    filename=filename,
+                    content_type=EXPORT_FORMATS[export_format]
+                )
+            
+            if export_format == 'csv':
+                response = StreamingHttpResponse(stream_export_csv(rows()), content_type=EXPORT_FORMATS['csv'])
+                response['Content-Disposition'] = f'attachment; filename={filename}'
+                return response
+            
+            # xlsx and parquet need a seekable file; write to a temporary file and stream it back
+            return FileResponse(
+                export_file(rows(), export_format),
+                as_attachment=True,
+                filename=filename,
+                content_type=EXPORT_FORMATS[export_format]
+            )
+            
+        except ExportUnavailable as e:
+            return HttpResponse(str(e), status=501)
+        except Exception as e:
+            return HttpResponse(f"Error exporting data: {str(e)}", status=500)
+    
+    return _not_modified_or(request, version, last_modified, make_response, tag=f'export-{export_format}')
 
 @api_view(['GET'])
 def powerbi_api(request):
-    """REST API endpoint for PowerBI Direct Query"""
+    """REST API endpoint for PowerBI Direct Query
+
+    Filters: indicator, country, region (repeatable or comma-separated),
+    start_year, end_year. By default every matching row is returned as one
+    JSON list, streamed. With page_size and/or cursor the response is a
+    keyset page instead; stream=ndjson or stream=csv streams the rows in
+    those formats. Full lists and streams read the snapshot when it is
+    current. Responses carry an ETag and Last-Modified of the ingested
+    data, so polling clients get a 304 until the next ingest.
+    """
+    version, last_modified = get_data_state()
+    
+    def all_rows(stats):
+        # Whole result sets come from the snapshot when there is one; pages are indexed queries
+        snapshot = get_snapshot(version)
+        if snapshot is not None:
+            filters = statistics_filters(request.query_params)
+            return snapshot.iter_rows(settings.API_STREAM_CHUNK_SIZE, **filters)
+        return iter_rows(stats, chunk_size=settings.API_STREAM_CHUNK_SIZE)
+    
+    def make_response():
+        try:
+            stats = filter_statistics(request.query_params)
+            stream = request.query_params.get('stream')
+            
+            if stream in ('ndjson', 'csv'):
+                rows = all_rows(stats)
+                if stream == 'csv':
+                    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+                    response['Content-Disposition'] = 'attachment; filename=worldbank_data.csv'
+                else:
+                    response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+                return response
+            if stream:
+                raise ValueError("'stream' must be 'ndjson' or 'csv'")
+            if not is_paged(request.query_params):
+                return StreamingHttpResponse(stream_json(all_rows(stats)), content_type='application/json')
+            
+            page_size = int_param(
+                request.query_params, 'page_size',
+                default=settings.API_PAGE_SIZE, minimum=1, maximum=settings.API_MAX_PAGE_SIZE
+            )
+            data, next_cursor = keyset_page(stats, request.query_params.get('cursor'), page_size)
+            
+            next_url = None
+            if next_cursor:
+                params = request.query_params.copy()
+                params['cursor'] = next_cursor
+                next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+            
+            return Response({
+                'results': data,
+                'next_cursor': next_cursor,
+                'next': next_url,
+            })
+            
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+    
+    return _not_modified_or(request, version, last_modified, make_response, tag='data')
+
+
+def _job_payload(request, job):
+    url = lambda name: request.build_absolute_uri(reverse(f'stats_comparison:{name}', args=[job.pk]))
+    timestamp = lambda value: value.isoformat() if value else None
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'created_at': timestamp(job.created_at),
+        'started_at': timestamp(job.started_at),
+        'finished_at': timestamp(job.finished_at),
+        'status_url': url('job'),
+        'cancel_url': url('cancel_job') if job.status not in Job.FINISHED else None,
+        'download_url': url('job_download') if job.status == Job.SUCCEEDED and job.result_path else None,
+    }
+
+
+def _enqueue_response(request, kind, params):
+    """Queue a job and describe it: 202 while it is pending, 200 if an existing result was reused"""
     try:
-        stats = StatisticValue.objects.select_related('country', 'indicator').all()
-        
-        data = []
-        for stat in stats:
-            data.append({
-                'country': stat.country.name,
-                'country_code': stat.country.code,
-                'region': stat.country.region,
-                'indicator': stat.indicator.name,
-                'indicator_code': stat.indicator.code,
-                'year': stat.year,
-                'value': stat.value
+        job = enqueue(kind, params, owner=_job_owner(request))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    payload = _job_payload(request, job)
+    response = JsonResponse(payload, status=200 if job.status in Job.FINISHED else 202)
+    response['Location'] = payload['status_url']
+    return response
+
+
+def _job_owner(request, create=True):
+    """Who a request queues jobs for: the user if logged in, else the session.
+
+    Anonymous clients get a session if they have none, unless ``create`` is
+    false, in which case None is returned.
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if not request.session.session_key:
+        if not create:
+            return None
+        request.session.save()
+    return f'session:{request.session.session_key}'
+
+
+def _visible_job(request, job_id):
+    """The job with ``job_id``, or None if it does not exist or the client may not see it
+
+    Staff see every job; anyone else only the export jobs they queued.
+    """
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None or request.user.is_staff:
+        return job
+    # Fetch jobs change the database, so only staff may start or follow them
+    if job.kind == Job.FETCH or job.owner != _job_owner(request, create=False):
+        return None
+    return job
+
+
+@api_view(['POST'])
+def jobs_api(request):
+    """Queue a background job and return its id with status and download URLs
+
+    kind=export with format=xlsx|csv|parquet, or kind=fetch (staff only)
+    with start_year, end_year and incremental. The job belongs to the user,
+    or to the session of anonymous clients; an unfinished job of theirs
+    with the same parameters is returned instead of a new one.
+    """
+    kind = request.data.get('kind')
+    if kind == Job.FETCH and not request.user.is_staff:
+        return JsonResponse({'error': 'Only staff may start fetch jobs'}, status=403)
+    params = {key: value for key, value in request.data.items() if key != 'kind'}
+    return _enqueue_response(request, kind, params)
+
+
+def job_status(request, job_id):
+    """Status and progress of a background job; poll until it has finished"""
+    job = _visible_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse(_job_payload(request, job))
+
+
+@api_view(['POST'])
+def cancel_job(request, job_id):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    job = _visible_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse(_job_payload(request, cancel(job)))
+
+
+def job_download(request, job_id):
+    """The file produced by a finished job: the export, or the log of a fetch"""
+    job = _visible_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status != Job.SUCCEEDED or not job.result_path:
+        return JsonResponse({'error': f'Job {job.pk} has no result to download ({job.status})'}, status=409)
+    if job.kind == Job.EXPORT:
+        export_format = job.params['format']
+        filename, content_type = f'worldbank_data.{export_format}', EXPORT_FORMATS[export_format]
+    else:
+        filename, content_type = f'job-{job.pk}.log', 'text/plain'
+    try:
+        file = open(job.result_path, 'rb')
+    except OSError:
+        # Export files are replaced by the next ingest's; queue a new export for the current data
+        return JsonResponse({'error': 'The result of this job is no longer available'}, status=410)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+
+
+def aggregates_api(request):
+    """Precomputed regional or income-group aggregates
+
+    Parameters: indicator (required; repeatable or comma-separated),
+    group_type=region|income, group (repeatable or comma-separated),
+    start_year, end_year.
+    """
+    indicators = list_param(request.GET, 'indicator')
+    group_type = request.GET.get('group_type', GroupAggregate.REGION)
+    try:
+        if not indicators:
+            raise ValueError("'indicator' is required")
+        if group_type not in GROUP_FIELDS:
+            raise ValueError("'group_type' must be 'region' or 'income'")
+        start_year = int_param(request.GET, 'start_year')
+        end_year = int_param(request.GET, 'end_year')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    def make_response():
+        queryset = GroupAggregate.objects.filter(indicator_id__in=indicators, group_type=group_type)
+        groups = list_param(request.GET, 'group')
+        if groups:
+            queryset = queryset.filter(group__in=groups)
+        if start_year is not None:
+            queryset = queryset.filter(year__gte=start_year)
+        if end_year is not None:
+            queryset = queryset.filter(year__lte=end_year)
+        fields = ('indicator_id', 'group', 'year', 'count', 'weighted_count', 'mean', 'median', 'weighted_mean')
+        rows = queryset.order_by('indicator_id', 'group', 'year').values_list(*fields)
+        return JsonResponse({
+            'group_type': group_type,
+            'results': [dict(zip(('indicator', *fields[1:]), row)) for row in rows],
+        })
+    
+    version, last_modified = get_data_state()
+    return _not_modified_or(request, version, last_modified, make_response, tag='aggregates')
+
+
+def query_api(request):
+    """Filtered, projected or aggregated statistic values
+
+    Filters: indicator, country, region (repeatable or comma-separated),
+    start_year, end_year. Plain rows are keyset-paginated with page_size
+    and cursor and can be limited to the columns in ``fields``. With
+    agg=mean|sum|min|max|count|latest the database reduces the rows per
+    group_by=country|region|indicator|year instead.
+    """
+    try:
+        spec = parse_query(
+            request.GET, max_page_size=settings.API_MAX_PAGE_SIZE, default_page_size=settings.API_PAGE_SIZE
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    version, last_modified = cached_data_state()
+    
+    def make_response():
+        maps = lookup_maps(get_metadata(version))
+        if not spec['aggregates']:
+            results, next_cursor = query_rows(spec, maps)
+            return JsonResponse({'results': results, 'next_cursor': next_cursor})
+        try:
+            results = query_groups(spec, maps, max_groups=settings.QUERY_MAX_GROUPS)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'group_by': spec['group_by'], 'aggregates': spec['aggregates'], 'results': results})
+    
+    return _not_modified_or(request, version, last_modified, make_response, tag='query')
+
+
+def correlations(request):
+    """Pairwise correlation matrix across all indicators
+
+    Parameters: country (repeatable or comma-separated, default all),
+    start_year, end_year, method=pearson|spearman, min_periods and
+    format=json|html (heatmap).
+    """
+    try:
+        country_codes = sorted(set(list_param(request.GET, 'country')))
+        start_year = int_param(request.GET, 'start_year')
+        end_year = int_param(request.GET, 'end_year')
+        method = request.GET.get('method', 'pearson')
+        min_periods = int_param(request.GET, 'min_periods', default=3, minimum=2)
+        output = request.GET.get('format', 'json')
+        if method not in CORRELATION_METHODS:
+            raise ValueError("'method' must be 'pearson' or 'spearman'")
+        if output not in ('json', 'html'):
+            raise ValueError("'format' must be 'json' or 'html'")
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    version = get_data_version()
+    selection = json.dumps([country_codes, start_year, end_year, method, min_periods])
+    cache_key = f'correlations:v{version}:{hashlib.sha256(selection.encode()).hexdigest()}'
+    result = cache.get(cache_key)
+    cache_status = 'HIT'
+    if result is None:
+        cache_status = 'MISS'
+        snapshot = get_snapshot(version)
+        codes, matrix = observation_matrix(country_codes, start_year, end_year, snapshot=snapshot)
+        values, counts = correlation_matrix(matrix, method=method, min_periods=min_periods)
+        if snapshot is not None:
+            names = dict(snapshot.indicators)
+        else:
+            names = dict(Indicator.objects.values_list('code', 'name'))
+        result = {
+            'method': method,
+            'indicators': [{'code': code, 'name': names.get(code, code)} for code in codes],
+            'matrix': [[None if np.isnan(v) else round(float(v), 6) for v in row] for row in values],
+            'counts': counts.tolist(),
+        }
+        cache.set(cache_key, result, settings.COMPARISON_CACHE_TIMEOUT)
+    
+    if output == 'html':
+        import plotly.express as px
+
+        labels = [indicator['name'] for indicator in result['indicators']]
+        fig = px.imshow(
+            np.array(result['matrix'], dtype=float),
+            x=labels,
+            y=labels,
+            zmin=-1,
+            zmax=1,
+            color_continuous_scale='RdBu',
+            title=f"{result['method'].title()} correlation between indicators"
+        )
+        response = HttpResponse(fig.to_html(full_html=True, include_plotlyjs='cdn'))
+    else:
+        response = JsonResponse(result)
+    response['X-Cache'] = cache_status
+    return response
+
+
+def metrics(request):
+    """Request, query and span metrics of this process, plus the last ingest, in Prometheus text format
+
+    Only answered for clients in METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=404)
+    body = request_metrics.render()
+    if settings.INGEST_METRICS_FILE:
+        try:
+            with open(settings.INGEST_METRICS_FILE) as f:
+                body += f.read()
+        except OSError:
+            pass
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Bounded pool for the pandas/Plotly work of async views, so CPU-bound
+# rendering never runs on the event loop
+_render_executor = ThreadPoolExecutor(
+    max_workers=settings.RENDER_EXECUTOR_WORKERS,
+    thread_name_prefix='render'
+)
+
+async def _run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_render_executor, func, *args)
+
+async def index_async(request):
+    """Async variant of index for ASGI deployments"""
+    context = {
+        'error': None
+    }
+    cache_status = None
+    
+    if request.method == 'POST':
+        try:
+            indicator1 = request.POST.get('indicator1')
+            indicator2 = request.POST.get('indicator2')
+            selected_countries = request.POST.getlist('countries')
+            
+            if not indicator1 or not indicator2 or not selected_countries:
+                raise ValueError("Please select both indicators and at least one country")
+            
+            version = await aget_data_version()
+            cache_key = comparison_cache_key(indicator1, indicator2, selected_countries, version)
+            plot_div = await cache.aget(cache_key)
+            if plot_div is None:
+                cache_status = 'MISS'
+                snapshot = await _run_in_executor(get_snapshot, version)
+                if snapshot is not None:
+                    pairs = await _run_in_executor(
+                        pair_indicator_values, indicator1, indicator2, selected_countries, snapshot
+                    )
+                    names = dict(snapshot.indicators)
+                else:
+                    rows = [row async for row in pairing_queryset(indicator1, indicator2, selected_countries)]
+                    pairs = await _run_in_executor(pair_rows, rows, indicator1, indicator2)
+                    names = {
+                        code: name async for code, name in
+                        Indicator.objects.filter(code__in=[indicator1, indicator2]).values_list('code', 'name')
+                    }
+                if len(pairs.years) == 0:
+                    raise ValueError("No matching data points found for the selected combination")
+                plot_div = await _run_in_executor(
+                    _comparison_plot_html, pairs, names[indicator1], names[indicator2]
+                )
+                await cache.aset(cache_key, plot_div, settings.COMPARISON_CACHE_TIMEOUT)
+            else:
+                cache_status = 'HIT'
+            context['plot'] = plot_div
+            
+        except Exception as e:
+            context['error'] = str(e)
+        context.update(await sync_to_async(_selected_options)(request.POST))
+    
+    response = render(request, 'stats_comparison/index.html', context)
+    if cache_status:
+        response['X-Cache'] = cache_status
+    return response
+
+async def _astream_lines(rows, format_row, header=None):
+    """Format an async row iterator line by line for StreamingHttpResponse"""
+    if header is not None:
+        yield header
+    async for row in rows:
+        yield format_row(row)
+
+async def _astream_json(rows):
+    """Async variant of queries.stream_json()"""
+    yield '['
+    index = 0
+    async for row in rows:
+        yield json_item(row, index)
+        index += 1
+    yield ']'
+
+async def powerbi_api_async(request):
+    """Async variant of powerbi_api for ASGI deployments; same parameters, results and validators"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    version, last_modified = await aget_data_state()
+    
+    async def make_response():
+        try:
+            stats = filter_statistics(request.GET)
+            stream = request.GET.get('stream')
+            
+            if stream in ('ndjson', 'csv'):
+                rows = iter_rows_async(stats, chunk_size=settings.API_STREAM_CHUNK_SIZE)
+                if stream == 'csv':
+                    response = StreamingHttpResponse(
+                        _astream_lines(rows, csv_line, header=csv_line(API_FIELDS)),
+                        content_type='text/csv'
+                    )
+                    response['Content-Disposition'] = 'attachment; filename=worldbank_data.csv'
+                else:
+                    response = StreamingHttpResponse(
+                        _astream_lines(rows, ndjson_line),
+                        content_type='application/x-ndjson'
+                    )
+                return response
+            if stream:
+                raise ValueError("'stream' must be 'ndjson' or 'csv'")
+            if not is_paged(request.GET):
+                rows = iter_rows_async(stats, chunk_size=settings.API_STREAM_CHUNK_SIZE)
+                return StreamingHttpResponse(_astream_json(rows), content_type='application/json')
+            
+            page_size = int_param(
+                request.GET, 'page_size',
+                default=settings.API_PAGE_SIZE, minimum=1, maximum=settings.API_MAX_PAGE_SIZE
+            )
+            queryset = keyset_queryset(stats, request.GET.get('cursor'), page_size)
+            rows = [row async for row in queryset]
+            data, next_cursor = page_from_rows(rows, page_size)
+            
+            next_url = None
+            if next_cursor:
+                params = request.GET.copy()
+                params['cursor'] = next_cursor
+                next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+            
+            return JsonResponse({
+                'results': data,
+                'next_cursor': next_cursor,
+                'next': next_url,
             })
             
-        return Response(data)
-        
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return await _anot_modified_or(request, version, last_modified, make_response, tag='data')
@@ -0,0 +1,28 @@
+"""Optional warm-up of what the views load lazily, for servers that fork workers.
+
+Under ``gunicorn --preload`` the WSGI module is imported once in the master
+process. Whatever it loads is then shared copy-on-write by every worker, so
+no worker spends its first plot request importing pandas and Plotly.
+Enabled by PRELOAD_MODULES.
+"""
+import importlib
+
+# Modules the plotting and analytics views import on first use
+PRELOAD_IMPORTS = ('numpy', 'pandas', 'plotly.express', 'plotly.io')
+
+
+def preload():
+    """Import the plotting stack, build a throwaway figure and map the snapshot, which is returned.
+
+    Plotly loads its trace validators on the first figure, so one is built
+    here too. The database is not touched: connections must not be opened
+    before workers fork.
+    """
+    from .snapshot import preload_snapshot
+
+    for module in PRELOAD_IMPORTS:
+        importlib.import_module(module)
+    import plotly.express as px
+
+    px.scatter(x=[0.0], y=[0.0], text=['']).to_json()
+    return preload_snapshot()
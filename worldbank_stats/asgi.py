@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'worldbank_stats.settings')
 
 application = get_asgi_application()
+
+if settings.PRELOAD_MODULES:
+    from stats_comparison.warmup import preload
+
+    preload()
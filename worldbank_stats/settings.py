@@ -10,11 +10,17 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Deployment settings come from the environment or a .env file next to manage.py
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -41,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'stats_comparison.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +81,130 @@ WSGI_APPLICATION = 'worldbank_stats.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=postgresql selects PostgreSQL (needs the psycopg package);
+# anything else uses the SQLite file DB_NAME
+if os.environ.get('DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'worldbank_stats'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # Keep connections open across requests instead of reconnecting each time
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a connection waits for the write lock before failing
+                'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+
+# Pragmas run on every new SQLite connection: WAL so reads are not blocked
+# by the ingest, fewer fsyncs (safe with WAL) and memory-mapped reads
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'normal'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'worldbank-stats',
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
     }
 }
 
+# Seconds a rendered comparison plot stays cached; entries are also
+# invalidated whenever fetch_worldbank_data bumps the data version
+COMPARISON_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a process may reuse the data version before checking the database
+# again; used by the selector metadata so repeat page loads cost no queries
+DATA_VERSION_TTL = 5
+
+# Rows per page of the PowerBI API, and rows fetched per database round
+# trip when the API streams NDJSON/CSV
+API_PAGE_SIZE = 1000
+API_MAX_PAGE_SIZE = 10000
+API_STREAM_CHUNK_SIZE = 2000
+
+# Most groups an aggregated /api/query/ may return; larger results are refused
+# with a request to narrow the filters
+QUERY_MAX_GROUPS = 50000
+
+# Points sent to the browser by the time-series plot modes by default, and
+# the most a client may ask for with max_points
+PLOT_MAX_POINTS = 2000
+PLOT_MAX_POINTS_LIMIT = 20000
+
+# Threads available to async views for pandas/Plotly rendering
+RENDER_EXECUTOR_WORKERS = 4
+
+# Directory of the compact columnar snapshot rebuilt by fetch_worldbank_data
+# and memory-mapped by every worker; set to None to always read from the database
+SNAPSHOT_DIR = BASE_DIR / 'snapshot'
+
+# Directory of rendered export files, reused until the next ingest; set to
+# None to render every export on request
+EXPORT_CACHE_DIR = BASE_DIR / 'exports'
+
+# On-disk cache of World Bank API responses used by fetch_worldbank_data:
+# responses are reused for WB_CACHE_TTL seconds, and the least recently used
+# ones are evicted beyond WB_CACHE_MAX_BYTES. Set WB_CACHE_DIR to None to
+# always call the API.
+WB_CACHE_DIR = BASE_DIR / 'wbcache'
+WB_CACHE_TTL = 12 * 60 * 60
+WB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# JSON file of the series, topics and searches fetch_worldbank_data ingests
+# (format in stats_comparison/catalog.py); None fetches the built-in list of
+# 18 indicators. Data and metadata are requested WB_SERIES_PER_REQUEST
+# series at a time.
+INDICATOR_CATALOG = os.environ.get('INDICATOR_CATALOG') or None
+WB_SERIES_PER_REQUEST = 20
+
+# Clients allowed to read /metrics/ (Prometheus text format)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Import pandas/Plotly and map the snapshot when the WSGI/ASGI module loads,
+# so workers forked by gunicorn --preload share them; off by default to keep
+# development servers and management commands quick to start
+PRELOAD_MODULES = os.environ.get('PRELOAD_MODULES', '').lower() in ('1', 'true', 'yes')
+
+# Add a Server-Timing header with query and span timings to app responses
+SERVER_TIMING = DEBUG
+
+# Phase timings of the last fetch_worldbank_data run, served by /metrics/
+INGEST_METRICS_FILE = BASE_DIR / 'ingest_metrics.prom'
+
+# Background jobs run by the run_jobs command: the most jobs of each kind
+# running at once across all workers, the default threads and poll interval
+# of a worker, how long a running job may go without a heartbeat before it
+# is marked failed, and where fetch job logs are kept (None to discard them).
+# Export jobs store their files in EXPORT_CACHE_DIR.
+JOB_CONCURRENCY = {'export': 2, 'fetch': 1}
+JOB_WORKER_THREADS = 2
+JOB_POLL_INTERVAL = 2.0
+JOB_STALE_AFTER = 10 * 60
+JOB_RESULTS_DIR = BASE_DIR / 'jobs'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +242,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Where collectstatic gathers static files for the web server in production
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    # plotly.js from the installed plotly package, so it matches the figures plotly.py builds
+    'stats_comparison.staticfiles.PlotlyJsFinder',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
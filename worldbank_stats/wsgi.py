@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'worldbank_stats.settings')
 
 application = get_wsgi_application()
+
+if settings.PRELOAD_MODULES:
+    from stats_comparison.warmup import preload
+
+    preload()